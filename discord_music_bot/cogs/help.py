@@ -2,6 +2,8 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
+from source.source import audio_nodes
+
 
 class HelpCog(commands.Cog):
     """
@@ -39,6 +41,7 @@ class HelpCog(commands.Cog):
                 "`/resume` - 再開\n"
                 "`/skip` - 次の曲にスキップ\n"
                 "`/stop` - 再生停止・ボイスチャンネルから退出\n"
+                "`/seek <時間>` - 再生位置を移動（例: 1:30）\n"
             ),
             inline=False
         )
@@ -58,6 +61,8 @@ class HelpCog(commands.Cog):
             name="🔧 便利機能",
             value=(
                 "`/alarm <秒数> <URL>` - 指定時間後に音楽でアラーム\n"
+                "`/alarmlist` - 設定中のアラームを表示\n"
+                "`/alarmcancel [ID]` - アラームを取り消し\n"
                 "`/volume <値>` - ボリューム調整（0.0-2.0）\n"
                 "`/nowplaying` - 現在再生中の曲情報を表示\n"
             ),
@@ -137,12 +142,45 @@ class HelpCog(commands.Cog):
             inline=True
         )
         
+        music = self.bot.get_cog("MusicCog")
+        if music is not None:
+            report = music.memory_report()
+            embed.add_field(
+                name="💾 サーバー状態",
+                value=f"保持中 {report['live']}個 / 破棄済み {report['evicted']}個",
+                inline=True
+            )
+            reaped = music.reaper_stats()
+            embed.add_field(
+                name="🔌 自動切断",
+                value=f"無人 {reaped['alone']}回 / 一時停止 {reaped['paused']}回",
+                inline=True
+            )
+        
         embed.add_field(
             name="📡 レイテンシ",
             value=f"{round(self.bot.latency * 1000, 2)}ms",
             inline=True
         )
         
+        if audio_nodes is not None:
+            nodes = audio_nodes.stats()
+            embed.add_field(
+                name="🎚️ 音声ノード",
+                value=f"正常 {sum(1 for node in nodes if node['healthy'])} / {len(nodes)}個・"
+                      f"再生中 {sum(node['streams'] for node in nodes)}",
+                inline=True
+            )
+        
+        ping = self.bot.get_cog("PingCog")
+        if ping is not None:
+            shard_id = interaction.guild.shard_id if interaction.guild else None
+            embed.add_field(
+                name=f"🧩 シャード（{self.bot.shard_count or 1}個・合計 {ping.event_rate.total():.1f} events/s）",
+                value=f"```{ping.shard_lines(shard_id)}```",
+                inline=False
+            )
+        
         embed.add_field(
             name="🐍 Python",
             value="discord.py",
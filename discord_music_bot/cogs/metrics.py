@@ -0,0 +1,356 @@
+import ipaddress
+import logging
+import math
+import os
+import time
+from typing import Any, Dict
+
+from aiohttp import web
+from discord.ext import commands
+
+from source.source import (
+    audio_nodes,
+    disk_cache,
+    extract_stats,
+    extraction_executor,
+    ffmpeg_process_count,
+    first_frame_stats,
+    metadata_cache,
+    seek_stats,
+    ytdl_pool,
+)
+from utils.loopmonitor import LoopMonitor
+from utils.metrics import CONTENT_TYPE, MetricsWriter
+from utils.shards import iter_shards
+
+
+_log = logging.getLogger("music")
+
+# メトリクスを公開するアドレスとポート（0で無効・既定はローカルのみ。Dockerではdocker-compose.ymlで0.0.0.0を指定する）
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8080"))
+
+# クラスターモードでは子プロセスごとにポートをずらす
+CLUSTER_ID = int(os.getenv("CLUSTER_ID", "0"))
+
+# ヘルスチェックの閾値（秒）
+HEALTH_MAX_LOOP_LAG = float(os.getenv("HEALTH_MAX_LOOP_LAG", "2"))
+HEALTH_MAX_LATENCY = float(os.getenv("HEALTH_MAX_LATENCY", "5"))
+HEALTH_GATEWAY_GRACE = float(os.getenv("HEALTH_GATEWAY_GRACE", "120"))
+HEALTH_STARTUP_GRACE = float(os.getenv("HEALTH_STARTUP_GRACE", "600"))
+# 止めても次の曲に進まないサーバーがこの数に達したら、再生の処理自体が止まっているとみなす
+HEALTH_MAX_WEDGED_PLAYERS = int(os.getenv("HEALTH_MAX_WEDGED_PLAYERS", "3"))
+
+# イベントループの停止を検出してスタックを記録するか（/debug/loop で実行中に切り替えられる）と、記録する停止の長さ（秒）
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_MONITOR_THRESHOLD = float(os.getenv("LOOP_MONITOR_THRESHOLD", "0.25"))
+
+# /debug/* にアクセスできる送信元（カンマ区切りのアドレス・ネットワーク）
+# Dockerでホストから操作する場合はブリッジのネットワーク（例: 172.16.0.0/12）を追加する
+DEBUG_ALLOWED_SOURCES = [
+    ipaddress.ip_network(source.strip(), strict=False)
+    for source in os.getenv("DEBUG_ALLOWED_SOURCES", "127.0.0.1,::1").split(",")
+    if source.strip()
+]
+
+
+class MetricsCog(commands.Cog):
+    """
+    Prometheus形式のメトリクスとヘルスチェックをHTTPで公開するコグ
+    /healthz: 止まっていて再起動が必要な状態でないか（イベントループ・ゲートウェイの切断・再生の処理の停止）
+    /readyz: 処理を受け付けられるか（ゲートウェイ・ハートビート・イベントループ・抽出キュー・再生の停止）
+    /debug/loop: イベントループの停止の記録（POSTで検出を切り替え、DEBUG_ALLOWED_SOURCESからのみ）
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.loop_monitor = LoopMonitor(
+            threshold=LOOP_MONITOR_THRESHOLD, enabled=LOOP_MONITOR_ENABLED
+        )
+        self.app = web.Application()
+        self.app.router.add_get("/metrics", self.handle_metrics)
+        self.app.router.add_get("/healthz", self.handle_healthz)
+        self.app.router.add_get("/readyz", self.handle_readyz)
+        self.app.router.add_get("/debug/loop", self.handle_loop_status)
+        self.app.router.add_post("/debug/loop", self.handle_loop_toggle)
+        self._runner: web.AppRunner = None
+        self.started_at = time.monotonic()
+        self.disconnected_since: Dict[int, float] = {}  # シャードが切断された時刻
+
+    async def cog_load(self):
+        """コグ読み込み時にイベントループの計測とHTTPサーバーを開始"""
+        self.loop_monitor.start()
+        if METRICS_PORT <= 0:
+            return
+
+        runner = web.AppRunner(self.app, access_log=None)
+        await runner.setup()
+        port = METRICS_PORT + CLUSTER_ID
+        try:
+            await web.TCPSite(runner, METRICS_HOST, port).start()
+        except OSError as e:
+            _log.error(f"Could not start metrics server on {METRICS_HOST}:{port}: {e}")
+            await runner.cleanup()
+            return
+        self._runner = runner
+        _log.info(f"Metrics server listening on {METRICS_HOST}:{port}")
+
+    async def cog_unload(self):
+        """コグ解除時にHTTPサーバーを停止"""
+        self.loop_monitor.stop()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @commands.Cog.listener()
+    async def on_shard_disconnect(self, shard_id: int):
+        self.disconnected_since.setdefault(shard_id, time.monotonic())
+
+    @commands.Cog.listener()
+    async def on_shard_connect(self, shard_id: int):
+        self.disconnected_since.pop(shard_id, None)
+
+    @commands.Cog.listener()
+    async def on_shard_resumed(self, shard_id: int):
+        self.disconnected_since.pop(shard_id, None)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.collect().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def handle_healthz(self, request: web.Request) -> web.Response:
+        return self._health_response(self.check_health())
+
+    async def handle_readyz(self, request: web.Request) -> web.Response:
+        return self._health_response(self.check_ready())
+
+    @staticmethod
+    def _check_debug_access(request: web.Request):
+        """/debug/* は許可された送信元からのみ受け付ける（スタックなど内部の情報を含むため）"""
+        try:
+            address = ipaddress.ip_address(request.remote or "")
+        except ValueError:
+            raise web.HTTPForbidden()
+        if not any(address in network for network in DEBUG_ALLOWED_SOURCES):
+            raise web.HTTPForbidden()
+
+    async def handle_loop_status(self, request: web.Request) -> web.Response:
+        self._check_debug_access(request)
+        return web.json_response(self.loop_monitor.status())
+
+    async def handle_loop_toggle(self, request: web.Request) -> web.Response:
+        """?enabled=true|false で停止の検出を切り替える"""
+        self._check_debug_access(request)
+        value = request.query.get("enabled", "").lower()
+        if value not in ("true", "false"):
+            raise web.HTTPBadRequest(text="enabled=true|false")
+        self.loop_monitor.set_enabled(value == "true")
+        return web.json_response(self.loop_monitor.status())
+
+    @staticmethod
+    def _health_response(checks: Dict[str, Dict[str, Any]]) -> web.Response:
+        ok = all(check["ok"] for check in checks.values())
+        return web.json_response(
+            {"status": "ok" if ok else "fail", "checks": checks},
+            status=200 if ok else 503,
+        )
+
+    def _check_loop(self) -> Dict[str, Any]:
+        """イベントループの遅れが閾値以内か"""
+        lag = self.loop_monitor.last
+        return {"ok": lag < HEALTH_MAX_LOOP_LAG, "lag": round(lag, 3)}
+
+    def check_health(self) -> Dict[str, Dict[str, Any]]:
+        """再起動が必要な状態でないかの確認"""
+        now = time.monotonic()
+        checks = {"event_loop": self._check_loop()}
+
+        # discord.pyが再接続するため、短い切断は問題にしない
+        if not self.bot.is_ready():
+            uptime = now - self.started_at
+            checks["gateway"] = {"ok": uptime < HEALTH_STARTUP_GRACE, "ready": False, "uptime": round(uptime)}
+        else:
+            disconnected = {
+                shard_id: round(now - since) for shard_id, since in self.disconnected_since.items()
+            }
+            checks["gateway"] = {
+                "ok": all(seconds < HEALTH_GATEWAY_GRACE for seconds in disconnected.values()),
+                "ready": True,
+                "disconnected": disconnected,
+            }
+
+        # 個別のサーバーの停止はstall_loopが曲を止めて回復させるため、
+        # 止めても進まないサーバーが複数ある（play_next自体が止まっている）場合のみ失敗とする
+        music = self.bot.get_cog("MusicCog")
+        if music is not None:
+            report = music.playback_report()
+            checks["players"] = {
+                "ok": report["wedged"] < HEALTH_MAX_WEDGED_PLAYERS,
+                "stalled": report["stalled"],
+                "wedged": report["wedged"],
+            }
+        return checks
+
+    def check_ready(self) -> Dict[str, Dict[str, Any]]:
+        """処理を受け付けられる状態かの確認"""
+        shards = iter_shards(self.bot)
+        closed = [
+            shard_id for shard_id, info in getattr(self.bot, "shards", {}).items() if info.is_closed()
+        ]
+        latencies: Dict[int, float] = {
+            shard_id: latency for shard_id, _, latency in shards
+        }
+        slow = [
+            shard_id for shard_id, latency in latencies.items()
+            if not math.isfinite(latency) or latency >= HEALTH_MAX_LATENCY
+        ]
+
+        executor = extraction_executor.stats()
+        checks = {
+            "gateway": {"ok": self.bot.is_ready() and not closed, "closed": closed},
+            "heartbeat": {
+                "ok": not slow,
+                "max_latency": round(max(
+                    (latency for latency in latencies.values() if math.isfinite(latency)), default=0.0
+                ), 3),
+                "slow": slow,
+            },
+            "event_loop": self._check_loop(),
+            "executor": {
+                "ok": executor["pending"] < extraction_executor.max_queue,
+                "pending": executor["pending"],
+                "max_queue": extraction_executor.max_queue,
+            },
+        }
+
+        music = self.bot.get_cog("MusicCog")
+        if music is not None:
+            report = music.playback_report()
+            checks["players"] = {"ok": not report["wedged"], "stalled": report["stalled"], "wedged": report["wedged"]}
+        return checks
+
+    def collect(self) -> str:
+        """全てのメトリクスを書き出す"""
+        metrics = MetricsWriter()
+        self._collect_voice(metrics)
+        self._collect_extraction(metrics)
+        self._collect_caches(metrics)
+        self._collect_gateway(metrics)
+        return metrics.render()
+
+    def _collect_voice(self, metrics: MetricsWriter):
+        """ボイス接続・キュー・再生"""
+        voice_clients = self.bot.voice_clients
+        metrics.gauge("voice_clients", len(voice_clients), "接続中のボイスチャンネル数")
+        metrics.gauge(
+            "voice_playing",
+            sum(1 for vc in voice_clients if vc.is_playing()),
+            "再生中のボイスチャンネル数",
+        )
+        metrics.gauge("ffmpeg_processes", ffmpeg_process_count(), "起動中のFFmpegプロセス数")
+
+        music = self.bot.get_cog("MusicCog")
+        if music is not None:
+            report = music.memory_report()
+            metrics.gauge("guild_states", report["live"], "保持しているサーバー状態の数")
+            metrics.gauge("queue_items", report["queued_items"], "全サーバーのキューの曲数の合計")
+            metrics.gauge(
+                "queue_items_max",
+                max((state.queue.asize() for state in list(music.guild_states.values())), default=0),
+                "最も長いキューの曲数",
+            )
+            metrics.counter("guild_states_created", report["created"], "作成したサーバー状態の数")
+            metrics.counter("guild_states_evicted", report["evicted"], "破棄したサーバー状態の数")
+            playback = music.playback_report()
+            metrics.gauge("players_stalled", playback["stalled"], "再生位置が進んでいないサーバーの数")
+            metrics.gauge("players_wedged", playback["wedged"], "曲を止めても次に進まないサーバーの数")
+            metrics.counter("player_stall_recoveries", playback["recoveries"], "再生が止まった曲を止めて次に進めた回数")
+            for reason, count in music.reaper_stats().items():
+                metrics.counter("voice_reaped", count, "自動切断した接続の数", {"reason": reason})
+            metrics.gauge("alarms_pending", len(music.alarms), "設定中のアラームの数")
+            metrics.counter("alarms_fired", music.alarms.fired, "再生したアラームの数")
+
+            updater = music.updater.stats()
+            metrics.gauge("message_edit_interval_seconds", updater["interval"], "再生中メッセージの更新間隔")
+            metrics.gauge("message_edits_pending", updater["pending"], "送信待ちのメッセージ編集")
+            for key in ("sent", "skipped", "coalesced", "failed", "rate_limited"):
+                metrics.counter("message_edits", updater[key], "再生中メッセージの編集", {"result": key})
+
+        for label, stats in sorted(first_frame_stats.items()):
+            metrics.histogram("first_frame_seconds", stats, "再生開始から最初のフレームまでの時間", {"source": label})
+        metrics.histogram("seek_first_frame_seconds", seek_stats, "シークから最初のフレームまでの時間")
+
+        if audio_nodes is not None:
+            # 同じ名前の指標は続けて書き出す必要があるため、指標ごとに全てのノードを書き出す
+            nodes = audio_nodes.stats()
+            for name, key, help in (
+                ("audio_node_healthy", "healthy", "音声ノードが応答しているか"),
+                ("audio_node_streams", "streams", "音声ノードの再生中のストリーム数"),
+            ):
+                for node in nodes:
+                    metrics.gauge(name, node[key], help, {"node": node["name"]})
+            metrics.counter("audio_node_respawns", audio_nodes.respawns, "音声ノードを起動し直した回数")
+
+    def _collect_extraction(self, metrics: MetricsWriter):
+        """抽出の所要時間と実行キュー"""
+        for site, stats in sorted(extract_stats.items()):
+            metrics.histogram("extract_seconds", stats, "抽出にかかった時間", {"site": site})
+
+        executor = extraction_executor.stats()
+        labels = {"backend": executor["backend"]}
+        metrics.gauge("executor_workers", executor["workers"], "抽出ワーカー数", labels)
+        metrics.gauge("executor_pending", executor["pending"], "抽出の待機中・実行中の件数", labels)
+        metrics.gauge("executor_running", executor["running"], "実行中の抽出の件数", labels)
+        metrics.gauge("executor_wait_max_seconds", executor["wait_max"], "抽出の最長の待ち時間", labels)
+        metrics.counter("executor_completed", executor["completed"], "完了した抽出の件数", labels)
+        metrics.counter("executor_rejected", executor["rejected"], "混雑のため断った抽出の件数", labels)
+        metrics.counter("executor_timeouts", executor["timeouts"], "時間内に完了せず子プロセスを終了した抽出の件数", labels)
+
+        pool = ytdl_pool.stats()
+        metrics.gauge("ytdl_pool_instances", pool["total"], "YoutubeDLインスタンス数")
+        metrics.gauge("ytdl_pool_idle", pool["idle"], "待機中のYoutubeDLインスタンス数")
+        metrics.counter("ytdl_pool_created", pool["created"], "作成したYoutubeDLインスタンス数")
+        metrics.counter("ytdl_pool_recycled", pool["recycled"], "作り直したYoutubeDLインスタンス数")
+
+    def _collect_caches(self, metrics: MetricsWriter):
+        """メタデータ・ディスクキャッシュ"""
+        cache = metadata_cache.stats()
+        metrics.gauge("metadata_cache_entries", cache["entries"], "メタデータキャッシュの件数")
+        metrics.gauge("metadata_cache_bytes", cache["bytes"], "メタデータキャッシュのバイト数")
+        metrics.gauge("metadata_cache_hit_ratio", cache["hit_ratio"], "メタデータキャッシュのヒット率")
+        for key in ("hits", "stream_hits", "misses", "evictions"):
+            metrics.counter("metadata_cache_requests", cache[key], "メタデータキャッシュの参照", {"result": key})
+
+        if disk_cache is not None:
+            cache = disk_cache.stats()
+            metrics.gauge("disk_cache_files", cache["files"], "ディスクキャッシュのファイル数")
+            metrics.gauge("disk_cache_bytes", cache["bytes"], "ディスクキャッシュのバイト数")
+            metrics.gauge("disk_cache_hit_ratio", cache["hit_ratio"], "ディスクキャッシュのヒット率")
+            for key in ("hits", "misses"):
+                metrics.counter("disk_cache_requests", cache[key], "ディスクキャッシュの参照", {"result": key})
+            metrics.counter("disk_cache_bytes_saved", cache["bytes_saved"], "ディスクキャッシュで節約したバイト数")
+
+    def _collect_gateway(self, metrics: MetricsWriter):
+        """シャード・イベントループ"""
+        metrics.gauge("guilds", len(self.bot.guilds), "参加しているサーバー数")
+        shards = iter_shards(self.bot)
+        for shard_id, _, latency in shards:
+            metrics.gauge("shard_latency_seconds", latency, "シャードのハートビートのレイテンシ", {"shard": shard_id})
+        ping = self.bot.get_cog("PingCog")
+        if ping is not None:
+            for shard_id, _, _ in shards:
+                metrics.gauge(
+                    "shard_events_per_second",
+                    ping.event_rate.rate(shard_id),
+                    "シャードのイベント受信レート",
+                    {"shard": shard_id},
+                )
+
+        metrics.histogram("event_loop_lag_seconds", self.loop_monitor.stats, "イベントループの遅れ")
+        metrics.gauge("event_loop_lag_last_seconds", self.loop_monitor.last, "直近のイベントループの遅れ")
+        metrics.histogram("event_loop_stall_seconds", self.loop_monitor.stalls, "閾値を超えたイベントループの停止")
+        metrics.gauge("event_loop_monitor_enabled", self.loop_monitor.enabled, "イベントループの停止を検出しているか")
+
+
+async def setup(bot: commands.Bot):
+    """コグをセットアップ"""
+    await bot.add_cog(MetricsCog(bot))
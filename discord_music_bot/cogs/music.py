@@ -1,116 +1,305 @@
 import asyncio
+import itertools
 import logging
 import math
 import os
+import re
+import time
 import traceback
-from datetime import timedelta
-from typing import Optional, Union
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import discord
 import dotenv
 from discord import app_commands
 from discord.ext import commands, tasks
 
+from objects.alarm import Alarm, AlarmScheduler
 from objects.item import Item
 from objects.queue import Queue, QueueEmpty, QueueEdge
 from objects.state import GuildState
-from source.source import YTDLSource, DiscordFileSource, isPlayList
-from utils.func import clamp, formatTime, format_duration, create_progress_bar
+from source.executor import ExecutorSaturated
+from source.source import (
+    PLAYLIST_HEAD_SIZE,
+    YTDLOpusSource,
+    YTDLSource,
+    DiscordFileSource,
+    audio_nodes,
+    disk_cache,
+    isPlayList,
+    iter_playlist,
+    start_audio_nodes,
+    stop_audio_nodes,
+    warm_up_extractors,
+)
+from utils.func import clamp, formatTime, format_duration, create_progress_bar, parseTime
+from utils.updater import MessageUpdater
 
 dotenv.load_dotenv()
 
+_log = logging.getLogger("music")
 
-def create_control_view(is_paused: bool, is_looping: bool, is_shuffle: bool) -> discord.ui.View:
-    """音楽コントロール用のUIビューを作成"""
-    view = discord.ui.View(timeout=None)
+
+def parse_timeout_overrides(value: str) -> Dict[int, Tuple[float, float]]:
+    """「サーバーID:秒数:秒数」のカンマ区切りをサーバーごとの設定に変換"""
+    overrides = {}
+    for entry in value.split(","):
+        parts = entry.strip().split(":")
+        if len(parts) != 3:
+            continue
+        try:
+            overrides[int(parts[0])] = (float(parts[1]), float(parts[2]))
+        except ValueError:
+            _log.warning(f"Invalid voice timeout override: {entry}")
+    return overrides
+
+
+# 再生中メッセージの更新間隔（最短・最長秒）と、全サーバー合計で1秒あたりに行う編集の上限
+NOW_PLAYING_MIN_INTERVAL = float(os.getenv("NOW_PLAYING_MIN_INTERVAL", "5"))
+NOW_PLAYING_MAX_INTERVAL = float(os.getenv("NOW_PLAYING_MAX_INTERVAL", "30"))
+NOW_PLAYING_EDIT_RATE = float(os.getenv("NOW_PLAYING_EDIT_RATE", "2"))
+
+# アラームの保存先・曲を事前に解決する秒数・停止中に時刻を過ぎたアラームを再生する猶予秒数・1サーバーあたりの上限
+ALARM_STORE = Path(os.getenv("ALARM_STORE", "cache/alarms.json"))
+ALARM_PREPARE_SECONDS = float(os.getenv("ALARM_PREPARE_SECONDS", "60"))
+ALARM_MISSED_GRACE = float(os.getenv("ALARM_MISSED_GRACE", "300"))
+ALARM_MAX_PER_GUILD = int(os.getenv("ALARM_MAX_PER_GUILD", "10"))
+
+# 聞いている人がいない状態・一時停止が続いた場合に切断するまでの秒数（0で無効）
+VOICE_ALONE_TIMEOUT = float(os.getenv("VOICE_ALONE_TIMEOUT", "120"))
+VOICE_PAUSE_TIMEOUT = float(os.getenv("VOICE_PAUSE_TIMEOUT", "900"))
+# サーバーごとの上書き（「サーバーID:聞いている人がいない場合の秒数:一時停止の秒数」のカンマ区切り）
+VOICE_TIMEOUT_OVERRIDES = parse_timeout_overrides(os.getenv("VOICE_TIMEOUT_OVERRIDES", ""))
+
+# 使われていないサーバーの状態を破棄するまでの秒数
+GUILD_STATE_IDLE_TIMEOUT = float(os.getenv("GUILD_STATE_IDLE_TIMEOUT", "600"))
+
+# 再生位置が進まないまま経過したら、その曲を止めて次の曲に進めるまでの秒数
+PLAYER_STALL_TIMEOUT = float(os.getenv("PLAYER_STALL_TIMEOUT", "60"))
+
+# 複数のシャードで動かす場合に、プレゼンスの表示を切り替える間隔（秒）
+PRESENCE_SHARDED_ROTATE_INTERVAL = float(os.getenv("PRESENCE_SHARDED_ROTATE_INTERVAL", "300"))
+
+# 連打された場合に1回の操作にまとめるボタン（シークと音量は押された回数分、スキップは1回）
+COALESCED_BUTTONS = frozenset({
+    "forward", "reverse", "volume_up", "volume_down", "next", "prev"
+})
+
+
+class ControlButton(discord.ui.Button):
+    """音楽コントロール用のボタン（押されたら音楽コグの処理表で処理する）"""
     
-    # 上段のボタン
-    view.add_item(
-        discord.ui.Button(
-            style=discord.ButtonStyle.secondary,
-            emoji="⏪",
-            custom_id="reverse",
-            row=0
+    async def callback(self, interaction: discord.Interaction):
+        cog = interaction.client.get_cog("MusicCog")
+        if cog is not None:
+            await cog.handle_button_click(interaction)
+
+
+class ControlView(discord.ui.View):
+    """
+    音楽コントロール用のUIビュー
+    状態の組み合わせごとに1度だけ作成し、全てのメッセージで使い回す
+    """
+    
+    def __init__(self, is_paused: bool, is_looping: bool, is_shuffle: bool):
+        super().__init__(timeout=None)
+        
+        # 上段のボタン
+        self.add_item(
+            ControlButton(
+                style=discord.ButtonStyle.secondary,
+                emoji="⏪",
+                custom_id="reverse",
+                row=0
+            )
         )
-    )
-    view.add_item(
-        discord.ui.Button(
-            style=discord.ButtonStyle.primary,
-            emoji="▶️" if is_paused else "⏸️",
-            custom_id="resume" if is_paused else "pause",
-            row=0
+        self.add_item(
+            ControlButton(
+                style=discord.ButtonStyle.primary,
+                emoji="▶️" if is_paused else "⏸️",
+                custom_id="resume" if is_paused else "pause",
+                row=0
+            )
         )
-    )
-    view.add_item(
-        discord.ui.Button(
-            style=discord.ButtonStyle.secondary,
-            emoji="⏩",
-            custom_id="forward",
-            row=0
+        self.add_item(
+            ControlButton(
+                style=discord.ButtonStyle.secondary,
+                emoji="⏩",
+                custom_id="forward",
+                row=0
+            )
         )
-    )
-    view.add_item(
-        discord.ui.Button(
-            style=discord.ButtonStyle.secondary,
-            label="🔊+",
-            custom_id="volume_up",
-            row=0
+        self.add_item(
+            ControlButton(
+                style=discord.ButtonStyle.secondary,
+                label="🔊+",
+                custom_id="volume_up",
+                row=0
+            )
         )
-    )
-    view.add_item(
-        discord.ui.Button(
-            style=discord.ButtonStyle.danger if is_looping else discord.ButtonStyle.secondary,
-            emoji="🔄",
-            custom_id="loop",
-            row=0
+        self.add_item(
+            ControlButton(
+                style=discord.ButtonStyle.danger if is_looping else discord.ButtonStyle.secondary,
+                emoji="🔄",
+                custom_id="loop",
+                row=0
+            )
         )
-    )
-    
-    # 下段のボタン
-    view.add_item(
-        discord.ui.Button(
-            style=discord.ButtonStyle.secondary,
-            emoji="⏮️",
-            custom_id="prev",
-            row=1
+        
+        # 下段のボタン
+        self.add_item(
+            ControlButton(
+                style=discord.ButtonStyle.secondary,
+                emoji="⏮️",
+                custom_id="prev",
+                row=1
+            )
         )
-    )
-    view.add_item(
-        discord.ui.Button(
-            style=discord.ButtonStyle.danger,
-            emoji="⏹️",
-            custom_id="stop",
-            row=1
+        self.add_item(
+            ControlButton(
+                style=discord.ButtonStyle.danger,
+                emoji="⏹️",
+                custom_id="stop",
+                row=1
+            )
         )
-    )
-    view.add_item(
-        discord.ui.Button(
-            style=discord.ButtonStyle.secondary,
-            emoji="⏭️",
-            custom_id="next",
-            row=1
+        self.add_item(
+            ControlButton(
+                style=discord.ButtonStyle.secondary,
+                emoji="⏭️",
+                custom_id="next",
+                row=1
+            )
         )
-    )
-    view.add_item(
-        discord.ui.Button(
-            style=discord.ButtonStyle.secondary,
-            label="🔊-",
-            custom_id="volume_down",
-            row=1
+        self.add_item(
+            ControlButton(
+                style=discord.ButtonStyle.secondary,
+                label="🔊-",
+                custom_id="volume_down",
+                row=1
+            )
         )
-    )
-    view.add_item(
-        discord.ui.Button(
-            style=discord.ButtonStyle.danger if is_shuffle else discord.ButtonStyle.secondary,
-            emoji="🔀",
-            custom_id="shuffle",
-            row=1
+        self.add_item(
+            ControlButton(
+                style=discord.ButtonStyle.danger if is_shuffle else discord.ButtonStyle.secondary,
+                emoji="🔀",
+                custom_id="shuffle",
+                row=1
+            )
         )
-    )
-    
+
+
+# (一時停止中, ループ, シャッフル) ごとの作成済みビュー
+_control_views: Dict[Tuple[bool, bool, bool], ControlView] = {}
+
+
+def create_control_view(is_paused: bool, is_looping: bool, is_shuffle: bool) -> ControlView:
+    """音楽コントロール用のUIビューを取得（作成済みのものを使い回す）"""
+    key = (bool(is_paused), bool(is_looping), bool(is_shuffle))
+    view = _control_views.get(key)
+    if view is None:
+        view = _control_views[key] = ControlView(*key)
     return view
 
 
+def register_control_views(bot: commands.Bot):
+    """全ての組み合わせのビューを永続ビューとして登録（再起動前のメッセージのボタンも処理できる）"""
+    for is_paused, is_looping, is_shuffle in itertools.product((False, True), repeat=3):
+        bot.add_view(create_control_view(is_paused, is_looping, is_shuffle))
+
+
+def items_from_result(
+    result: Union[Dict, List[Dict]],
+    url: str,
+    user: Union[discord.Member, discord.User],
+    volume: float,
+    locale: Optional[discord.Locale] = None
+) -> List[Item]:
+    """isPlayListの結果からキューに追加するアイテムを作成"""
+    if isinstance(result, list):
+        return [
+            Item(
+                user=user,
+                url=item_data['url'],
+                title=item_data['title'],
+                volume=volume,
+                locale=locale
+            )
+            for item_data in result
+            if item_data.get('url') and item_data.get('title')
+        ]
+    
+    return [
+        Item(
+            user=user,
+            url=result.get('url', url),
+            title=result.get('title', '不明なタイトル'),
+            volume=volume,
+            locale=locale,
+            info=result.get('info'),
+            stream_expires=result.get('stream_expires', 0.0)
+        )
+    ]
+
+
+def get_playing_source(voice_client: discord.VoiceClient) -> Optional[Union[YTDLSource, YTDLOpusSource, DiscordFileSource]]:
+    """再生中の曲情報を持つ音声ソースを取得"""
+    source = voice_client.source
+    # 外側のラッパーがある場合は曲情報を持つソースまで辿る
+    while source is not None and not hasattr(source, 'info') and hasattr(source, 'original'):
+        source = source.original
+    return source
+
+
+def set_source_volume(
+    voice_client: discord.VoiceClient,
+    source: Union[YTDLSource, YTDLOpusSource, DiscordFileSource],
+    volume: float
+) -> Union[YTDLSource, YTDLOpusSource, DiscordFileSource]:
+    """音量を変更（Opusパススルー中は同じ位置からPCMソースに切り替える）"""
+    if source.supports_live_volume:
+        source.volume = volume
+        return source
+    
+    new_source = source.with_volume(volume)
+    replace_source(voice_client, source, new_source)
+    return new_source
+
+
+def replace_source(
+    voice_client: discord.VoiceClient,
+    old_source: discord.AudioSource,
+    new_source: discord.AudioSource
+):
+    """ボイス接続を維持したまま再生中のソースを差し替える"""
+    was_paused = voice_client.is_paused()
+    voice_client.source = new_source
+    # 差し替え時に再生が再開されるため、一時停止中だった場合は戻す
+    if was_paused:
+        voice_client.pause()
+    # 送信スレッドが読み込み中の可能性があるため、古いソースは少し後に片付ける
+    asyncio.get_running_loop().call_later(1.0, old_source.cleanup)
+
+
+async def seek_source(
+    voice_client: discord.VoiceClient,
+    source: Union[YTDLSource, YTDLOpusSource, DiscordFileSource],
+    position: float
+) -> Tuple[Union[YTDLSource, YTDLOpusSource, DiscordFileSource], Optional[float]]:
+    """指定位置にシークし、新しいソースと最初のフレームまでの秒数を返す"""
+    new_source = source.seek(position)
+    replace_source(voice_client, source, new_source)
+    if voice_client.is_paused():
+        return new_source, None
+    return new_source, await new_source.wait_first_frame()
+
+
+def format_seek_latency(latency: Optional[float]) -> str:
+    """シークにかかった時間の表示"""
+    return f"（{latency * 1000:.0f}ms）" if latency is not None else ""
+
+
 class MusicCog(commands.Cog):
     """
     音楽再生機能を提供するメインコグ
@@ -118,41 +307,351 @@ class MusicCog(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.guild_states: dict[int, GuildState] = {}
+        self.guild_states: dict[int, GuildState] = {}  # 音楽機能を使ったサーバーのみ
+        self.states_created = 0
+        self.states_evicted = 0
+        self.known_bots: set[int] = set()  # ボイスチャンネルで見かけたボットのID
+        self.reaped_alone = 0
+        self.reaped_paused = 0
         self.presence_count = 0
+        self.presence_sent: Dict[Optional[int], Tuple[discord.ActivityType, str]] = {}  # シャードごとに最後に送った表示
+        self.playback_marks: Dict[int, Tuple[Optional[float], float]] = {}  # 最後に再生位置が変わった時刻
+        self.stall_recovering: Dict[int, float] = {}  # 停止した再生を止めた時刻
+        self.stalled_guilds: List[int] = []  # 再生位置が進んでいないサーバー
+        self.wedged_guilds: List[int] = []  # 止めても次の曲に進まなかったサーバー
+        self.stall_recoveries = 0
+        self.updater = MessageUpdater(
+            min_interval=NOW_PLAYING_MIN_INTERVAL,
+            max_interval=NOW_PLAYING_MAX_INTERVAL,
+            rate=NOW_PLAYING_EDIT_RATE,
+        )
+        self.alarms = AlarmScheduler(
+            ALARM_STORE,
+            prepare=self.prepare_alarm,
+            fire=self.fire_alarm,
+            prepare_ahead=ALARM_PREPARE_SECONDS,
+            missed_grace=ALARM_MISSED_GRACE,
+        )
+        self.button_handlers: Dict[str, Callable] = {
+            "pause": self.on_pause_button,
+            "resume": self.on_resume_button,
+            "stop": self.on_stop_button,
+            "next": self.on_next_button,
+            "prev": self.on_prev_button,
+            "loop": self.on_loop_button,
+            "shuffle": self.on_shuffle_button,
+            "forward": self.on_forward_button,
+            "reverse": self.on_reverse_button,
+            "volume_up": self.on_volume_up_button,
+            "volume_down": self.on_volume_down_button,
+        }
+
+    def get_state(self, guild_id: int, touch: bool = True) -> GuildState:
+        """
+        サーバーの状態を取得（無ければ作成）
+        ユーザー操作以外（バックグラウンドのループなど）ではtouchしないこと
+        既存の状態を読むだけであれば self.guild_states.get() を使う
+        """
+        state = self.guild_states.get(guild_id)
+        if state is None:
+            state = self.guild_states[guild_id] = GuildState()
+            self.states_created += 1
+        if touch:
+            state.touch()
+        return state
+
+    def memory_report(self) -> Dict[str, int]:
+        """サーバー状態の保持数"""
+        states = list(self.guild_states.values())
+        return {
+            "live": len(states),
+            "playing": sum(1 for state in states if state.playing),
+            "queued_items": sum(state.queue.asize() for state in states),
+            "created": self.states_created,
+            "evicted": self.states_evicted,
+        }
+
+    async def cog_load(self):
+        """コグ読み込み時に抽出ワーカー・音声ノード・アラームを起動し、コントロールボタンを登録"""
+        warm_up_extractors()
+        start_audio_nodes()
+        register_control_views(self.bot)
+        self.alarms.start()
+
+    async def cog_unload(self):
+        """コグ解除時にループを停止し、ディスクキャッシュのインデックスを保存"""
+        self.presence_loop.cancel()
+        self.progress_loop.cancel()
+        self.evict_loop.cancel()
+        self.reap_loop.cancel()
+        self.stall_loop.cancel()
+        self.updater.stop()
+        self.alarms.stop()
+        stop_audio_nodes()
+        if disk_cache is not None:
+            disk_cache.flush()
 
     @commands.Cog.listener()
     async def on_ready(self):
         """Bot起動時の処理"""
-        for guild in self.bot.guilds:
-            self.guild_states[guild.id] = GuildState()
-        
         if not self.presence_loop.is_running():
             self.presence_loop.start()
+        
+        if not self.progress_loop.is_running():
+            self.progress_loop.start()
+        
+        if not self.evict_loop.is_running():
+            self.evict_loop.start()
+        
+        if not self.reap_loop.is_running():
+            self.reap_loop.start()
+        
+        if not self.stall_loop.is_running():
+            self.stall_loop.start()
 
     @tasks.loop(seconds=30)
     async def presence_loop(self):
-        """ボットのプレゼンス表示を循環させる"""
-        activities = [
-            discord.Activity(
-                name=f"{len(self.bot.voice_clients)} / {len(self.bot.guilds)} サーバー",
-                type=discord.ActivityType.competing
-            ),
-            discord.Game("/help でヘルプを表示"),
-            discord.Activity(
-                name="音楽を再生中 🎵",
-                type=discord.ActivityType.listening
-            )
-        ]
-        
-        activity = activities[self.presence_count % len(activities)]
-        await self.bot.change_presence(activity=activity)
+        """
+        ボットのプレゼンス表示を循環させる（シャードごとに担当サーバーの数を表示）
+        表示が変わったシャードにのみ送信し、複数のシャードでは切り替えの間隔を広げる
+        """
+        shard_ids = sorted(getattr(self.bot, "shards", None) or [None])
+        guild_counts = {shard_id: 0 for shard_id in shard_ids}
+        voice_counts = {shard_id: 0 for shard_id in shard_ids}
+        sharded = shard_ids != [None]
+        for guild in self.bot.guilds:
+            key = guild.shard_id if sharded else None
+            if key in guild_counts:
+                guild_counts[key] += 1
+                if guild.voice_client is not None:
+                    voice_counts[key] += 1
+        
+        rotate_every = 1
+        if len(shard_ids) > 1:
+            rotate_every = max(1, round(PRESENCE_SHARDED_ROTATE_INTERVAL / self.presence_loop.seconds))
+        
+        for shard_id in shard_ids:
+            activities = [
+                discord.Activity(
+                    name=f"{voice_counts[shard_id]} / {guild_counts[shard_id]} サーバー",
+                    type=discord.ActivityType.competing
+                ),
+                discord.Game("/help でヘルプを表示"),
+                discord.Activity(
+                    name="音楽を再生中 🎵",
+                    type=discord.ActivityType.listening
+                )
+            ]
+            
+            activity = activities[self.presence_count // rotate_every % len(activities)]
+            if self.presence_sent.get(shard_id) == (activity.type, activity.name):
+                continue
+            self.presence_sent[shard_id] = (activity.type, activity.name)
+            if sharded:
+                await self.bot.change_presence(activity=activity, shard_id=shard_id)
+            else:
+                await self.bot.change_presence(activity=activity)
         self.presence_count += 1
 
+    @tasks.loop(seconds=NOW_PLAYING_MIN_INTERVAL)
+    async def progress_loop(self):
+        """再生中の全サーバーの埋め込みの更新を予約"""
+        for guild_id, state in list(self.guild_states.items()):
+            message = state.now_playing
+            if message is None:
+                continue
+            
+            guild = self.bot.get_guild(guild_id)
+            voice_client = guild.voice_client if guild else None
+            if not voice_client or not voice_client.is_playing():
+                continue
+            
+            source = get_playing_source(voice_client)
+            if source is None:
+                continue
+            
+            embed = self.create_now_playing_embed(source, voice_client)
+            view = create_control_view(False, state.loop, state.shuffle)
+            self.updater.submit(message, embed, view)
+        
+        # 更新対象が多い場合は間隔を広げ、全体の送信レートを抑える
+        interval = self.updater.refresh_interval
+        if interval != self.progress_loop.seconds:
+            self.progress_loop.change_interval(seconds=interval)
+
+    @tasks.loop(seconds=60)
+    async def evict_loop(self):
+        """一定時間使われていないサーバーの状態を破棄"""
+        now = time.monotonic()
+        for guild_id, state in list(self.guild_states.items()):
+            if now - state.last_active < GUILD_STATE_IDLE_TIMEOUT or not state.is_idle():
+                continue
+            
+            guild = self.bot.get_guild(guild_id)
+            if guild is not None and guild.voice_client is not None:
+                continue
+            
+            state.reset()
+            del self.guild_states[guild_id]
+            self.states_evicted += 1
+        
+        report = self.memory_report()
+        _log.debug(f"Guild states: {report['live']} live, {report['evicted']} evicted")
+
+    def has_listeners(self, channel: discord.VoiceChannel) -> bool:
+        """ボット以外に聞いている人がいるかどうか（スピーカーミュートの人は除く）"""
+        for user_id, voice_state in channel.voice_states.items():
+            if user_id == self.bot.user.id or user_id in self.known_bots:
+                continue
+            if voice_state.self_deaf or voice_state.deaf:
+                continue
+            return True
+        return False
+
+    @tasks.loop(seconds=15)
+    async def reap_loop(self):
+        """聞いている人がいない・一時停止が続いているボイス接続を切断"""
+        now = time.monotonic()
+        
+        for voice_client in list(self.bot.voice_clients):
+            guild = voice_client.guild
+            # 状態の作成・最終利用時刻の更新はしない（更新すると使われていない状態が破棄されなくなる）
+            state = self.guild_states.get(guild.id)
+            if state is None:
+                continue
+            alone_timeout, pause_timeout = VOICE_TIMEOUT_OVERRIDES.get(
+                guild.id, (VOICE_ALONE_TIMEOUT, VOICE_PAUSE_TIMEOUT)
+            )
+            
+            if self.has_listeners(voice_client.channel):
+                state.alone_since = None
+            elif state.alone_since is None:
+                state.alone_since = now
+            
+            if voice_client.is_paused():
+                if state.paused_since is None:
+                    state.paused_since = now
+            else:
+                state.paused_since = None
+            
+            if alone_timeout and state.alone_since is not None and now - state.alone_since >= alone_timeout:
+                self.reaped_alone += 1
+                reason = "ボイスチャンネルに誰もいなくなったため"
+            elif pause_timeout and state.paused_since is not None and now - state.paused_since >= pause_timeout:
+                self.reaped_paused += 1
+                reason = "一時停止したまま時間が経ったため"
+            else:
+                continue
+            
+            _log.info(f"Disconnecting idle voice client in guild {guild.id}: {reason}")
+            message = state.now_playing
+            playing = state.playing
+            await voice_client.disconnect()
+            
+            # 再生中であればplay_nextの終了処理で状態がリセットされる
+            if not playing:
+                state.reset()
+            if message is not None:
+                try:
+                    await message.channel.send(f"👋 {reason}切断しました。")
+                except discord.HTTPException:
+                    pass
+
+    @tasks.loop(seconds=15)
+    async def stall_loop(self):
+        """再生位置が進まなくなったサーバーの曲を止めて、次の曲に進める"""
+        now = time.monotonic()
+        self.stalled_guilds = self.stalled_players(PLAYER_STALL_TIMEOUT)
+        
+        wedged = []
+        for guild_id in self.stalled_guilds:
+            since = self.stall_recovering.get(guild_id)
+            if since is not None:
+                # 止めてもplay_nextが次の曲に進まない
+                if now - since >= PLAYER_STALL_TIMEOUT:
+                    wedged.append(guild_id)
+                continue
+            
+            state = self.guild_states.get(guild_id)
+            guild = self.bot.get_guild(guild_id)
+            voice_client = guild.voice_client if guild else None
+            _log.warning(f"Playback stalled in guild {guild_id}, skipping the current track")
+            self.stall_recoveries += 1
+            self.stall_recovering[guild_id] = now
+            if voice_client is not None:
+                # afterが呼ばれ、play_nextが次の曲に進む
+                voice_client.stop()
+            elif state is not None and state.track_done is not None:
+                # ボイス接続が無くなっている場合はafterが呼ばれないため、直接終了を通知する
+                state.track_done.set()
+        
+        for guild_id in list(self.stall_recovering):
+            if guild_id not in self.stalled_guilds:
+                del self.stall_recovering[guild_id]
+        if wedged and not self.wedged_guilds:
+            _log.error(f"Playback did not recover after stopping the track in guilds {wedged}")
+        self.wedged_guilds = wedged
+
+    def stalled_players(self, timeout: float) -> List[int]:
+        """
+        再生中のはずが、再生位置が一定時間進んでいないサーバーのID（一時停止中は除く）
+        呼び出すたびに再生位置の記録を更新するため、stall_loopからのみ呼ぶこと
+        """
+        now = time.monotonic()
+        marks: Dict[int, Tuple[Optional[float], float]] = {}
+        stalled = []
+        for guild_id, state in list(self.guild_states.items()):
+            if not state.playing:
+                continue
+            guild = self.bot.get_guild(guild_id)
+            voice_client = guild.voice_client if guild else None
+            if voice_client is not None and voice_client.is_paused():
+                continue
+            
+            # 再生が終わってもafterが呼ばれない場合は、位置がNoneのまま変わらない
+            source = voice_client.source if voice_client else None
+            position = getattr(source, "position", None)
+            last = self.playback_marks.get(guild_id)
+            if last is None or last[0] != position:
+                marks[guild_id] = (position, now)
+                continue
+            marks[guild_id] = last
+            if now - last[1] >= timeout:
+                stalled.append(guild_id)
+        
+        self.playback_marks = marks
+        return stalled
+
+    def playback_report(self) -> Dict[str, int]:
+        """再生が止まっているサーバーの数と、止めて次の曲に進めた回数（stall_loopの直近の結果）"""
+        return {
+            "stalled": len(self.stalled_guilds),
+            "wedged": len(self.wedged_guilds),
+            "recoveries": self.stall_recoveries,
+        }
+
+    def reaper_stats(self) -> Dict[str, int]:
+        """自動切断した接続の数"""
+        return {
+            "alone": self.reaped_alone,
+            "paused": self.reaped_paused,
+        }
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id: int):
+        """IDENTIFYし直したシャードはプレゼンスが消えるため、次の更新で送り直す"""
+        self.presence_sent.pop(shard_id, None)
+
     @commands.Cog.listener()
-    async def on_guild_join(self, guild: discord.Guild):
-        """サーバー参加時の処理"""
-        self.guild_states[guild.id] = GuildState()
+    async def on_voice_state_update(
+        self,
+        member: discord.Member,
+        before: discord.VoiceState,
+        after: discord.VoiceState
+    ):
+        """ボットのIDを記録（メンバーをキャッシュしていないため、ここで判別する）"""
+        if member.bot and member.id != self.bot.user.id:
+            self.known_bots.add(member.id)
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild: discord.Guild):
@@ -162,233 +661,298 @@ class MusicCog(commands.Cog):
                 await guild.voice_client.disconnect()
             del self.guild_states[guild.id]
 
-    @commands.Cog.listener()
-    async def on_interaction(self, interaction: discord.Interaction):
-        """ボタンインタラクションの処理"""
-        if interaction.type != discord.InteractionType.component:
-            return
-        
-        try:
-            await self.handle_button_click(interaction)
-        except Exception as e:
-            print(f"Button interaction error: {e}")
-            if not interaction.response.is_done():
-                await interaction.response.send_message(
-                    "エラーが発生しました。", ephemeral=True
-                )
-
     async def handle_button_click(self, interaction: discord.Interaction):
-        """ボタンクリック処理"""
+        """ボタンクリック処理（custom_idに対応する処理をサーバーごとのキューで実行する）"""
         custom_id = interaction.data.get("custom_id", "")
+        handler = self.button_handlers.get(custom_id)
         guild = interaction.guild
         
-        if not guild or guild.id not in self.guild_states:
+        if handler is None or not guild:
             await interaction.response.send_message(
                 "エラーが発生しました。", ephemeral=True
             )
             return
         
-        state = self.guild_states[guild.id]
-        voice_client = guild.voice_client
+        # 3秒以内に応答する必要があるため、先に応答してから順番に処理する
+        await interaction.response.defer()
         
-        if custom_id == "pause":
-            if not voice_client or not voice_client.is_playing():
-                await interaction.response.send_message(
-                    "再生中の音楽がありません。", ephemeral=True
-                )
-                return
-            
-            voice_client.pause()
-            await interaction.response.defer()
-            
-            embed = interaction.message.embeds[0]
-            embed.set_author(name="⏸️ 一時停止中")
-            
-            await interaction.edit_original_response(
-                embed=embed,
-                view=create_control_view(True, state.loop, state.shuffle)
+        # ボタン操作でメッセージが編集されるため、送信済みの内容を破棄
+        if interaction.message is not None:
+            self.updater.invalidate(interaction.message.id)
+        
+        state = self.get_state(guild.id)
+        
+        async def run(latest: discord.Interaction, count: int):
+            await handler(latest, state, guild.voice_client, count)
+        
+        state.commands.submit(
+            custom_id, run, interaction, coalesce=custom_id in COALESCED_BUTTONS
+        )
+
+    async def on_pause_button(
+        self,
+        interaction: discord.Interaction,
+        state: GuildState,
+        voice_client: Optional[discord.VoiceClient],
+        count: int
+    ):
+        """一時停止ボタン"""
+        if not voice_client or not voice_client.is_playing():
+            await interaction.followup.send(
+                "再生中の音楽がありません。", ephemeral=True
             )
+            return
         
-        elif custom_id == "resume":
-            if not voice_client or not voice_client.is_paused():
-                await interaction.response.send_message(
-                    "一時停止中の音楽がありません。", ephemeral=True
-                )
-                return
-            
-            voice_client.resume()
-            await interaction.response.defer()
-            
-            embed = interaction.message.embeds[0]
-            embed.set_author(name="🎵 再生中")
-            
-            await interaction.edit_original_response(
-                embed=embed,
-                view=create_control_view(False, state.loop, state.shuffle)
+        voice_client.pause()
+        
+        embed = interaction.message.embeds[0]
+        embed.set_author(name="⏸️ 一時停止中")
+        
+        await interaction.edit_original_response(
+            embed=embed,
+            view=create_control_view(True, state.loop, state.shuffle)
+        )
+
+    async def on_resume_button(
+        self,
+        interaction: discord.Interaction,
+        state: GuildState,
+        voice_client: Optional[discord.VoiceClient],
+        count: int
+    ):
+        """再開ボタン"""
+        if not voice_client or not voice_client.is_paused():
+            await interaction.followup.send(
+                "一時停止中の音楽がありません。", ephemeral=True
             )
+            return
         
-        elif custom_id == "stop":
-            if not voice_client:
-                await interaction.response.send_message(
-                    "接続中のボイスチャンネルがありません。", ephemeral=True
-                )
-                return
-            
-            await interaction.response.defer()
-            await voice_client.disconnect()
-            state.reset()
-            
-            await interaction.followup.send("⏹️ 音楽を停止しました。")
+        voice_client.resume()
         
-        elif custom_id == "next":
-            if not voice_client or not voice_client.is_playing():
-                await interaction.response.send_message(
-                    "再生中の音楽がありません。", ephemeral=True
-                )
-                return
-            
-            await interaction.response.defer()
+        embed = interaction.message.embeds[0]
+        embed.set_author(name="🎵 再生中")
+        
+        await interaction.edit_original_response(
+            embed=embed,
+            view=create_control_view(False, state.loop, state.shuffle)
+        )
+
+    async def on_stop_button(
+        self,
+        interaction: discord.Interaction,
+        state: GuildState,
+        voice_client: Optional[discord.VoiceClient],
+        count: int
+    ):
+        """停止ボタン"""
+        if not voice_client:
+            await interaction.followup.send(
+                "接続中のボイスチャンネルがありません。", ephemeral=True
+            )
+            return
+        
+        await voice_client.disconnect()
+        state.reset()
+        
+        await interaction.followup.send("⏹️ 音楽を停止しました。")
+
+    async def on_next_button(
+        self,
+        interaction: discord.Interaction,
+        state: GuildState,
+        voice_client: Optional[discord.VoiceClient],
+        count: int
+    ):
+        """次の曲ボタン"""
+        if not voice_client or not voice_client.is_playing():
+            await interaction.followup.send(
+                "再生中の音楽がありません。", ephemeral=True
+            )
+            return
+        
+        voice_client.stop()
+
+    async def on_prev_button(
+        self,
+        interaction: discord.Interaction,
+        state: GuildState,
+        voice_client: Optional[discord.VoiceClient],
+        count: int
+    ):
+        """前の曲ボタン"""
+        if not voice_client:
+            await interaction.followup.send(
+                "再生中の音楽がありません。", ephemeral=True
+            )
+            return
+        
+        try:
+            state.queue.prev()
+            state.prefetch()
             voice_client.stop()
+        except QueueEdge:
+            await interaction.followup.send(
+                "これが最初の曲です。", ephemeral=True
+            )
+
+    async def on_loop_button(
+        self,
+        interaction: discord.Interaction,
+        state: GuildState,
+        voice_client: Optional[discord.VoiceClient],
+        count: int
+    ):
+        """ループ切り替えボタン"""
+        state.loop = not state.loop
+        
+        embed = interaction.message.embeds[0]
+        await interaction.edit_original_response(
+            embed=embed,
+            view=create_control_view(
+                voice_client.is_paused() if voice_client else False,
+                state.loop,
+                state.shuffle
+            )
+        )
         
-        elif custom_id == "prev":
-            if not voice_client:
-                await interaction.response.send_message(
-                    "再生中の音楽がありません。", ephemeral=True
-                )
-                return
-            
-            await interaction.response.defer()
-            try:
-                state.queue.prev()
-                voice_client.stop()
-            except QueueEdge:
-                await interaction.followup.send(
-                    "これが最初の曲です。", ephemeral=True
-                )
+        status = "有効" if state.loop else "無効"
+        await interaction.followup.send(
+            f"🔄 ループを{status}にしました。", ephemeral=True
+        )
+
+    async def on_shuffle_button(
+        self,
+        interaction: discord.Interaction,
+        state: GuildState,
+        voice_client: Optional[discord.VoiceClient],
+        count: int
+    ):
+        """シャッフル切り替えボタン"""
+        state.shuffle = not state.shuffle
         
-        elif custom_id == "loop":
-            await interaction.response.defer()
-            state.loop = not state.loop
-            
-            embed = interaction.message.embeds[0]
-            await interaction.edit_original_response(
-                embed=embed,
-                view=create_control_view(
-                    voice_client.is_paused() if voice_client else False,
-                    state.loop,
-                    state.shuffle
-                )
+        if state.shuffle:
+            state.queue.shuffle()
+        else:
+            state.queue.unshuffle()
+        state.prefetch()
+        
+        embed = interaction.message.embeds[0]
+        await interaction.edit_original_response(
+            embed=embed,
+            view=create_control_view(
+                voice_client.is_paused() if voice_client else False,
+                state.loop,
+                state.shuffle
             )
-            
-            status = "有効" if state.loop else "無効"
+        )
+        
+        status = "有効" if state.shuffle else "無効"
+        await interaction.followup.send(
+            f"🔀 シャッフルを{status}にしました。", ephemeral=True
+        )
+
+    async def on_forward_button(
+        self,
+        interaction: discord.Interaction,
+        state: GuildState,
+        voice_client: Optional[discord.VoiceClient],
+        count: int
+    ):
+        """10秒進めるボタン（続けて押された分をまとめて進める）"""
+        if not voice_client or not voice_client.source:
             await interaction.followup.send(
-                f"🔄 ループを{status}にしました。", ephemeral=True
+                "再生中の音楽がありません。", ephemeral=True
             )
+            return
         
-        elif custom_id == "shuffle":
-            await interaction.response.defer()
-            state.shuffle = not state.shuffle
-            
-            if state.shuffle:
-                state.queue.shuffle()
-            else:
-                state.queue.unshuffle()
-            
-            embed = interaction.message.embeds[0]
-            await interaction.edit_original_response(
-                embed=embed,
-                view=create_control_view(
-                    voice_client.is_paused() if voice_client else False,
-                    state.loop,
-                    state.shuffle
-                )
+        source = get_playing_source(voice_client)
+        
+        # 押された回数×10秒進める
+        seconds = 10 * count
+        new_progress = source.position + seconds
+        if not source.info.duration or new_progress < source.info.duration:
+            state.source, latency = await seek_source(voice_client, source, new_progress)
+            await interaction.followup.send(
+                f"⏩ {seconds}秒進めました。{format_seek_latency(latency)}", ephemeral=True
             )
-            
-            status = "有効" if state.shuffle else "無効"
+        else:
+            await interaction.followup.send("⏩ これ以上進めません。", ephemeral=True)
+
+    async def on_reverse_button(
+        self,
+        interaction: discord.Interaction,
+        state: GuildState,
+        voice_client: Optional[discord.VoiceClient],
+        count: int
+    ):
+        """10秒戻すボタン（続けて押された分をまとめて戻す）"""
+        if not voice_client or not voice_client.source:
             await interaction.followup.send(
-                f"🔀 シャッフルを{status}にしました。", ephemeral=True
+                "再生中の音楽がありません。", ephemeral=True
             )
+            return
         
-        elif custom_id == "forward":
-            if not voice_client or not voice_client.source:
-                await interaction.response.send_message(
-                    "再生中の音楽がありません。", ephemeral=True
-                )
-                return
-            
-            await interaction.response.defer(ephemeral=True)
-            source = voice_client.source
-            if hasattr(source, 'original'):
-                source = source.original
-            
-            # 10秒進める
-            new_progress = source.progress + 10
-            if new_progress < source.info.duration:
-                source.progress = new_progress
-                await interaction.followup.send("⏩ 10秒進めました。", ephemeral=True)
-            else:
-                await interaction.followup.send("⏩ これ以上進めません。", ephemeral=True)
+        source = get_playing_source(voice_client)
         
-        elif custom_id == "reverse":
-            if not voice_client or not voice_client.source:
-                await interaction.response.send_message(
-                    "再生中の音楽がありません。", ephemeral=True
-                )
-                return
-            
-            await interaction.response.defer(ephemeral=True)
-            source = voice_client.source
-            if hasattr(source, 'original'):
-                source = source.original
-            
-            # 10秒戻す
-            new_progress = max(0, source.progress - 10)
-            source.progress = new_progress
-            await interaction.followup.send("⏪ 10秒戻しました。", ephemeral=True)
-        
-        elif custom_id == "volume_up":
-            if not voice_client or not voice_client.source:
-                await interaction.response.send_message(
-                    "再生中の音楽がありません。", ephemeral=True
-                )
-                return
-            
-            await interaction.response.defer(ephemeral=True)
-            source = voice_client.source
-            if hasattr(source, 'original'):
-                source = source.original
-            
-            # 音量を0.1上げる（最大2.0）
-            new_volume = min(2.0, source.volume + 0.1)
-            source.volume = round(new_volume, 1)
-            
+        # 押された回数×10秒戻す
+        seconds = 10 * count
+        new_progress = max(0, source.position - seconds)
+        state.source, latency = await seek_source(voice_client, source, new_progress)
+        await interaction.followup.send(
+            f"⏪ {seconds}秒戻しました。{format_seek_latency(latency)}", ephemeral=True
+        )
+
+    async def on_volume_up_button(
+        self,
+        interaction: discord.Interaction,
+        state: GuildState,
+        voice_client: Optional[discord.VoiceClient],
+        count: int
+    ):
+        """音量を上げるボタン"""
+        if not voice_client or not voice_client.source:
             await interaction.followup.send(
-                f"🔊 音量を {int(source.volume * 100)}% に上げました。", ephemeral=True
+                "再生中の音楽がありません。", ephemeral=True
             )
+            return
         
-        elif custom_id == "volume_down":
-            if not voice_client or not voice_client.source:
-                await interaction.response.send_message(
-                    "再生中の音楽がありません。", ephemeral=True
-                )
-                return
-            
-            await interaction.response.defer(ephemeral=True)
-            source = voice_client.source
-            if hasattr(source, 'original'):
-                source = source.original
-            
-            # 音量を0.1下げる（最小0.0）
-            new_volume = max(0.0, source.volume - 0.1)
-            source.volume = round(new_volume, 1)
-            
+        source = get_playing_source(voice_client)
+        
+        # 押された回数×0.1上げる（最大2.0）
+        new_volume = min(2.0, source.volume + 0.1 * count)
+        source = state.source = set_source_volume(voice_client, source, round(new_volume, 1))
+        
+        await interaction.followup.send(
+            f"🔊 音量を {int(source.volume * 100)}% に上げました。", ephemeral=True
+        )
+
+    async def on_volume_down_button(
+        self,
+        interaction: discord.Interaction,
+        state: GuildState,
+        voice_client: Optional[discord.VoiceClient],
+        count: int
+    ):
+        """音量を下げるボタン"""
+        if not voice_client or not voice_client.source:
             await interaction.followup.send(
-                f"🔉 音量を {int(source.volume * 100)}% に下げました。", ephemeral=True
+                "再生中の音楽がありません。", ephemeral=True
             )
+            return
+        
+        source = get_playing_source(voice_client)
+        
+        # 押された回数×0.1下げる（最小0.0）
+        new_volume = max(0.0, source.volume - 0.1 * count)
+        source = state.source = set_source_volume(voice_client, source, round(new_volume, 1))
+        
+        await interaction.followup.send(
+            f"🔉 音量を {int(source.volume * 100)}% に下げました。", ephemeral=True
+        )
 
     def create_now_playing_embed(
         self,
-        source: Union[YTDLSource, DiscordFileSource],
+        source: Union[YTDLSource, YTDLOpusSource, DiscordFileSource],
         voice_client: discord.VoiceClient,
         finished: bool = False
     ) -> discord.Embed:
@@ -416,9 +980,10 @@ class MusicCog(commands.Cog):
             embed.color = discord.Color.greyple()
         
         # 再生時間のプログレスバー
-        if hasattr(source, 'progress') and source.info.duration > 0:
+        if hasattr(source, 'position') and source.info.duration > 0:
+            position = source.position
             progress_bar = create_progress_bar(
-                int(source.progress), 
+                int(position), 
                 int(source.info.duration),
                 length=15,
                 filled_char="█",
@@ -427,7 +992,7 @@ class MusicCog(commands.Cog):
             
             embed.add_field(
                 name="⏱️ 再生時間",
-                value=f"`{formatTime(source.progress)} / {formatTime(source.info.duration)}`\n{progress_bar}",
+                value=f"`{formatTime(position)} / {formatTime(source.info.duration)}`\n{progress_bar}",
                 inline=False
             )
         
@@ -465,10 +1030,7 @@ class MusicCog(commands.Cog):
 
     async def play_next(self, guild: discord.Guild, channel: discord.abc.Messageable):
         """次の曲を再生"""
-        if guild.id not in self.guild_states:
-            return
-        
-        state = self.guild_states[guild.id]
+        state = self.get_state(guild.id)
         voice_client = guild.voice_client
         
         try:
@@ -481,69 +1043,55 @@ class MusicCog(commands.Cog):
                 if not item:
                     break
                 
-                # 音声ソースを作成
+                # 音声ソースを作成（先読み済みであればそれを使用）
                 try:
-                    if item.attachment:
+                    source = await state.prefetcher.take(item)
+                    if source is None and item.attachment:
                         source = await DiscordFileSource.from_attachment(
                             item.attachment, item.volume, item.user
                         )
-                    else:
-                        source = await YTDLSource.from_url(
-                            item.url, item.locale, item.volume, item.user
-                        )
+                    elif source is None:
+                        source = await YTDLSource.from_item(item)
                 except Exception as e:
                     await channel.send(f"❌ 音声の読み込みに失敗しました: {e}")
                     continue
                 
-                # 再生開始
+                # 再生開始（先読み・シーク・音量変更で作り直したソースは数えない）
+                if disk_cache is not None:
+                    disk_cache.record_play(source.info)
+                
                 embed = self.create_now_playing_embed(source, voice_client)
                 view = create_control_view(False, state.loop, state.shuffle)
                 
                 message = await channel.send(embed=embed, view=view)
                 state.last_message = message.id
                 
+                # 再生終了は送信スレッドのafterコールバックから通知される
+                track_done = state.track_done = asyncio.Event()
+                
                 def after_playing(error):
                     if error:
-                        print(f"Player error: {error}")
-                    asyncio.run_coroutine_threadsafe(
-                        state.set_playing(False), self.bot.loop
-                    )
+                        _log.error(f"Player error in guild {guild.id}: {error}")
+                    self.bot.loop.call_soon_threadsafe(track_done.set)
                 
+                state.source = source
                 voice_client.play(source, after=after_playing)
                 await state.set_playing(True)
                 
-                # 再生監視ループ（プログレスバー更新）
-                update_interval = 5  # 5秒ごとに更新
-                last_update = 0
+                # プログレスバーはprogress_loopがまとめて更新する
+                state.now_playing = message
                 
-                while state.playing and voice_client.is_connected():
-                    await asyncio.sleep(1)
-                    
-                    # 再生時間を更新
-                    if voice_client.source:
-                        current_source = voice_client.source
-                        if hasattr(current_source, 'original'):
-                            current_source = current_source.original
-                        
-                        if hasattr(current_source, 'progress') and not voice_client.is_paused():
-                            current_source.progress += 1
-                    
-                    # 定期的に埋め込みを更新
-                    last_update += 1
-                    if last_update >= update_interval and not voice_client.is_paused():
-                        try:
-                            updated_embed = self.create_now_playing_embed(
-                                current_source, voice_client
-                            )
-                            view = create_control_view(
-                                voice_client.is_paused(),
-                                state.loop,
-                                state.shuffle
-                            )
-                            await message.edit(embed=updated_embed, view=view)
-                            last_update = 0
-                        except:
-                            pass
+                # 再生中に次の曲を先読み
+                state.prefetch()
+                
+                await track_done.wait()
+                # シーク・音量変更で差し替えた場合は、最後に再生していたソースで終了メッセージを作る
+                finished = state.source or source
+                state.source = None
+                state.track_done = None
+                state.now_playing = None
+                self.updater.forget(message.id)
+                await state.set_playing(False)
                 
                 # ループが有効な場合は同じ曲を再度再生
                 if state.loop and voice_client.is_connected():
@@ -556,11 +1104,8 @@ class MusicCog(commands.Cog):
                 
                 # ループの場合は終了メッセージを表示しない
                 if not state.loop:
-                    embed = self.create_now_playing_embed(source, voice_client, finished=True)
-                    try:
-                        await message.edit(embed=embed, view=None)
-                    except:
-                        pass
+                    embed = self.create_now_playing_embed(finished, voice_client, finished=True)
+                    await self.updater.edit_now(message, embed, None)
         
         except Exception as e:
             traceback.print_exc()
@@ -570,70 +1115,154 @@ class MusicCog(commands.Cog):
             await channel.send("🎵 再生を終了しました。")
             if voice_client and voice_client.is_connected():
                 await voice_client.disconnect()
+            if audio_nodes is not None:
+                audio_nodes.release(guild.id)
             state.reset()
 
     async def add_to_queue(self, interaction: discord.Interaction, url: str, volume: float):
         """キューに音楽を追加"""
-        state = self.guild_states[interaction.guild.id]
+        state = self.get_state(interaction.guild.id)
         
         try:
-            _log = logging.getLogger("music")
             _log.info(f"Adding to queue: {url}")
             
             # プレイリストかどうか確認
             result = await isPlayList(url, interaction.locale)
             
-            _log.info(f"Result from isPlayList: {result}")
+            if isinstance(result, list):
+                _log.info(f"Result from isPlayList: playlist head with {len(result)} items")
+            else:
+                _log.info(f"Result from isPlayList: {result.get('title')}")
+            
+            items = items_from_result(result, url, interaction.user, volume, interaction.locale)
             
             if isinstance(result, list):
                 # プレイリストの場合
-                added_count = 0
-                for item_data in result:
-                    if item_data.get('url') and item_data.get('title'):
-                        item = Item(
-                            user=interaction.user,
-                            url=item_data['url'],
-                            title=item_data['title'],
-                            volume=volume,
-                            locale=interaction.locale
-                        )
-                        state.queue.put(item)
-                        added_count += 1
+                for item in items:
+                    state.queue.put(item)
+                added_count = len(items)
+                
+                # 先頭だけで上限に達した場合は残りをバックグラウンドで取り込む
+                # （取得できない曲を除く前の件数で判定・再開する）
+                has_more = result.raw_count >= PLAYLIST_HEAD_SIZE
                 
                 if added_count > 0:
                     await interaction.followup.send(
                         f"✅ **{added_count}曲**をキューに追加しました！"
                     )
+                elif has_more:
+                    await interaction.followup.send(
+                        "⚠️ 先頭の曲を取得できませんでした。残りを読み込みます。"
+                    )
                 else:
                     await interaction.followup.send(
-                        f"⚠️ プレイリストから曲を取得できませんでした。"
+                        "⚠️ プレイリストから曲を取得できませんでした。"
+                    )
+                
+                if has_more:
+                    self.start_import(
+                        state, interaction.channel, interaction.user, url, volume,
+                        result.raw_count + 1, interaction.locale
                     )
             else:
                 # 単一の曲の場合
-                title = result.get('title', '不明なタイトル')
-                video_url = result.get('url', url)
+                item = items[0]
                 
-                _log.info(f"Single video - Title: {title}, URL: {video_url}")
+                _log.info(f"Single video - Title: {item.title}, URL: {item.url}")
                 
-                item = Item(
-                    user=interaction.user,
-                    url=video_url,
-                    title=title,
-                    volume=volume,
-                    locale=interaction.locale
-                )
                 state.queue.put(item)
                 
                 await interaction.followup.send(
-                    f"✅ **{title}** をキューに追加しました！"
+                    f"✅ **{item.title}** をキューに追加しました！"
                 )
+            
+            state.prefetch()
         
+        except ExecutorSaturated as e:
+            await interaction.followup.send(f"⏳ {e}")
         except Exception as e:
             _log.error(f"Error adding to queue: {e}")
             import traceback
             traceback.print_exc()
             await interaction.followup.send(f"❌ URLの処理に失敗しました: {e}")
 
+    def start_import(
+        self,
+        state: GuildState,
+        channel: discord.abc.Messageable,
+        user: discord.abc.User,
+        url: str,
+        volume: float,
+        start: int,
+        locale: Optional[discord.Locale] = None
+    ):
+        """プレイリストのstart曲目以降の取り込みを開始（実行中の取り込みは中止）"""
+        state.cancel_import()
+        state.importer = asyncio.create_task(
+            self.import_playlist(state, channel, user, url, volume, start, locale)
+        )
+
+    async def import_playlist(
+        self,
+        state: GuildState,
+        channel: discord.abc.Messageable,
+        user: discord.abc.User,
+        url: str,
+        volume: float,
+        start: int,
+        locale: Optional[discord.Locale] = None
+    ):
+        """プレイリストのstart曲目以降をバックグラウンドでキューに追加"""
+        added_count = 0
+        last_edit = time.monotonic()
+        
+        # インタラクションのトークンは15分で失効するため、通常のメッセージで進捗を表示
+        progress = await channel.send("📥 プレイリストの残りを読み込んでいます...")
+        
+        try:
+            async for batch in iter_playlist(url, start):
+                for item_data in batch:
+                    if item_data.get('url') and item_data.get('title'):
+                        state.queue.put(Item(
+                            user=user,
+                            url=item_data['url'],
+                            title=item_data['title'],
+                            volume=volume,
+                            locale=locale
+                        ))
+                        added_count += 1
+                state.prefetch()
+                
+                # 進捗の更新は5秒に1回まで
+                if time.monotonic() - last_edit >= 5:
+                    await progress.edit(
+                        content=f"📥 プレイリストを読み込み中... **{added_count}曲**追加済み"
+                    )
+                    last_edit = time.monotonic()
+            
+            _log.info(f"Playlist import finished: {added_count} items from {url}")
+            await progress.edit(
+                content=f"✅ プレイリストの残り **{added_count}曲** をキューに追加しました！"
+            )
+        
+        except asyncio.CancelledError:
+            _log.info(f"Playlist import cancelled after {added_count} items")
+            try:
+                await progress.edit(
+                    content=f"⏹️ プレイリストの読み込みを中止しました（{added_count}曲追加済み）"
+                )
+            except discord.HTTPException:
+                pass
+            raise
+        except Exception as e:
+            _log.error(f"Error importing playlist: {e}")
+            try:
+                await progress.edit(
+                    content=f"❌ プレイリストの読み込みに失敗しました（{added_count}曲追加済み）: {e}"
+                )
+            except discord.HTTPException:
+                pass
+
     async def check_permissions(self, interaction: discord.Interaction, url: str = None) -> bool:
         """必要な権限をチェック"""
         user = interaction.user
@@ -696,7 +1325,7 @@ class MusicCog(commands.Cog):
         await self.add_to_queue(interaction, url, volume)
         
         # 再生開始
-        state = self.guild_states[interaction.guild.id]
+        state = self.get_state(interaction.guild.id)
         if not state.playing:
             await self.play_next(interaction.guild, interaction.channel)
 
@@ -731,13 +1360,14 @@ class MusicCog(commands.Cog):
             await interaction.user.voice.channel.connect(self_deaf=True)
         
         # キューに追加
-        state = self.guild_states[interaction.guild.id]
+        state = self.get_state(interaction.guild.id)
         item = Item(
             user=interaction.user,
             attachment=file,
             volume=volume
         )
         state.queue.put(item)
+        state.prefetch()
         
         await interaction.followup.send(
             f"✅ **{file.filename}** をキューに追加しました！"
@@ -806,7 +1436,7 @@ class MusicCog(commands.Cog):
                     await interaction.user.voice.channel.connect(self_deaf=True)
                 
                 # キューに追加
-                state = self.guild_states[interaction.guild.id]
+                state = self.get_state(interaction.guild.id)
                 item = Item(
                     user=interaction.user,
                     url=f"https://www.youtube.com/watch?v={selected_result['id']}",
@@ -815,6 +1445,7 @@ class MusicCog(commands.Cog):
                     locale=interaction.locale
                 )
                 state.queue.put(item)
+                state.prefetch()
                 
                 await select_interaction.followup.send(
                     f"✅ **{selected_result['title']}** をキューに追加しました！"
@@ -835,6 +1466,8 @@ class MusicCog(commands.Cog):
             
             await interaction.followup.send(embed=embed, view=view, ephemeral=True)
         
+        except ExecutorSaturated as e:
+            await interaction.followup.send(f"⏳ {e}", ephemeral=True)
         except Exception as e:
             await interaction.followup.send(
                 f"❌ 検索中にエラーが発生しました: {e}", ephemeral=True
@@ -896,7 +1529,7 @@ class MusicCog(commands.Cog):
         await voice_client.disconnect()
         
         if interaction.guild.id in self.guild_states:
-            self.guild_states[interaction.guild.id].reset()
+            self.get_state(interaction.guild.id).reset()
         
         await interaction.response.send_message("⏹️ 音楽を停止しました。")
 
@@ -909,7 +1542,7 @@ class MusicCog(commands.Cog):
             )
             return
         
-        state = self.guild_states[interaction.guild.id]
+        state = self.get_state(interaction.guild.id)
         queue = state.queue
         
         if queue.empty():
@@ -959,19 +1592,55 @@ class MusicCog(commands.Cog):
             )
             return
         
-        source = voice_client.source
-        if hasattr(source, 'original'):
-            source = source.original
+        source = get_playing_source(voice_client)
+        state = self.get_state(interaction.guild.id)
         
         embed = self.create_now_playing_embed(source, voice_client)
         view = create_control_view(
             voice_client.is_paused(),
-            self.guild_states[interaction.guild.id].loop,
-            self.guild_states[interaction.guild.id].shuffle
+            state.loop,
+            state.shuffle
         )
         
         await interaction.response.send_message(embed=embed, view=view)
 
+    @app_commands.command(name="seek", description="再生位置を移動します")
+    @app_commands.rename(target="time")
+    @app_commands.describe(target="移動先の時間 (例: 90, 1:30, 1:02:03)")
+    async def seek(self, interaction: discord.Interaction, target: str):
+        """シーク"""
+        voice_client = interaction.guild.voice_client
+        
+        if not voice_client or not voice_client.source:
+            await interaction.response.send_message(
+                "❌ 再生中の音楽がありません。", ephemeral=True
+            )
+            return
+        
+        target = target.strip()
+        if not re.fullmatch(r"\d+(:\d{1,2}){0,2}", target):
+            await interaction.response.send_message(
+                "❌ 時間は `90`、`1:30`、`1:02:03` の形式で指定してください。", ephemeral=True
+            )
+            return
+        
+        source = get_playing_source(voice_client)
+        position = parseTime(target)
+        if source.info.duration and position >= source.info.duration:
+            await interaction.response.send_message(
+                f"❌ 曲の長さ（{formatTime(source.info.duration)}）を超えています。", ephemeral=True
+            )
+            return
+        
+        await interaction.response.defer()
+        state = self.get_state(interaction.guild.id)
+        async with state.commands.lock:
+            state.source, latency = await seek_source(voice_client, get_playing_source(voice_client), position)
+        
+        await interaction.followup.send(
+            f"⏩ {formatTime(position)} に移動しました。{format_seek_latency(latency)}"
+        )
+
     @app_commands.command(name="volume", description="音量を調整します")
     @app_commands.describe(volume="音量 (0.0-2.0)")
     async def volume(
@@ -988,17 +1657,13 @@ class MusicCog(commands.Cog):
             )
             return
         
-        # PCMVolumeTransformerの場合、originalソースにアクセス
-        source = voice_client.source
-        if hasattr(source, 'original'):
-            source = source.original
-        
-        source.volume = volume
-        
-        if interaction.guild.id in self.guild_states:
-            await self.guild_states[interaction.guild.id].set_volume(volume)
+        await interaction.response.defer()
+        state = self.get_state(interaction.guild.id)
+        async with state.commands.lock:
+            state.source = set_source_volume(voice_client, get_playing_source(voice_client), volume)
+        await state.set_volume(volume)
         
-        await interaction.response.send_message(
+        await interaction.followup.send(
             f"🔊 音量を {int(volume * 100)}% に設定しました。"
         )
 
@@ -1011,7 +1676,7 @@ class MusicCog(commands.Cog):
             )
             return
         
-        state = self.guild_states[interaction.guild.id]
+        state = self.get_state(interaction.guild.id)
         queue_size = state.queue.qsize()
         
         if queue_size == 0:
@@ -1020,7 +1685,9 @@ class MusicCog(commands.Cog):
             )
             return
         
+        state.cancel_import()
         state.queue.clear()
+        state.prefetcher.invalidate()
         await interaction.response.send_message(
             f"🗑️ キューから {queue_size} 曲を削除しました。"
         )
@@ -1042,18 +1709,23 @@ class MusicCog(commands.Cog):
         if not await self.check_permissions(interaction, url):
             return
         
-        await interaction.response.defer()
-        
-        # ボイスチャンネルに接続
-        if not interaction.guild.voice_client:
-            await interaction.user.voice.channel.connect(self_deaf=True)
-        
-        # キューに追加
-        await self.add_to_queue(interaction, url, volume)
+        if len(self.alarms.for_guild(interaction.guild.id)) >= ALARM_MAX_PER_GUILD:
+            await interaction.response.send_message(
+                f"❌ 設定できるアラームは{ALARM_MAX_PER_GUILD}件までです。", ephemeral=True
+            )
+            return
         
-        # アラーム設定
-        state = self.guild_states[interaction.guild.id]
-        state.alarm = True
+        # ボイスチャンネルへの接続と曲の解決は再生の直前に行う
+        alarm = self.alarms.add(
+            guild_id=interaction.guild.id,
+            channel_id=interaction.channel.id,
+            voice_channel_id=interaction.user.voice.channel.id,
+            user_id=interaction.user.id,
+            url=url,
+            volume=volume,
+            delay=seconds,
+            locale=str(interaction.locale)
+        )
         
         embed = discord.Embed(
             title="⏰ アラームを設定しました",
@@ -1061,25 +1733,103 @@ class MusicCog(commands.Cog):
             color=discord.Color.green()
         )
         embed.add_field(
-            name="⚠️ 注意",
-            value="アラーム設定中はボイスチャンネルに接続し続けます。\n"
-                  "電池の消費にご注意ください。",
+            name="🔢 アラームID",
+            value=f"`{alarm.id}`（`/alarmcancel {alarm.id}` で取り消し）",
             inline=False
         )
         
-        await interaction.followup.send(embed=embed)
+        await interaction.response.send_message(embed=embed)
+
+    @app_commands.command(name="alarmlist", description="設定中のアラームを表示します")
+    async def alarm_list(self, interaction: discord.Interaction):
+        """アラーム一覧"""
+        alarms = self.alarms.for_guild(interaction.guild.id)
         
-        # 待機
-        for _ in range(seconds):
-            if not state.alarm:
-                return
-            await asyncio.sleep(1)
+        if not alarms:
+            await interaction.response.send_message(
+                "⏰ 設定中のアラームはありません。", ephemeral=True
+            )
+            return
         
-        state.alarm = False
+        lines = [
+            f"`{alarm.id}` - {discord.utils.format_dt(datetime.fromtimestamp(alarm.due, timezone.utc), 'R')} {alarm.url}"
+            for alarm in alarms
+        ]
+        embed = discord.Embed(
+            title="⏰ アラーム一覧",
+            description="\n".join(lines),
+            color=discord.Color.blue()
+        )
+        
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @app_commands.command(name="alarmcancel", description="アラームを取り消します")
+    @app_commands.describe(alarm_id="取り消すアラームのID（省略するとすべて）")
+    async def alarm_cancel(self, interaction: discord.Interaction, alarm_id: Optional[int] = None):
+        """アラーム取り消し"""
+        cancelled = self.alarms.cancel(interaction.guild.id, alarm_id)
+        
+        if cancelled == 0:
+            await interaction.response.send_message(
+                "❌ 該当するアラームがありません。", ephemeral=True
+            )
+            return
+        
+        await interaction.response.send_message(
+            f"🗑️ アラームを {cancelled} 件取り消しました。"
+        )
+
+    async def prepare_alarm(self, alarm: Alarm):
+        """アラームの曲を再生前に解決しておく"""
+        await self.bot.wait_until_ready()
+        try:
+            alarm.prepared = await isPlayList(alarm.url)
+        except Exception as e:
+            # 再生時にもう一度解決する
+            _log.warning(f"Failed to prepare alarm {alarm.id}: {e}")
+
+    async def fire_alarm(self, alarm: Alarm):
+        """アラームの時刻になったらボイスチャンネルに接続して再生"""
+        await self.bot.wait_until_ready()
+        
+        guild = self.bot.get_guild(alarm.guild_id)
+        if guild is None:
+            _log.info(f"Alarm {alarm.id} skipped: guild {alarm.guild_id} not found")
+            return
+        
+        channel = guild.get_channel(alarm.channel_id)
+        voice_channel = guild.get_channel(alarm.voice_channel_id)
+        if channel is None or voice_channel is None:
+            _log.info(f"Alarm {alarm.id} skipped: channel not found")
+            return
+        
+        state = self.get_state(guild.id, touch=False)
+        user = guild.get_member(alarm.user_id) or guild.me
+        locale = discord.Locale(alarm.locale) if alarm.locale else None
+        
+        try:
+            result = alarm.prepared or await isPlayList(alarm.url, locale)
+            for item in items_from_result(result, alarm.url, user, alarm.volume, locale):
+                state.queue.put(item)
+            
+            # add_to_queueと同じく、先頭だけで上限に達したプレイリストは残りを取り込む
+            if isinstance(result, list) and result.raw_count >= PLAYLIST_HEAD_SIZE:
+                self.start_import(
+                    state, channel, user, alarm.url, alarm.volume, result.raw_count + 1, locale
+                )
+            
+            if not guild.voice_client:
+                await voice_channel.connect(self_deaf=True)
+        except Exception as e:
+            _log.error(f"Alarm {alarm.id} failed: {e}")
+            await channel.send(f"❌ アラームの再生に失敗しました: {e}")
+            return
+        
+        await channel.send(f"⏰ アラームの時刻です（ID: `{alarm.id}`）")
         
         # 再生開始
         if not state.playing:
-            await self.play_next(interaction.guild, interaction.channel)
+            await self.play_next(guild, channel)
 
 
 async def setup(bot: commands.Bot):
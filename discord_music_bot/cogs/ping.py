@@ -1,7 +1,9 @@
 import time
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
+
+from utils.shards import ShardEventRate, format_latency, iter_shards
 
 
 class PingCog(commands.Cog):
@@ -11,6 +13,31 @@ class PingCog(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.event_rate = ShardEventRate()
+
+    async def cog_load(self):
+        """コグ読み込み時にイベントレートの計測を開始"""
+        self.sample_loop.start()
+
+    async def cog_unload(self):
+        """コグ解除時に計測を停止"""
+        self.sample_loop.cancel()
+
+    @tasks.loop(seconds=10)
+    async def sample_loop(self):
+        """シャードごとのイベント受信レートを計測"""
+        self.event_rate.sample(self.bot)
+
+    def shard_lines(self, current: int = None, limit: int = 10) -> str:
+        """シャードごとのレイテンシとイベントレートの表示"""
+        lines = []
+        for shard_id, _, latency in iter_shards(self.bot)[:limit]:
+            marker = "▶" if shard_id == current else "・"
+            lines.append(
+                f"{marker} #{shard_id}: {format_latency(latency)} / "
+                f"{self.event_rate.rate(shard_id):.1f} events/s"
+            )
+        return "\n".join(lines)
 
     @app_commands.command(name="ping", description="Botの応答速度を確認します")
     async def ping(self, interaction: discord.Interaction):
@@ -59,6 +86,14 @@ class PingCog(commands.Cog):
             inline=True
         )
         
+        # シャードごとの状態（このサーバーのシャードに印を付ける）
+        shard_id = interaction.guild.shard_id if interaction.guild else None
+        embed.add_field(
+            name=f"シャード（{self.bot.shard_count or 1}個）",
+            value=f"```{self.shard_lines(shard_id)}```",
+            inline=False
+        )
+        
         await interaction.edit_original_response(embed=embed)
 
 
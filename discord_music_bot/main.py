@@ -7,6 +7,8 @@ import discord
 import dotenv
 from discord.ext import commands
 
+from utils.cluster import ClusterClient
+
 # .envファイルから環境変数を読み込み
 dotenv.load_dotenv()
 
@@ -20,12 +22,50 @@ intents.guilds = True
 intents.voice_states = True
 intents.emojis = True
 
-# Botインスタンス作成
-bot = commands.Bot(
+# シャード数と、このプロセスが担当するシャードID（カンマ区切り）。未指定の場合はDiscordの推奨値を使う
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+SHARD_IDS = (
+    [int(shard_id) for shard_id in os.getenv("SHARD_IDS").split(",")]
+    if os.getenv("SHARD_IDS") else None
+)
+
+# discord.pyはSHARD_COUNTの無いSHARD_IDSを起動時の例外で拒否するため、先に分かりやすく知らせる
+if SHARD_IDS is not None:
+    if SHARD_COUNT is None:
+        print("❌ SHARD_IDSを指定する場合はSHARD_COUNTも指定してください。", file=sys.stderr)
+        sys.exit(1)
+    if any(not 0 <= shard_id < SHARD_COUNT for shard_id in SHARD_IDS):
+        print(f"❌ SHARD_IDSは0以上SHARD_COUNT（{SHARD_COUNT}）未満で指定してください。", file=sys.stderr)
+        sys.exit(1)
+
+# クラスターモードで起動された場合のスーパーバイザーへの接続
+cluster = (
+    ClusterClient(
+        os.getenv("CLUSTER_SOCKET"),
+        int(os.getenv("CLUSTER_ID", "0")),
+        float(os.getenv("CLUSTER_REPORT_INTERVAL", "15")),
+    )
+    if os.getenv("CLUSTER_SOCKET") else None
+)
+
+
+class MusicBot(commands.AutoShardedBot):
+    async def before_identify_hook(self, shard_id, *, initial=False):
+        """クラスターモードではIDENTIFYの間隔をスーパーバイザーに合わせる"""
+        if cluster is not None:
+            await cluster.identify(shard_id)
+        else:
+            await super().before_identify_hook(shard_id, initial=initial)
+
+
+# Botインスタンス作成（ゲートウェイ接続をシャードに分割）
+bot = MusicBot(
     command_prefix="music#",
     intents=intents,
     member_cache_flags=discord.MemberCacheFlags.none(),
     max_messages=None,
+    shard_count=SHARD_COUNT,
+    shard_ids=SHARD_IDS,
 )
 
 # ログ設定
@@ -51,6 +91,12 @@ async def on_ready():
     _log.info(f"Logged in as {bot.user.name}")
     _log.info(f"Bot ID: {bot.user.id}")
     _log.info(f"Connected to {len(bot.guilds)} servers")
+    _log.info(f"Shards: {sorted(bot.shards)} / {bot.shard_count}")
+
+
+@bot.event
+async def on_shard_ready(shard_id: int):
+    _log.info(f"Shard {shard_id} is ready")
 
 
 @bot.event
@@ -59,7 +105,12 @@ async def setup_hook():
     await bot.load_extension("cogs.music")
     await bot.load_extension("cogs.ping")
     await bot.load_extension("cogs.help")
-    await bot.tree.sync()
+    await bot.load_extension("cogs.metrics")
+    # 子プロセスが同時にコマンドを同期しないよう、クラスターでは最初のプロセスのみ同期する
+    if cluster is None or cluster.cluster_id == 0:
+        await bot.tree.sync()
+    if cluster is not None:
+        cluster.start(bot)
     _log.info("All cogs loaded and slash commands synced")
 
 
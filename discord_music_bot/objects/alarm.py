@@ -0,0 +1,312 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+_log = logging.getLogger("music")
+
+
+class Alarm:
+    """
+    設定されたアラーム
+    """
+    __slots__ = (
+        "id",
+        "guild_id",
+        "channel_id",
+        "voice_channel_id",
+        "user_id",
+        "url",
+        "volume",
+        "locale",
+        "due",
+        "prepared",
+    )
+
+    def __init__(
+        self,
+        *,
+        id: int,
+        guild_id: int,
+        channel_id: int,
+        voice_channel_id: int,
+        user_id: int,
+        url: str,
+        volume: float,
+        due: float,
+        locale: Optional[str] = None,
+    ):
+        self.id: int = id
+        self.guild_id: int = guild_id
+        self.channel_id: int = channel_id  # 通知を送るテキストチャンネル
+        self.voice_channel_id: int = voice_channel_id
+        self.user_id: int = user_id
+        self.url: str = url
+        self.volume: float = volume
+        self.locale: Optional[str] = locale
+        self.due: float = due  # 再生する時刻（UNIX時間）
+        self.prepared: Any = None  # 事前に解決した曲の情報（保存しない）
+
+    def to_dict(self) -> Dict[str, Any]:
+        """保存用の辞書に変換"""
+        return {
+            "id": self.id,
+            "guild_id": self.guild_id,
+            "channel_id": self.channel_id,
+            "voice_channel_id": self.voice_channel_id,
+            "user_id": self.user_id,
+            "url": self.url,
+            "volume": self.volume,
+            "locale": self.locale,
+            "due": self.due,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Alarm":
+        """保存された辞書から作成"""
+        return cls(**data)
+
+    def __repr__(self) -> str:
+        return f"<Alarm: {self.id}, guild: {self.guild_id}, due: {self.due:.0f}>"
+
+
+# 再生の準備と再生の段階
+_PREPARE = 0
+_FIRE = 1
+
+
+class AlarmScheduler:
+    """
+    全サーバーのアラームを1つのタスクで管理するスケジューラー
+    次の時刻をヒープで管理し、再生の少し前に曲を解決して、時刻になったら再生する
+    アラームはファイルに保存し、再起動後も引き継ぐ
+    （変更のたびには書き出さず、save_delay秒ごとにまとめて別スレッドで書き出す）
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        prepare: Callable[[Alarm], Awaitable[None]],
+        fire: Callable[[Alarm], Awaitable[None]],
+        prepare_ahead: float = 60.0,
+        missed_grace: float = 300.0,
+        save_delay: float = 5.0,
+    ):
+        self.path: Path = path
+        self.prepare_ahead: float = prepare_ahead
+        self.missed_grace: float = missed_grace  # 停止中に時刻を過ぎたアラームを再生する猶予
+        self.save_delay: float = save_delay
+        self._prepare = prepare
+        self._fire = fire
+        self._alarms: Dict[int, Alarm] = {}
+        self._heap: List[Tuple[float, int, int, int]] = []
+        self._counter = itertools.count()
+        self._next_id: int = 1
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: set = set()
+        self._dirty: bool = False  # 書き出していない変更があるか
+        self._saver: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+        self.fired: int = 0
+        self.missed: int = 0
+
+    def _load(self):
+        """保存されたアラームを読み込む"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            _log.warning(f"Could not read alarms: {e}")
+            return
+
+        self._next_id = data.get("next_id", 1)
+        now = time.time()
+        for entry in data.get("alarms", []):
+            alarm = Alarm.from_dict(entry)
+            if alarm.due < now - self.missed_grace:
+                self.missed += 1
+                _log.info(f"Discarding missed alarm {alarm.id} for guild {alarm.guild_id}")
+                continue
+            self._push(alarm)
+
+        _log.info(f"Alarms loaded: {len(self._alarms)} pending")
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {
+            "next_id": self._next_id,
+            "alarms": [alarm.to_dict() for alarm in self._alarms.values()],
+        }
+
+    def _write(self, data: Dict[str, Any]):
+        """アラームを一時ファイルに書き出してから置き換える"""
+        with self._write_lock:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_suffix(".tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                _log.warning(f"Could not write alarms: {e}")
+
+    def _save(self):
+        """変更を記録し、save_delay秒後にまとめて書き出す"""
+        self._dirty = True
+        if self._saver is None or self._saver.done():
+            self._saver = asyncio.create_task(self._save_later())
+
+    async def _save_later(self):
+        await asyncio.sleep(self.save_delay)
+        self._dirty = False
+        await asyncio.to_thread(self._write, self._snapshot())
+
+    def flush(self):
+        """書き出していない変更があれば、すぐに書き出す（停止時に呼ぶ）"""
+        if self._saver is not None:
+            self._saver.cancel()
+            self._saver = None
+        if self._dirty:
+            self._dirty = False
+            self._write(self._snapshot())
+
+    def _push(self, alarm: Alarm):
+        """アラームを登録し、準備と再生の時刻をヒープに追加"""
+        self._alarms[alarm.id] = alarm
+        prepare_at = alarm.due - self.prepare_ahead
+        if prepare_at > time.time():
+            heapq.heappush(self._heap, (prepare_at, next(self._counter), alarm.id, _PREPARE))
+        heapq.heappush(self._heap, (alarm.due, next(self._counter), alarm.id, _FIRE))
+
+    def start(self):
+        """保存されたアラームを読み込み、スケジューラーを起動"""
+        if self._task is not None and not self._task.done():
+            return
+        self._load()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """スケジューラーを停止し、書き出していない変更を保存"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.flush()
+
+    def add(
+        self,
+        *,
+        guild_id: int,
+        channel_id: int,
+        voice_channel_id: int,
+        user_id: int,
+        url: str,
+        volume: float,
+        delay: float,
+        locale: Optional[str] = None,
+    ) -> Alarm:
+        """アラームを追加"""
+        alarm = Alarm(
+            id=self._next_id,
+            guild_id=guild_id,
+            channel_id=channel_id,
+            voice_channel_id=voice_channel_id,
+            user_id=user_id,
+            url=url,
+            volume=volume,
+            locale=locale,
+            due=time.time() + delay,
+        )
+        self._next_id += 1
+        self._push(alarm)
+        self._save()
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return alarm
+
+    def cancel(self, guild_id: int, alarm_id: Optional[int] = None) -> int:
+        """アラームを取り消し、取り消した数を返す（IDを省略した場合はサーバーの全て）"""
+        targets = [
+            alarm for alarm in self._alarms.values()
+            if alarm.guild_id == guild_id and (alarm_id is None or alarm.id == alarm_id)
+        ]
+        # ヒープからは取り出す際に取り除く
+        for alarm in targets:
+            del self._alarms[alarm.id]
+        if targets:
+            self._compact()
+            self._save()
+        return len(targets)
+
+    def for_guild(self, guild_id: int) -> List[Alarm]:
+        """サーバーのアラームを時刻順に取得"""
+        return sorted(
+            (alarm for alarm in self._alarms.values() if alarm.guild_id == guild_id),
+            key=lambda alarm: alarm.due,
+        )
+
+    def _compact(self):
+        """取り消されたアラームが多く残っている場合はヒープを作り直す"""
+        if len(self._heap) > 2 * len(self._alarms) + 64:
+            self._heap = [entry for entry in self._heap if entry[2] in self._alarms]
+            heapq.heapify(self._heap)
+
+    async def _run(self):
+        """時刻になったアラームを順に処理"""
+        while True:
+            # 取り消されたアラームを読み飛ばす
+            while self._heap and self._heap[0][2] not in self._alarms:
+                heapq.heappop(self._heap)
+
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            when, _, alarm_id, stage = self._heap[0]
+            delay = when - time.time()
+            if delay > 0:
+                # 時計の変更に備え、長い待機は区切る
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(delay, 60.0))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            alarm = self._alarms[alarm_id]
+            if stage == _FIRE:
+                del self._alarms[alarm_id]
+                self._save()
+                self.fired += 1
+                self._spawn(self._fire, alarm)
+            else:
+                self._spawn(self._prepare, alarm)
+
+    def _spawn(self, func: Callable[[Alarm], Awaitable[None]], alarm: Alarm):
+        """アラームの処理を別のタスクで実行（スケジューラーを止めない）"""
+        task = asyncio.create_task(func(alarm))
+        self._running.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            _log.error(f"Alarm task failed: {task.exception()!r}")
+
+    def __len__(self) -> int:
+        return len(self._alarms)
+
+    def __repr__(self) -> str:
+        return f"<AlarmScheduler: {len(self._alarms)} pending>"
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional
+
+import discord
+
+
+_log = logging.getLogger("music")
+
+# 実行する処理（最後に受け付けたインタラクションと、まとめたクリック数を受け取る）
+CommandRunner = Callable[[discord.Interaction, int], Awaitable[None]]
+
+
+class _Command:
+    """実行待ちの操作"""
+    __slots__ = (
+        "name",
+        "runner",
+        "interaction",
+        "count",
+        "coalesce",
+        "created_at",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        runner: CommandRunner,
+        interaction: discord.Interaction,
+        coalesce: bool,
+    ):
+        self.name: str = name
+        self.runner: CommandRunner = runner
+        self.interaction: discord.Interaction = interaction
+        self.count: int = 1
+        self.coalesce: bool = coalesce
+        self.created_at: float = time.monotonic()
+
+
+class CommandQueue:
+    """
+    サーバーごとの再生操作を1つずつ順に実行するキュー
+    まとめられる操作は受け付けてから一定時間待ち、
+    その間に続けて押された同じ操作を1回の実行にまとめる
+    """
+
+    def __init__(self, window: float = 0.4):
+        self.window: float = window
+        self.lock: asyncio.Lock = asyncio.Lock()  # スラッシュコマンドからの操作もこのロックで直列化する
+        self._queue: Deque[_Command] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self.executed: int = 0
+        self.coalesced: int = 0
+
+    def submit(
+        self,
+        name: str,
+        runner: CommandRunner,
+        interaction: discord.Interaction,
+        *,
+        coalesce: bool = False,
+    ):
+        """操作を追加（末尾の未実行の操作と同じであればまとめる）"""
+        tail = self._queue[-1] if self._queue else None
+        if coalesce and tail is not None and tail.coalesce and tail.name == name:
+            tail.count += 1
+            tail.interaction = interaction
+            self.coalesced += 1
+            return
+
+        self._queue.append(_Command(name, runner, interaction, coalesce))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        """キューの操作を順に実行"""
+        while self._queue:
+            command = self._queue[0]
+            if command.coalesce:
+                # 続けて押されたクリックを待つ
+                delay = command.created_at + self.window - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            # 実行を始めた操作にはそれ以上まとめない
+            self._queue.popleft()
+            async with self.lock:
+                try:
+                    await command.runner(command.interaction, command.count)
+                except Exception as e:
+                    _log.error(f"Command {command.name} failed: {e}")
+                    try:
+                        await command.interaction.followup.send(
+                            "エラーが発生しました。", ephemeral=True
+                        )
+                    except discord.HTTPException:
+                        pass
+            self.executed += 1
+
+    def cancel(self):
+        """実行待ちの操作を破棄"""
+        self._queue.clear()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def __repr__(self) -> str:
+        return f"<CommandQueue: {len(self._queue)} pending, window: {self.window}s>"
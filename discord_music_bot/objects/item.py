@@ -1,6 +1,9 @@
+import time
 import discord
 from typing import Optional
 
+from source.source import AudioInfo
+
 
 class Item:
     """
@@ -13,6 +16,8 @@ class Item:
         "user",
         "title",
         "locale",
+        "info",
+        "stream_expires",
     )
 
     def __init__(
@@ -24,6 +29,8 @@ class Item:
         attachment: Optional[discord.Attachment] = None,
         volume: float = 0.5,
         locale: Optional[discord.Locale] = None,
+        info: Optional[AudioInfo] = None,
+        stream_expires: float = 0.0,
     ):
         self.url: Optional[str] = url
         self.title: Optional[str] = title
@@ -31,6 +38,16 @@ class Item:
         self.volume: float = volume
         self.user: discord.Member = user
         self.locale: Optional[discord.Locale] = locale
+        self.info: Optional[AudioInfo] = info  # 解決済みの音声情報（ストリームURLを含む）
+        self.stream_expires: float = stream_expires  # ストリームURLの有効期限（UNIX時間）
+
+    def has_valid_stream(self) -> bool:
+        """解決済みのストリームURLがまだ有効かどうか"""
+        return (
+            self.info is not None
+            and bool(self.info.url)
+            and self.stream_expires > time.time()
+        )
 
     @property
     def name(self) -> str:
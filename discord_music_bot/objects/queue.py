@@ -134,4 +134,8 @@ class Queue:
         """次のアイテムを確認（取得はしない）"""
         if self.empty():
             return None
-        return self.__list[self.__index]
\ No newline at end of file
+        return self.__list[self.__index]
+
+    def peek_ahead(self, count: int) -> Tuple[Any, ...]:
+        """次以降のアイテムを最大count件確認（取得はしない）"""
+        return tuple(self.__list[self.__index : self.__index + count])
\ No newline at end of file
@@ -1,6 +1,20 @@
 import asyncio
+import os
+import time
 from typing import Optional
+
+import discord
+from .commands import CommandQueue
 from .queue import Queue
+from source.prefetch import Prefetcher
+
+
+# 先読みする曲数と、次の曲のFFmpegを事前に起動するかどうか（既定はメタデータと配信URLの解決のみ）
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "2"))
+PREFETCH_SPAWN_FFMPEG = os.getenv("PREFETCH_SPAWN_FFMPEG", "false").lower() == "true"
+
+# 連打されたボタンを1回の操作にまとめる待ち時間（秒）
+BUTTON_COALESCE_WINDOW = float(os.getenv("BUTTON_COALESCE_WINDOW", "0.4"))
 
 
 class GuildState:
@@ -12,9 +26,17 @@ class GuildState:
         "playing",
         "loop",
         "shuffle",
-        "alarm",
         "volume",
         "last_message",
+        "now_playing",
+        "track_done",
+        "source",
+        "prefetcher",
+        "importer",
+        "commands",
+        "last_active",
+        "alone_since",
+        "paused_since",
         "_lock",
     )
 
@@ -23,9 +45,17 @@ class GuildState:
         self.playing: bool = False
         self.loop: bool = False
         self.shuffle: bool = False
-        self.alarm: bool = False
         self.volume: float = 0.5
         self.last_message: Optional[int] = None  # 最後の再生メッセージのID
+        self.now_playing: Optional[discord.Message] = None  # 更新中の再生メッセージ
+        self.track_done: Optional[asyncio.Event] = None  # 再生中の曲の終了通知（afterから設定される）
+        self.source: Optional[discord.AudioSource] = None  # 再生中の曲のソース（シーク・音量変更で差し替えたものを含む）
+        self.prefetcher: Prefetcher = Prefetcher(PREFETCH_DEPTH, PREFETCH_SPAWN_FFMPEG)
+        self.importer: Optional[asyncio.Task] = None  # プレイリストの取り込みタスク
+        self.commands: CommandQueue = CommandQueue(BUTTON_COALESCE_WINDOW)  # ボタン操作のキュー
+        self.last_active: float = time.monotonic()  # 最後に使われた時刻
+        self.alone_since: Optional[float] = None  # ボイスチャンネルに聞いている人がいなくなった時刻
+        self.paused_since: Optional[float] = None  # 一時停止した時刻
         self._lock: asyncio.Lock = asyncio.Lock()
 
     async def set_playing(self, playing: bool):
@@ -47,6 +77,7 @@ class GuildState:
                 self.queue.shuffle()
             else:
                 self.queue.unshuffle()
+            self.prefetch()
             return self.shuffle
 
     async def set_volume(self, volume: float):
@@ -54,15 +85,45 @@ class GuildState:
         async with self._lock:
             self.volume = max(0.0, min(2.0, volume))
 
+    def prefetch(self):
+        """再生中であればキューの次以降の曲を先読み"""
+        if self.playing:
+            self.prefetcher.schedule(self.queue.peek_ahead(self.prefetcher.depth))
+
+    def touch(self):
+        """最後に使われた時刻を更新"""
+        self.last_active = time.monotonic()
+
+    def is_idle(self) -> bool:
+        """再生・取り込み・操作のいずれも行っていないかどうか"""
+        return (
+            not self.playing
+            and self.queue.empty()
+            and (self.importer is None or self.importer.done())
+            and len(self.commands) == 0
+        )
+
+    def cancel_import(self):
+        """実行中のプレイリスト取り込みを中止"""
+        if self.importer is not None and not self.importer.done():
+            self.importer.cancel()
+        self.importer = None
+
     def reset(self):
-        """状態をリセット"""
+        """状態をリセット（実行待ちのボタン操作も破棄する）"""
+        self.cancel_import()
+        self.commands.cancel()
+        self.prefetcher.invalidate()
         self.queue.clear()
         self.playing = False
         self.loop = False
         self.shuffle = False
-        self.alarm = False
         self.volume = 0.5
         self.last_message = None
+        self.now_playing = None
+        self.source = None
+        self.alone_since = None
+        self.paused_since = None
 
     def __repr__(self) -> str:
         return (
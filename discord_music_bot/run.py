@@ -35,8 +35,10 @@ def setup_logging():
     # ログレベルの設定
     log_level = os.getenv("LOG_LEVEL", "INFO").upper()
     
-    # ログフォーマット
-    log_format = "[{asctime}] [{levelname:<8}] {name}: {message}"
+    # ログフォーマット（クラスターの子プロセスはクラスターIDを付ける）
+    cluster_id = os.getenv("CLUSTER_ID")
+    prefix = f"cluster-{cluster_id} " if cluster_id else ""
+    log_format = "[{asctime}] [{levelname:<8}] " + prefix + "{name}: {message}"
     date_format = "%Y-%m-%d %H:%M:%S"
     
     # ルートロガーの設定
@@ -108,6 +110,66 @@ async def run_bot():
         raise
 
 
+def cluster_processes() -> int:
+    """クラスターモードのプロセス数（autoの場合はCPUコア数・子プロセスでは常に1）"""
+    # 子プロセスと、Unixソケットを使えないWindowsでは常に1プロセス
+    if os.getenv("CLUSTER_ID") or sys.platform == "win32":
+        return 1
+    value = os.getenv("CLUSTER_PROCESSES", "1").strip().lower()
+    if value == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(value or "1"))
+
+
+def cluster_env(cluster_id: int) -> dict:
+    """
+    子プロセスごとに分ける保存先（同じファイルを複数のプロセスで書き換えないようにする）
+    ディスクキャッシュもクラスターごとになるため、同じ曲はクラスターごとに保存され、
+    DISK_CACHE_MAX_BYTESもクラスターごとの上限になる
+    """
+    alarm_store = Path(os.getenv("ALARM_STORE", "cache/alarms.json"))
+    cache_dir = Path(os.getenv("DISK_CACHE_DIR", str(project_root / "cache")))
+    return {
+        "ALARM_STORE": str(alarm_store.with_name(f"{alarm_store.stem}-{cluster_id}{alarm_store.suffix}")),
+        "DISK_CACHE_DIR": str(cache_dir / f"cluster-{cluster_id}"),
+    }
+
+
+async def run_cluster(processes: int):
+    """シャードを複数の子プロセスに分けて実行"""
+    import signal
+    from utils.cluster import ClusterSupervisor, fetch_gateway
+    
+    logger = logging.getLogger("music_bot")
+    shard_count, max_concurrency = await fetch_gateway(os.getenv("DISCORD_TOKEN"))
+    if os.getenv("SHARD_COUNT"):
+        shard_count = int(os.getenv("SHARD_COUNT"))
+    if processes > shard_count:
+        logger.warning(f"⚠️  シャード数（{shard_count}）を超えるプロセスは起動しません")
+    
+    supervisor = ClusterSupervisor(
+        [sys.executable, str(project_root / "run.py")],
+        shard_count,
+        processes,
+        str(project_root / "cache" / f"cluster-{os.getpid()}.sock"),
+        max_concurrency=max_concurrency,
+        child_env=cluster_env,
+        report_interval=float(os.getenv("CLUSTER_REPORT_INTERVAL", "15")) * 4,
+        metrics_host=os.getenv("METRICS_HOST", "127.0.0.1"),
+        metrics_port=int(os.getenv("METRICS_PORT", "8080")),
+        health_grace=float(os.getenv("HEALTH_STARTUP_GRACE", "600")),
+    )
+    logger.info(
+        f"🧩 クラスターモード: {len(supervisor.workers)}プロセス・{shard_count}シャード"
+        f"（同時IDENTIFY {max_concurrency}）"
+    )
+    
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, supervisor.stop)
+    await supervisor.run()
+
+
 def main():
     """メイン関数"""
     print("🎵 Discord Music Bot を起動しています...")
@@ -141,8 +203,13 @@ def main():
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
         logger.info("🪟 Windows用のイベントループポリシーを設定しました")
     
-    # ボット実行
+    # ボット実行（CLUSTER_PROCESSESが2以上の場合はスーパーバイザーとして子プロセスを起動）
+    processes = cluster_processes()
     try:
+        if processes > 1:
+            (project_root / "cache").mkdir(exist_ok=True)
+            asyncio.run(run_cluster(processes))
+            return
         logger.info("🚀 ボットを起動中...")
         asyncio.run(run_bot())
     except KeyboardInterrupt:
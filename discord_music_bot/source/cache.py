@@ -0,0 +1,178 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from utils.func import extract_video_id
+
+
+_log = logging.getLogger("music")
+
+
+# 長期間変わらないメタデータ
+META_KEYS = (
+    "id",
+    "title",
+    "webpage_url",
+    "duration",
+    "thumbnail",
+    "uploader",
+    "view_count",
+    "extractor_key",
+)
+
+# 数時間で失効するストリーム情報
+STREAM_KEYS = (
+    "url",
+    "ext",
+    "acodec",
+    "format_id",
+    "protocol",
+    "abr",
+    "asr",
+    "http_headers",
+)
+
+
+class _CacheEntry:
+    """キャッシュの1エントリ"""
+    __slots__ = (
+        "meta",
+        "meta_expires",
+        "stream",
+        "stream_expires",
+        "size",
+    )
+
+    def __init__(self):
+        self.meta: Dict = {}
+        self.meta_expires: float = 0.0
+        self.stream: Dict = {}
+        self.stream_expires: float = 0.0
+        self.size: int = 0
+
+
+class MetadataCache:
+    """
+    動画IDをキーとしたメタデータキャッシュ
+    メタデータとストリームURLで別々のTTLを持ち、バイト数上限を超えるとLRUで削除する
+    """
+
+    def __init__(
+        self,
+        *,
+        max_bytes: int = 8 * 1024 * 1024,
+        meta_ttl: float = 6 * 3600,
+        stream_ttl: float = 20 * 60,
+    ):
+        self.max_bytes: int = max_bytes
+        self.meta_ttl: float = meta_ttl
+        self.stream_ttl: float = stream_ttl
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._aliases: Dict[str, str] = {}
+        self.bytes: int = 0
+        self.hits: int = 0
+        self.stream_hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    @staticmethod
+    def canonical_key(data: Dict) -> Optional[str]:
+        """抽出結果から正規化されたキーを作成"""
+        video_id = data.get("id")
+        if not video_id:
+            return None
+        return f"{data.get('extractor_key') or 'Generic'}:{video_id}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        """URLからキーを求める（YouTube以外は抽出済みのURLのみ）"""
+        video_id = extract_video_id(url)
+        if video_id:
+            return f"Youtube:{video_id}"
+        return self._aliases.get(url)
+
+    def get(self, url: str, *, need_stream: bool = False) -> Optional[Dict]:
+        """有効なキャッシュがあれば情報を返す"""
+        key = self.key_for_url(url)
+        entry = self._entries.get(key) if key else None
+        now = time.monotonic()
+
+        if entry is None or entry.meta_expires <= now:
+            self.misses += 1
+            return None
+        if need_stream and entry.stream_expires <= now:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        data = dict(entry.meta)
+        if entry.stream_expires > now:
+            data.update(entry.stream)
+            data["stream_expires"] = time.time() + (entry.stream_expires - now)
+            if need_stream:
+                self.stream_hits += 1
+        return data
+
+    def put(self, url: str, data: Dict):
+        """抽出結果をキャッシュに保存"""
+        key = self.canonical_key(data)
+        if key is None:
+            return
+
+        now = time.monotonic()
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            entry = _CacheEntry()
+        else:
+            self.bytes -= entry.size
+
+        entry.meta = {k: data[k] for k in META_KEYS if data.get(k) is not None}
+        entry.meta_expires = now + self.meta_ttl
+        # フラット抽出の結果はurlが動画ページなのでformat_idの有無で判定
+        if data.get("url") and data.get("format_id") and data.get("acodec") != "none":
+            entry.stream = {k: data[k] for k in STREAM_KEYS if data.get(k) is not None}
+            entry.stream_expires = now + self.stream_ttl
+        entry.size = len(json.dumps([entry.meta, entry.stream], default=str))
+
+        self._entries[key] = entry
+        self.bytes += entry.size
+        for alias in (url, data.get("webpage_url")):
+            if alias and not extract_video_id(alias):
+                self._aliases[alias] = key
+
+        self._evict()
+
+    def _evict(self):
+        """バイト数上限を超えた分を古い順に削除"""
+        while self.bytes > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self.bytes -= entry.size
+            self.evictions += 1
+            _log.debug(f"Evicted metadata cache entry: {key}")
+
+        if len(self._aliases) > len(self._entries) * 4:
+            self._aliases = {
+                url: key for url, key in self._aliases.items() if key in self._entries
+            }
+
+    def hit_ratio(self) -> float:
+        """ヒット率"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """統計情報"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "stream_hits": self.stream_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hit_ratio(),
+        }
+
+    def __repr__(self) -> str:
+        return f"<MetadataCache: {len(self._entries)} entries, {self.bytes} bytes>"
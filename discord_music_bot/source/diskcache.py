@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+
+_log = logging.getLogger("music")
+
+
+class AudioDiskCache:
+    """
+    よく再生される曲の音声をディスクに保存するキャッシュ
+    「抽出器:動画ID:フォーマット」のハッシュをキーとし、
+    容量上限を超えた場合は最後に再生された時刻が古いものから削除する
+    インデックスは変更のたびには書き出さず、save_delay秒ごとにまとめて別スレッドで書き出す
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        max_bytes: int = 2 * 1024 ** 3,
+        min_plays: int = 2,
+        max_duration: int = 1800,
+        max_downloads: int = 2,
+        download_timeout: float = 300.0,
+        save_delay: float = 10.0,
+    ):
+        self.directory: Path = directory
+        self.max_bytes: int = max_bytes
+        self.min_plays: int = min_plays
+        self.max_duration: int = max_duration
+        self.download_timeout: float = download_timeout
+        self.save_delay: float = save_delay
+        self._entries: Dict[str, Dict] = {}
+        self._plays: Dict[str, int] = {}
+        self._downloading: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()  # 実行中の保存（参照を保持して途中で回収されないようにする）
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._max_downloads: int = max_downloads
+        self._dirty: bool = False  # 書き出していない変更があるか
+        self._saver: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+        self.bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.bytes_saved: int = 0
+        self.evictions: int = 0
+        self._load()
+
+    @staticmethod
+    def make_key(extractor: str, video_id: str, format_id: str) -> str:
+        """キャッシュのキーを作成"""
+        raw = f"{extractor}:{video_id}:{format_id}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.mka"
+
+    def _load(self):
+        """インデックスを読み込み、実在するファイルのみ残す"""
+        index = self.directory / self.INDEX_FILE
+        try:
+            with open(index, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            _log.warning(f"Could not read audio cache index: {e}")
+            return
+
+        for key, entry in entries.items():
+            path = self._path(key)
+            if path.is_file():
+                entry["size"] = path.stat().st_size
+                self._entries[key] = entry
+                self.bytes += entry["size"]
+
+        _log.info(f"Audio cache loaded: {len(self._entries)} files, {self.bytes} bytes")
+
+    def _write(self, entries: Dict[str, Dict]):
+        """インデックスを一時ファイルに書き出してから置き換える"""
+        with self._write_lock:
+            index = self.directory / self.INDEX_FILE
+            tmp = index.with_suffix(".tmp")
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(entries, f)
+                os.replace(tmp, index)
+            except OSError as e:
+                _log.warning(f"Could not write audio cache index: {e}")
+
+    def _snapshot(self) -> Dict[str, Dict]:
+        # 書き出し中にイベントループ側でエントリが変わっても影響しないよう複製する
+        return {key: dict(entry) for key, entry in self._entries.items()}
+
+    def _save(self):
+        """変更を記録し、save_delay秒後にまとめて書き出す"""
+        self._dirty = True
+        if self._saver is None or self._saver.done():
+            self._saver = asyncio.create_task(self._save_later())
+
+    async def _save_later(self):
+        await asyncio.sleep(self.save_delay)
+        self._dirty = False
+        await asyncio.to_thread(self._write, self._snapshot())
+
+    def lookup(self, info) -> Optional[str]:
+        """キャッシュ済みであればローカルファイルのパスを返す（再生回数・ヒット数は数えない）"""
+        if not info.id or not info.format_id:
+            return None
+
+        key = self.make_key(info.extractor, info.id, info.format_id)
+        if key not in self._entries:
+            return None
+
+        path = self._path(key)
+        if not path.is_file():
+            self._remove(key)
+            return None
+        return str(path)
+
+    def record_play(self, info):
+        """曲の再生開始を記録（キャッシュから再生した場合はヒット、それ以外は再生回数を数える）"""
+        if not info.id or not info.format_id:
+            return
+
+        key = self.make_key(info.extractor, info.id, info.format_id)
+        entry = self._entries.get(key)
+        if entry is not None and info.protocol == 'file':
+            entry["last_access"] = time.time()
+            entry["hits"] = entry.get("hits", 0) + 1
+            self.hits += 1
+            self.bytes_saved += entry["size"]
+            self._save()
+            return
+
+        self.misses += 1
+        self.note_play(info)
+
+    def note_play(self, info):
+        """再生回数を記録し、条件を満たせばバックグラウンドで保存する"""
+        if not info.id or not info.format_id or info.protocol not in ("http", "https"):
+            return
+        if not info.duration or info.duration > self.max_duration:
+            return
+
+        key = self.make_key(info.extractor, info.id, info.format_id)
+        if key in self._entries or key in self._downloading:
+            return
+
+        # 再生回数の記録が際限なく増えないようにする
+        if len(self._plays) > 10000:
+            self._plays.clear()
+
+        plays = self._plays.get(key, 0) + 1
+        self._plays[key] = plays
+        if plays < self.min_plays:
+            return
+
+        self._plays.pop(key, None)
+        self._downloading.add(key)
+        task = asyncio.create_task(self._download(key, info))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _download(self, key: str, info):
+        """FFmpegでストリームをそのままファイルに保存"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_downloads)
+
+        path = self._path(key)
+        tmp = path.with_suffix(".part")
+        try:
+            async with self._semaphore:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                process = await asyncio.create_subprocess_exec(
+                    "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+                    "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5",
+                    "-i", info.url, "-vn", "-c:a", "copy", "-f", "matroska", str(tmp),
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                try:
+                    _, stderr = await asyncio.wait_for(
+                        process.communicate(), self.download_timeout
+                    )
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+                    raise
+
+                if process.returncode != 0:
+                    raise RuntimeError(stderr.decode(errors="replace").strip()[-200:])
+
+            os.replace(tmp, path)
+            size = path.stat().st_size
+            self._entries[key] = {
+                "title": info.title,
+                "size": size,
+                "last_access": time.time(),
+                "hits": 0,
+            }
+            self.bytes += size
+            _log.info(f"Cached audio on disk: {info.title} ({size} bytes)")
+            self._evict()
+            self._save()
+        except Exception as e:
+            _log.warning(f"Failed to cache audio for {info.title}: {e!r}")
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+        finally:
+            self._downloading.discard(key)
+
+    def _remove(self, key: str):
+        """エントリとファイルを削除"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry.get("size", 0)
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def _evict(self):
+        """容量上限を超えた分を最後に再生された時刻が古い順に削除"""
+        if self.bytes <= self.max_bytes:
+            return
+        for key in sorted(self._entries, key=lambda k: self._entries[k].get("last_access", 0)):
+            if self.bytes <= self.max_bytes:
+                break
+            self._remove(key)
+            self.evictions += 1
+
+    def flush(self):
+        """書き出していない変更があれば、すぐにインデックスに書き出す（停止時に呼ぶ）"""
+        if self._saver is not None:
+            self._saver.cancel()
+            self._saver = None
+        if self._dirty:
+            self._dirty = False
+            self._write(self._snapshot())
+
+    def hit_ratio(self) -> float:
+        """ヒット率"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """統計情報"""
+        return {
+            "files": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio(),
+            "bytes_saved": self.bytes_saved,
+            "evictions": self.evictions,
+        }
+
+    def __repr__(self) -> str:
+        return f"<AudioDiskCache: {len(self._entries)} files, {self.bytes} bytes>"
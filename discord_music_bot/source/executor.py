@@ -0,0 +1,251 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional
+
+
+_log = logging.getLogger("music")
+
+
+class ExecutorSaturated(Exception):
+    """抽出キューが満杯の際の例外"""
+    pass
+
+
+class Priority(IntEnum):
+    """抽出処理の優先度（値が小さいほど優先）"""
+    PLAY = 0  # 今すぐ再生する曲の解決
+    SEARCH = 1  # 検索
+    PREFETCH = 2  # 次の曲の先読み
+    BACKGROUND = 3  # プレイリストの取り込みなど
+
+
+class _Job:
+    """実行待ちの処理"""
+    __slots__ = (
+        "func",
+        "args",
+        "future",
+        "loop",
+        "priority",
+        "local",
+        "enqueued_at",
+    )
+
+    def __init__(
+        self,
+        func: Callable,
+        args: tuple,
+        future: asyncio.Future,
+        loop: asyncio.AbstractEventLoop,
+        priority: Priority,
+        local: bool = False,
+    ):
+        self.func: Callable = func
+        self.args: tuple = args
+        self.future: asyncio.Future = future
+        self.loop: asyncio.AbstractEventLoop = loop
+        self.priority: Priority = priority
+        self.local: bool = local  # Trueの場合はバックエンドに関わらずワーカースレッドで実行
+        self.enqueued_at: float = time.monotonic()
+
+
+class ExtractionExecutor:
+    """
+    yt-dlpのブロッキング処理専用の優先度付きスレッドプール
+    キューが上限に達した場合はExecutorSaturatedを送出する
+    backendに"process"を指定すると、処理を子プロセスで実行してGILの競合を避ける
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queue: int = 100,
+        *,
+        backend: str = "thread",
+        max_tasks_per_child: Optional[int] = None,
+        initializer: Optional[Callable] = None,
+        initargs: tuple = (),
+        job_timeout: float = 120.0,
+    ):
+        if backend not in ("thread", "process"):
+            raise ValueError(f"Unknown extraction backend: {backend}")
+        self.workers: int = workers
+        self.max_queue: int = max_queue
+        self.backend: str = backend
+        self.max_tasks_per_child: Optional[int] = max_tasks_per_child
+        self.job_timeout: float = job_timeout  # 子プロセスの処理を待つ上限（固まった子プロセスで抽出スレッドを塞がない）
+        self._initializer: Optional[Callable] = initializer
+        self._initargs: tuple = initargs
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.pending: int = 0
+        self.running: int = 0
+        self.completed: int = 0
+        self.rejected: int = 0
+        self.dequeued: int = 0
+        self.wait_total: float = 0.0
+        self.wait_max: float = 0.0
+        self.timeouts: int = 0
+
+    def _create_process_pool(self) -> ProcessPoolExecutor:
+        """子プロセスのプールを作成"""
+        # 起動済みのゲートウェイ・スレッドを持つプロセスをforkすると、子プロセスが
+        # ロック（ロギング・SSLなど）を握ったまま複製されて固まるため、forkserverから起動する
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        kwargs = {
+            "max_workers": self.workers,
+            "mp_context": multiprocessing.get_context(method),
+            "initializer": self._initializer,
+            "initargs": self._initargs,
+        }
+        if self.max_tasks_per_child:
+            kwargs["max_tasks_per_child"] = self.max_tasks_per_child
+        try:
+            return ProcessPoolExecutor(**kwargs)
+        except TypeError:
+            # Python 3.11未満はmax_tasks_per_childに対応していない
+            kwargs.pop("max_tasks_per_child", None)
+            _log.warning("max_tasks_per_child is not supported on this Python version")
+            return ProcessPoolExecutor(**kwargs)
+
+    def _run(self, job: _Job) -> Any:
+        """バックエンドに応じて処理を実行"""
+        if self._process_pool is None or job.local:
+            return job.func(*job.args)
+
+        pool = self._process_pool
+        try:
+            return pool.submit(job.func, *job.args).result(timeout=self.job_timeout)
+        except BrokenProcessPool:
+            # 子プロセスが異常終了した場合はプールを作り直す
+            self._recreate_pool(pool, "broken")
+            raise
+        except FutureTimeoutError:
+            # 応答しない子プロセスは終了させ、プールを作り直す
+            with self._lock:
+                self.timeouts += 1
+            self._recreate_pool(pool, f"timed out after {self.job_timeout:.0f}s", terminate=True)
+            raise TimeoutError(f"抽出が{self.job_timeout:.0f}秒以内に完了しませんでした")
+
+    def _recreate_pool(self, pool: ProcessPoolExecutor, reason: str, terminate: bool = False):
+        """プールを作り直す（他のスレッドが作り直し済みであれば何もしない）"""
+        with self._lock:
+            if self._process_pool is not pool:
+                return
+            _log.error(f"Extraction process pool {reason}, recreating")
+            self._process_pool = self._create_process_pool()
+
+        if terminate:
+            for process in list((getattr(pool, "_processes", None) or {}).values()):
+                process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _start(self):
+        """ワーカースレッドを起動"""
+        with self._lock:
+            if self._threads:
+                return
+            if self.backend == "process":
+                self._process_pool = self._create_process_pool()
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"extract-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self):
+        """キューから処理を取り出して実行"""
+        while True:
+            _, _, job = self._queue.get()
+            waited = time.monotonic() - job.enqueued_at
+            with self._lock:
+                self.pending -= 1
+                self.dequeued += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+            if job.future.cancelled():
+                continue
+
+            with self._lock:
+                self.running += 1
+            try:
+                result = self._run(job)
+            except BaseException as e:
+                job.loop.call_soon_threadsafe(self._set_exception, job.future, e)
+            else:
+                job.loop.call_soon_threadsafe(self._set_result, job.future, result)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+    @staticmethod
+    def _set_result(future: asyncio.Future, result: Any):
+        if not future.done():
+            future.set_result(result)
+
+    @staticmethod
+    def _set_exception(future: asyncio.Future, exc: BaseException):
+        if not future.done():
+            future.set_exception(exc)
+
+    def warm_up(self, func: Optional[Callable] = None):
+        """ワーカーを事前に起動（プロセスバックエンドでは子プロセスも起動）"""
+        self._start()
+        if self._process_pool is not None and func is not None:
+            for _ in range(self.workers):
+                self._process_pool.submit(func)
+
+    async def submit(
+        self,
+        func: Callable,
+        *args: Any,
+        priority: Priority = Priority.PLAY,
+        local: bool = False,
+    ) -> Any:
+        """処理をキューに追加して結果を待つ（localがTrueの場合は子プロセスに渡さない）"""
+        with self._lock:
+            if self.pending >= self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated("現在処理が混み合っています。しばらくしてからもう一度お試しください。")
+            self.pending += 1
+
+        self._start()
+        loop = asyncio.get_running_loop()
+        job = _Job(func, args, loop.create_future(), loop, priority, local)
+        self._queue.put((int(priority), next(self._counter), job))
+        return await job.future
+
+    def stats(self) -> Dict[str, Any]:
+        """統計情報"""
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "workers": self.workers,
+                "pending": self.pending,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "wait_avg": self.wait_total / self.dequeued if self.dequeued else 0.0,
+                "wait_max": self.wait_max,
+            }
+
+    def __repr__(self) -> str:
+        return (
+            f"<ExtractionExecutor: {self.backend}, {self.workers} workers, "
+            f"pending: {self.pending}>"
+        )
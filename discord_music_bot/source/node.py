@@ -0,0 +1,200 @@
+"""
+音声ノード
+
+FFmpegの読み込み・音量調整・Opusエンコードを受け持ち、
+20msごとのOpusパケットをUnixソケットでBot本体に送る。
+Bot本体は受け取ったパケットをボイス接続に送信するだけでよい。
+
+    python -m source.node --socket /tmp/music-node-0.sock
+
+プロトコル:
+    Bot → ノード: 1行ごとのJSON
+        {"op": "ping"}
+        {"op": "play", "input": ..., "before_options": ..., "options": ...,
+         "codec": "pcm" | "copy" | "libopus", "volume": 0.5}
+        {"op": "volume", "value": 0.8}  （play の後、同じ接続で送る）
+    ノード → Bot:
+        ping への応答は1行のJSON
+        play の後は「2バイトの長さ + Opusパケット」の繰り返し（長さ0で終了）
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+from typing import Dict, Optional, Tuple
+
+import discord
+from discord import FFmpegOpusAudio, FFmpegPCMAudio, PCMVolumeTransformer
+from discord.opus import Encoder
+
+
+_log = logging.getLogger("music")
+
+# パケットの長さのヘッダー
+FRAME_HEADER = struct.Struct(">H")
+
+# 送信バッファ（大きすぎると音量変更や停止が遅れて聞こえる）
+SEND_BUFFER = 32 * 1024
+
+
+def send_frame(sock: socket.socket, data: bytes):
+    """パケットを1つ送信"""
+    sock.sendall(FRAME_HEADER.pack(len(data)) + data)
+
+
+class AudioNode:
+    """
+    音声ノードの本体
+    再生の要求ごとにスレッドを使い、FFmpegの出力をOpusにして送信する
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams: int = 0
+        self.started: int = 0
+        self.packets: int = 0
+
+    def stats(self) -> Dict[str, int]:
+        """統計情報"""
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "streams": self.streams,
+                "started": self.started,
+                "packets": self.packets,
+            }
+
+    @staticmethod
+    def _open(header: Dict) -> Tuple[discord.AudioSource, Optional[PCMVolumeTransformer]]:
+        """要求に応じた音声ソースを作成（PCMの場合は音量を変更できるようにする）"""
+        codec = header.get("codec", "pcm")
+        if codec != "pcm":
+            source = FFmpegOpusAudio(
+                header["input"],
+                codec=codec,
+                before_options=header.get("before_options"),
+                options=header.get("options"),
+            )
+            return source, None
+
+        transformer = PCMVolumeTransformer(
+            FFmpegPCMAudio(
+                header["input"],
+                before_options=header.get("before_options"),
+                options=header.get("options"),
+            ),
+            volume=header.get("volume", 1.0),
+        )
+        return transformer, transformer
+
+    @staticmethod
+    def _control(rfile, transformer: Optional[PCMVolumeTransformer], stop: threading.Event):
+        """Bot本体からの操作を受け付ける（接続が閉じられたら停止）"""
+        try:
+            for line in rfile:
+                message = json.loads(line)
+                if message.get("op") == "volume" and transformer is not None:
+                    transformer.volume = float(message["value"])
+        except (OSError, ValueError):
+            pass
+        finally:
+            stop.set()
+
+    def play(self, sock: socket.socket, rfile, header: Dict):
+        """音声を読み込み、Opusパケットを送信し続ける"""
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        try:
+            source, transformer = self._open(header)
+        except Exception as e:
+            _log.error(f"Failed to open audio on node: {e}")
+            send_frame(sock, b"")
+            return
+
+        stop = threading.Event()
+        threading.Thread(
+            target=self._control, args=(rfile, transformer, stop), daemon=True
+        ).start()
+
+        encoder = None if source.is_opus() else Encoder()
+        with self._lock:
+            self.streams += 1
+            self.started += 1
+        try:
+            while not stop.is_set():
+                data = source.read()
+                if not data:
+                    break
+                if encoder is not None:
+                    data = encoder.encode(data, Encoder.SAMPLES_PER_FRAME)
+                send_frame(sock, data)
+                with self._lock:
+                    self.packets += 1
+            send_frame(sock, b"")
+        except OSError:
+            # Bot側が接続を閉じた（停止・シークなど）
+            pass
+        finally:
+            stop.set()
+            source.cleanup()
+            with self._lock:
+                self.streams -= 1
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """接続ごとの処理"""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            header = json.loads(line)
+        except ValueError:
+            return
+
+        op = header.get("op")
+        if op == "ping":
+            self.wfile.write(json.dumps(self.server.node.stats()).encode() + b"\n")
+        elif op == "play":
+            self.server.node.play(self.request, self.rfile, header)
+
+
+class AudioNodeServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """音声ノードのUnixソケットサーバー"""
+    daemon_threads = True
+
+    def __init__(self, path: str, node: Optional[AudioNode] = None):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.node: AudioNode = node or AudioNode()
+        super().__init__(path, _Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="音声ノード")
+    parser.add_argument("--socket", required=True, help="待ち受けるUnixソケットのパス")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="[%(asctime)s] [%(levelname)-8s] node: %(message)s",
+    )
+    server = AudioNodeServer(args.socket)
+    _log.info(f"Audio node listening on {args.socket} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import discord
+
+from .node import FRAME_HEADER, AudioNodeServer
+
+
+_log = logging.getLogger("music")
+
+# 受信バッファ（ノード側の送信バッファと合わせて、先に受け取る音声の長さを抑える）
+RECEIVE_BUFFER = 32 * 1024
+
+
+class NodeStream(discord.AudioSource):
+    """
+    音声ノードから受け取るOpusパケットのストリーム
+    read()は送信スレッドから呼ばれるため、ブロッキングソケットで受信する
+    FFmpegが再接続している間などはパケットが届くまで待ち、
+    長さ0のパケットか接続が閉じられた場合のみ再生終了とする
+    """
+
+    def __init__(self, sock: socket.socket):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        sock.settimeout(None)
+        self._sock: Optional[socket.socket] = sock
+        self._rfile = sock.makefile("rb")
+        self._send_lock = threading.Lock()
+
+    def _read_exact(self, size: int) -> Optional[bytes]:
+        data = self._rfile.read(size)
+        if data is None or len(data) < size:
+            return None
+        return data
+
+    def read(self) -> bytes:
+        if self._sock is None:
+            return b""
+        try:
+            header = self._read_exact(FRAME_HEADER.size)
+            if header is None:
+                return b""
+            (length,) = FRAME_HEADER.unpack(header)
+            if length == 0:
+                return b""
+            return self._read_exact(length) or b""
+        except (OSError, ValueError):
+            # 切断された場合は再生終了として扱う
+            return b""
+
+    def is_opus(self) -> bool:
+        return True
+
+    def send(self, message: Dict[str, Any]):
+        """ノードに操作を送信"""
+        if self._sock is None:
+            return
+        try:
+            with self._send_lock:
+                self._sock.sendall(json.dumps(message).encode() + b"\n")
+        except OSError as e:
+            _log.debug(f"Failed to send to audio node: {e}")
+
+    def cleanup(self):
+        # 接続を閉じるとノード側のFFmpegも停止する
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                # 受信待ちの送信スレッドを起こす
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                self._rfile.close()
+                sock.close()
+            except OSError:
+                pass
+
+
+class AudioNodeHandle:
+    """
+    Bot側から見た音声ノード
+    """
+    __slots__ = (
+        "name",
+        "path",
+        "process",
+        "server",
+        "healthy",
+        "streams",
+        "assigned",
+        "failures",
+        "last_seen",
+    )
+
+    def __init__(self, name: str, path: str):
+        self.name: str = name
+        self.path: str = path
+        self.process: Optional[subprocess.Popen] = None  # processモードの子プロセス
+        self.server: Optional[AudioNodeServer] = None  # inprocessモードのサーバー
+        self.healthy: bool = False
+        self.streams: int = 0  # ノードが報告した再生中のストリーム数
+        self.assigned: int = 0  # 前回のヘルスチェック以降に割り当てた数
+        self.failures: int = 0
+        self.last_seen: float = 0.0
+
+    @property
+    def load(self) -> int:
+        """割り当ての判断に使う負荷"""
+        return self.streams + self.assigned
+
+    def __repr__(self) -> str:
+        return f"<AudioNodeHandle: {self.name}, healthy={self.healthy}, load={self.load}>"
+
+
+class AudioNodePool:
+    """
+    音声ノードの管理
+    サーバーは負荷の低いノードに割り当て、再生中は同じノードを使い続ける
+    processモードではノードを子プロセスとして起動し、応答しなくなったら起動し直す
+    inprocessモードでは同じプロトコルのサーバーをBotのプロセス内で動かす（開発用）
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        count: int = 2,
+        *,
+        health_interval: float = 10.0,
+        max_failures: int = 3,
+    ):
+        if mode not in ("inprocess", "process"):
+            raise ValueError(f"Unknown audio node mode: {mode}")
+        self.mode: str = mode
+        self.health_interval: float = health_interval
+        self.max_failures: int = max_failures
+        directory = Path(tempfile.gettempdir())
+        self.nodes: List[AudioNodeHandle] = [
+            AudioNodeHandle(f"node-{i}", str(directory / f"music-node-{os.getpid()}-{i}.sock"))
+            for i in range(max(1, count))
+        ]
+        self._assignments: Dict[int, AudioNodeHandle] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.respawns: int = 0
+
+    def _launch(self, node: AudioNodeHandle):
+        """ノードを起動"""
+        if self.mode == "inprocess":
+            node.server = AudioNodeServer(node.path)
+            threading.Thread(
+                target=node.server.serve_forever, name=f"audio-{node.name}", daemon=True
+            ).start()
+        else:
+            node.process = subprocess.Popen(
+                [sys.executable, "-m", "source.node", "--socket", node.path],
+                cwd=str(Path(__file__).resolve().parent.parent),
+            )
+        node.failures = 0
+        _log.info(f"Started audio node {node.name} ({self.mode}) at {node.path}")
+
+    def _terminate(self, node: AudioNodeHandle):
+        """ノードを停止"""
+        if node.server is not None:
+            node.server.shutdown()
+            node.server.server_close()
+            node.server = None
+        if node.process is not None:
+            node.process.terminate()
+            try:
+                node.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                node.process.kill()
+            node.process = None
+        node.healthy = False
+
+    def start(self):
+        """全てのノードを起動し、ヘルスチェックを開始"""
+        if self._task is not None:
+            return
+        for node in self.nodes:
+            self._launch(node)
+        self._task = asyncio.create_task(self._health_loop())
+
+    def stop(self):
+        """全てのノードを停止"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for node in self.nodes:
+            self._terminate(node)
+        self._assignments.clear()
+
+    async def _ping(self, node: AudioNodeHandle) -> Dict[str, int]:
+        """ノードの状態を問い合わせる"""
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_unix_connection(node.path), timeout=2.0
+        )
+        try:
+            writer.write(b'{"op": "ping"}\n')
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), timeout=2.0)
+            return json.loads(line)
+        finally:
+            writer.close()
+
+    async def check(self):
+        """全てのノードのヘルスチェック（子プロセスが終了していれば起動し直す）"""
+        for node in self.nodes:
+            if node.process is not None and node.process.poll() is not None:
+                _log.error(f"Audio node {node.name} exited with {node.process.returncode}")
+                node.process = None
+                node.healthy = False
+                self._launch(node)
+                self.respawns += 1
+                continue
+
+            try:
+                stats = await self._ping(node)
+            except (OSError, ValueError, asyncio.TimeoutError) as e:
+                node.failures += 1
+                if node.healthy and node.failures >= self.max_failures:
+                    _log.warning(f"Audio node {node.name} is unhealthy: {e!r}")
+                    node.healthy = False
+                    self._drop_assignments(node)
+                continue
+
+            if not node.healthy:
+                _log.info(f"Audio node {node.name} is healthy (pid {stats.get('pid')})")
+            node.healthy = True
+            node.failures = 0
+            node.streams = stats.get("streams", 0)
+            node.assigned = 0
+            node.last_seen = time.monotonic()
+
+    async def _health_loop(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                _log.error(f"Audio node health check failed: {e!r}")
+            await asyncio.sleep(self.health_interval)
+
+    def _mark_unhealthy(self, node: AudioNodeHandle, error: Exception):
+        """接続できなかったノードを、次に応答するまで割り当ての対象から外す"""
+        node.failures += 1
+        if node.healthy:
+            _log.warning(f"Audio node {node.name} refused connection: {error!r}")
+        node.healthy = False
+        self._drop_assignments(node)
+
+    def _drop_assignments(self, node: AudioNodeHandle):
+        """応答しないノードへの割り当てを解除"""
+        for guild_id in [key for key, value in self._assignments.items() if value is node]:
+            del self._assignments[guild_id]
+
+    def assign(self, guild_id: Optional[int], exclude: Sequence[AudioNodeHandle] = ()) -> AudioNodeHandle:
+        """サーバーに割り当てるノードを選ぶ（割り当て済みで正常ならそのノード・excludeは除く）"""
+        node = self._assignments.get(guild_id) if guild_id is not None else None
+        if node is not None and node.healthy and node not in exclude:
+            return node
+
+        # 起動直後でヘルスチェック前の場合や、正常なノードが無い場合は残りの全ノードを候補にする
+        remaining = [node for node in self.nodes if node not in exclude]
+        candidates = [node for node in remaining if node.healthy] or remaining
+        node = min(candidates, key=lambda node: node.load)
+        node.assigned += 1
+        if guild_id is not None:
+            self._assignments[guild_id] = node
+        return node
+
+    def release(self, guild_id: int):
+        """サーバーの割り当てを解除（次の再生では改めて負荷の低いノードを選ぶ）"""
+        self._assignments.pop(guild_id, None)
+
+    def open(self, guild_id: Optional[int], request: Dict[str, Any]) -> socket.socket:
+        """
+        ノードに再生を要求し、パケットを受信するソケットを返す（接続できなければ次のノードを試す）
+        イベントループ上で呼ばれるため、ノンブロッキングで接続して待たない
+        （Unixソケットの接続はすぐに完了するか、ノードが受け付けられない場合はEAGAINなどで失敗する）
+        """
+        payload = json.dumps({"op": "play", **request}).encode() + b"\n"
+        tried: List[AudioNodeHandle] = []
+        while True:
+            node = self.assign(guild_id, tried)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.setblocking(False)
+                sock.connect(node.path)
+                # 接続直後の送信バッファは空のため、短い要求は一度で送れる
+                if sock.send(payload) != len(payload):
+                    raise BlockingIOError("audio node did not accept the request")
+            except OSError as e:
+                sock.close()
+                self._mark_unhealthy(node, e)
+                tried.append(node)
+                if len(tried) >= len(self.nodes):
+                    raise
+                continue
+            return sock
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """ノードごとの状態"""
+        return [
+            {
+                "name": node.name,
+                "healthy": node.healthy,
+                "streams": node.streams,
+                "failures": node.failures,
+                "guilds": sum(1 for value in self._assignments.values() if value is node),
+            }
+            for node in self.nodes
+        ]
+
+    def __repr__(self) -> str:
+        return f"<AudioNodePool: {self.mode}, {len(self.nodes)} nodes>"
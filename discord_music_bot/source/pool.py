@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+import yt_dlp
+
+
+_log = logging.getLogger("music")
+
+
+class _PooledYTDL:
+    """プール内で管理されるYoutubeDLインスタンス"""
+    __slots__ = (
+        "ytdl",
+        "created_at",
+        "uses",
+    )
+
+    def __init__(self, ytdl: yt_dlp.YoutubeDL):
+        self.ytdl: yt_dlp.YoutubeDL = ytdl
+        self.created_at: float = time.monotonic()
+        self.uses: int = 0
+
+
+class YTDLPool:
+    """
+    オプションプロファイルごとにYoutubeDLインスタンスを再利用するプール
+    インスタンスは貸し出し中は1スレッドのみが使用し、一定回数・一定時間で作り直す
+    """
+
+    def __init__(
+        self,
+        profiles: Dict[str, Dict],
+        *,
+        max_size: int = 4,
+        max_uses: int = 200,
+        max_age: float = 1800.0,
+    ):
+        self.profiles: Dict[str, Dict] = profiles
+        self.max_size: int = max_size
+        self.max_uses: int = max_uses
+        self.max_age: float = max_age
+        self._idle: Dict[str, List[_PooledYTDL]] = {name: [] for name in profiles}
+        self._total: Dict[str, int] = {name: 0 for name in profiles}
+        self._cond = threading.Condition()
+        self.created = 0
+        self.recycled = 0
+
+    def _expired(self, pooled: _PooledYTDL) -> bool:
+        """インスタンスを作り直すべきかどうか"""
+        return (
+            pooled.uses >= self.max_uses
+            or time.monotonic() - pooled.created_at >= self.max_age
+        )
+
+    def _discard(self, profile: str, pooled: _PooledYTDL):
+        """インスタンスを破棄（ロック内で呼び出すこと）"""
+        self._total[profile] -= 1
+        self.recycled += 1
+        close = getattr(pooled.ytdl, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                _log.debug(f"Error closing YoutubeDL instance: {e}")
+
+    def acquire(self, profile: str) -> _PooledYTDL:
+        """インスタンスを貸し出す（上限に達している場合は返却を待つ）"""
+        if profile not in self.profiles:
+            raise KeyError(f"Unknown YoutubeDL profile: {profile}")
+
+        with self._cond:
+            while True:
+                idle = self._idle[profile]
+                while idle:
+                    pooled = idle.pop()
+                    if not self._expired(pooled):
+                        return pooled
+                    self._discard(profile, pooled)
+
+                if self._total[profile] < self.max_size:
+                    self._total[profile] += 1
+                    break
+
+                self._cond.wait()
+
+        # インスタンス生成は重いのでロック外で行う
+        try:
+            pooled = _PooledYTDL(yt_dlp.YoutubeDL(dict(self.profiles[profile])))
+        except Exception:
+            with self._cond:
+                self._total[profile] -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self.created += 1
+        _log.debug(f"Created YoutubeDL instance for profile '{profile}'")
+        return pooled
+
+    def release(self, profile: str, pooled: _PooledYTDL):
+        """インスタンスをプールに返却"""
+        with self._cond:
+            pooled.uses += 1
+            if self._expired(pooled):
+                self._discard(profile, pooled)
+            else:
+                self._idle[profile].append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def checkout(self, profile: str) -> Iterator[yt_dlp.YoutubeDL]:
+        """with文でインスタンスを借りる"""
+        pooled = self.acquire(profile)
+        try:
+            yield pooled.ytdl
+        finally:
+            self.release(profile, pooled)
+
+    def stats(self) -> Dict[str, int]:
+        """プールの統計情報"""
+        with self._cond:
+            return {
+                "created": self.created,
+                "recycled": self.recycled,
+                "idle": sum(len(idle) for idle in self._idle.values()),
+                "total": sum(self._total.values()),
+            }
+
+    def __repr__(self) -> str:
+        stats = self.stats()
+        return f"<YTDLPool: {stats['total']} instances, idle: {stats['idle']}>"
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+from objects.item import Item
+from .executor import Priority
+from .source import YTDLSource, DiscordFileSource
+
+
+_log = logging.getLogger("music")
+
+
+class Prefetcher:
+    """
+    再生中にキューの次以降の曲を先読みするクラス
+    通常はURLの解決のみ行い、spawn_ffmpegが有効な場合は先頭の曲のFFmpegまで起動しておく
+    （起動したFFmpegは再生まで読み込まれず、配信URLの接続が切れることがある）
+    """
+
+    def __init__(self, depth: int = 2, spawn_ffmpeg: bool = False):
+        self.depth: int = depth
+        self.spawn_ffmpeg: bool = spawn_ffmpeg
+        self._tasks: Dict[int, Tuple[Item, asyncio.Task]] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    async def _prepare(
+        self, item: Item, spawn: bool
+    ) -> Optional[Union[YTDLSource, DiscordFileSource]]:
+        """アイテムを先読みし、起動済みのソースがあれば返す"""
+        if item.attachment:
+            if not spawn:
+                return None
+            return await DiscordFileSource.from_attachment(
+                item.attachment, item.volume, item.user
+            )
+
+        if not spawn:
+            if not item.has_valid_stream():
+                await YTDLSource.resolve(item.url, Priority.PREFETCH)
+            return None
+        return await YTDLSource.from_item(item, Priority.PREFETCH)
+
+    def schedule(self, items: Sequence[Item]):
+        """先読み対象を更新（対象外になったものは破棄）"""
+        items = tuple(items)[: self.depth]
+        wanted = {id(item) for item in items}
+
+        for key in list(self._tasks):
+            if key not in wanted:
+                self._discard(key)
+
+        for position, item in enumerate(items):
+            if id(item) in self._tasks:
+                continue
+            spawn = self.spawn_ffmpeg and position == 0
+            task = asyncio.create_task(self._prepare(item, spawn))
+            task.add_done_callback(self._log_failure)
+            self._tasks[id(item)] = (item, task)
+
+    async def take(self, item: Item) -> Optional[Union[YTDLSource, DiscordFileSource]]:
+        """先読み済みのソースを受け取る（無ければNone）"""
+        entry = self._tasks.pop(id(item), None)
+        if entry is None or entry[0] is not item:
+            self.misses += 1
+            return None
+
+        try:
+            source = await entry[1]
+        except (asyncio.CancelledError, Exception):
+            self.misses += 1
+            return None
+
+        if source is None:
+            # URLの解決のみ済んでいる場合は呼び出し側でソースを作成
+            self.misses += 1
+        else:
+            source.prefetched = True
+            self.hits += 1
+        return source
+
+    def _discard(self, key: int):
+        """先読み結果を破棄"""
+        _, task = self._tasks.pop(key)
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled() and task.exception() is None:
+            source = task.result()
+            if source is not None:
+                source.cleanup()
+
+    def invalidate(self):
+        """全ての先読み結果を破棄"""
+        for key in list(self._tasks):
+            self._discard(key)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        """先読みの失敗をログに記録"""
+        if not task.cancelled() and task.exception() is not None:
+            _log.warning(f"Prefetch failed: {task.exception()}")
+
+    def __repr__(self) -> str:
+        return f"<Prefetcher: {len(self._tasks)} pending, depth: {self.depth}>"
@@ -1,17 +1,89 @@
 import asyncio
+import copy
+import functools
+import itertools
 import logging
-import re
+import os
 import subprocess
-from typing import Dict, List, Optional, Union
+import time
+import weakref
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
 
 import discord
 import yt_dlp
-from discord import FFmpegPCMAudio, PCMVolumeTransformer
+from discord import FFmpegOpusAudio, FFmpegPCMAudio, PCMVolumeTransformer
+
+from .cache import MetadataCache
+from .diskcache import AudioDiskCache
+from .executor import ExecutorSaturated, ExtractionExecutor, Priority
+from .nodepool import AudioNodePool, NodeStream
+from .pool import YTDLPool
+from . import worker
+from utils.stats import LatencyStats
 
 
 _log = logging.getLogger("music")
 
 
+# FFmpegの起動プロファイル（fast: 抽出済みのコーデック情報で探査を最小化 / compat: 従来通り）
+FFMPEG_PROFILE = os.getenv("FFMPEG_PROFILE", "fast").lower()
+
+FFMPEG_BEFORE_OPTIONS = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+
+# fastプロファイルで入力形式を指定する拡張子とFFmpegのデマルチプレクサ
+FAST_START_DEMUXERS = {
+    'webm': 'webm',
+    'm4a': 'mp4',
+    'mp4': 'mp4',
+    'mp3': 'mp3',
+    'ogg': 'ogg',
+    'opus': 'ogg',
+}
+
+# Opus形式の音源をデコード・再エンコードせずに送信するかどうか
+OPUS_PASSTHROUGH = os.getenv("OPUS_PASSTHROUGH", "true").lower() == "true"
+
+# 「ソース種別/プロファイル」ごとの最初のフレームまでの時間
+first_frame_stats: Dict[str, LatencyStats] = {}
+
+# シーク要求から新しい位置の最初のフレームまでの時間
+seek_stats = LatencyStats()
+
+# 呼び出し元（from_url・isPlayList・search_youtube）ごとの抽出にかかった時間
+extract_stats: Dict[str, LatencyStats] = {}
+
+# 作成した音声ソース（起動中のFFmpegプロセスの集計用）
+live_sources: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _timed(site: str):
+    """抽出にかかった時間を呼び出し元ごとに記録するデコレーター"""
+    stats = extract_stats.setdefault(site, LatencyStats())
+    
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                stats.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def ffmpeg_process_count() -> int:
+    """このプロセスで起動中のFFmpegの数（音声ノードの分は含まない）"""
+    count = 0
+    for source in list(live_sources):
+        audio = getattr(source, 'original', source)
+        process = getattr(audio, '_process', None)
+        if isinstance(process, subprocess.Popen) and process.poll() is None:
+            count += 1
+    return count
+
+
 class AudioInfo:
     """音声情報を格納するクラス"""
     def __init__(self, data: Dict):
@@ -24,9 +96,91 @@ class AudioInfo:
         self.uploader = data.get('uploader', '不明')
         self.view_count = data.get('view_count', 0)
         self.description = data.get('description', '')
+        self.extractor = data.get('extractor_key', '')
+        self.ext = data.get('ext', '')
+        self.acodec = data.get('acodec', '')
+        self.protocol = data.get('protocol', '')
+        self.format_id = data.get('format_id', '')
+
+    def with_local_file(self, path: str) -> "AudioInfo":
+        """ディスクキャッシュ上のファイルを指すコピーを作成"""
+        info = copy.copy(self)
+        info.url = path
+        info.protocol = 'file'
+        info.ext = 'mka'
+        return info
+
+
+class _PlaybackMixin:
+    """
+    各音声ソース共通の再生位置・最初のフレームまでの時間の計測
+    再生位置はread()が実際に返した20msフレームの数から求める
+    """
+
+    # read()が1回で返す音声の長さ（秒）
+    FRAME_LENGTH = discord.opus.Encoder.FRAME_LENGTH / 1000
+
+    # 再生中に音量を変更できるかどうか
+    supports_live_volume = True
 
+    @property
+    def position(self) -> float:
+        """実際に送信したフレーム数に基づく再生位置（秒）"""
+        return self.start_offset + self.frames * self.FRAME_LENGTH
 
-class YTDLSource(PCMVolumeTransformer):
+    @property
+    def progress(self) -> float:
+        """再生位置（positionの別名）"""
+        return self.position
+
+    @progress.setter
+    def progress(self, value: float):
+        # 開始位置を設定し、フレーム数を数え直す
+        self.start_offset = value
+        self.frames = 0
+
+    def _start_first_frame_timer(self, label: str):
+        self.ffmpeg_profile_label = label
+        self.first_frame_time: Optional[float] = None
+        self.prefetched = False
+        self.seeked = False
+        self._created_at = time.perf_counter()
+        live_sources.add(self)
+
+    def _record_first_frame(self, data: bytes):
+        if self.first_frame_time is not None or not data:
+            return
+        self.first_frame_time = time.perf_counter() - self._created_at
+        if self.seeked:
+            seek_stats.observe(self.first_frame_time)
+            return
+        # 先読みされたソースはバッファ済みのため別に集計
+        label = "prefetched" if self.prefetched else self.ffmpeg_profile_label
+        first_frame_stats.setdefault(label, LatencyStats()).observe(self.first_frame_time)
+        _log.debug(f"First frame after {self.first_frame_time * 1000:.0f}ms ({label})")
+
+    async def wait_first_frame(self, timeout: float = 3.0) -> Optional[float]:
+        """最初のフレームが送信されるまで待ち、作成からの秒数を返す"""
+        deadline = time.perf_counter() + timeout
+        while self.first_frame_time is None and time.perf_counter() < deadline:
+            await asyncio.sleep(0.02)
+        return self.first_frame_time
+
+    def seek(self, position: float):
+        """指定位置から再生する新しいソースを作成（ストリームURLを再利用）"""
+        source = self.at_position(max(0.0, position))
+        source.seeked = True
+        return source
+
+    def read(self) -> bytes:
+        data = super().read()
+        if data:
+            self.frames += 1
+        self._record_first_frame(data)
+        return data
+
+
+class YTDLSource(_PlaybackMixin, PCMVolumeTransformer):
     """YouTube-DL音声ソース"""
     
     YTDL_OPTIONS = {
@@ -47,63 +201,141 @@ class YTDLSource(PCMVolumeTransformer):
     }
 
     FFMPEG_OPTIONS = {
-        'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+        'before_options': FFMPEG_BEFORE_OPTIONS,
         'options': '-vn -bufsize 64k -analyzeduration 2147483647 -probesize 2147483647 -ac 2'
     }
 
-    def __init__(self, source: discord.AudioSource, *, info: AudioInfo, volume: float = 0.5, user: discord.Member, progress: float = 0):
+    def __init__(self, source: discord.AudioSource, *, info: AudioInfo, volume: float = 0.5, user: discord.Member, progress: float = 0, profile: str = "compat"):
         super().__init__(source, volume=volume)
         self.info = info
         self.user = user
         self.volume = volume
         self.progress = progress
         self.locale = getattr(user, 'locale', discord.Locale.japanese)
+        self._start_first_frame_timer(f"{info.extractor or 'unknown'}/{profile}")
+
+    @staticmethod
+    def effective_profile(info: AudioInfo) -> str:
+        """実際に使用するプロファイル（コーデック不明の場合はcompat）"""
+        if FFMPEG_PROFILE == "fast" and info.acodec and info.acodec != 'none':
+            return "fast"
+        return "compat"
 
     @classmethod
-    async def from_url(cls, url: str, locale: Optional[discord.Locale] = None, volume: float = 0.5, user: discord.Member = None):
-        """URLから音声ソースを作成"""
-        loop = asyncio.get_event_loop()
+    def ffmpeg_options(cls, info: AudioInfo, profile: str, start: float = 0) -> Dict[str, str]:
+        """プロファイルに応じたFFmpegオプションを作成（startは入力側のシーク位置）"""
+        seek = f"-ss {start:.3f} " if start > 0 else ""
+        # 再接続のオプションはHTTP入力でのみ有効
+        reconnect = "" if info.protocol == 'file' else FFMPEG_BEFORE_OPTIONS
+        if profile != "fast":
+            options = dict(cls.FFMPEG_OPTIONS)
+            options['before_options'] = f"{seek}{reconnect}".strip()
+            return options
         
-        try:
-            ytdl = yt_dlp.YoutubeDL(cls.YTDL_OPTIONS)
-            data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=False))
+        # コーデック情報は抽出済みなので、探査は最小限で済ませる
+        before_options = f"{seek}{reconnect} -analyzeduration 0 -probesize 32768".strip()
+        demuxer = FAST_START_DEMUXERS.get(info.ext)
+        if demuxer and info.protocol in ('http', 'https'):
+            before_options += f" -f {demuxer}"
+        
+        return {
+            'before_options': before_options,
+            'options': '-vn -ac 2'
+        }
+
+    @classmethod
+    async def resolve(cls, url: str, priority: Priority = Priority.PLAY) -> Dict:
+        """URLから再生用の情報を取得（キャッシュを優先）"""
+        data = metadata_cache.get(url, need_stream=True)
+        if data is None:
+            data = await _extract("full", url, priority)
             
             if 'entries' in data:
                 # プレイリストの場合は最初の動画を取得
                 data = data['entries'][0]
             
-            audio_info = AudioInfo(data)
-            filename = data['url']
-            
-            _log.info(f"Loading audio: {audio_info.title}")
-            
-            return cls(
-                FFmpegPCMAudio(filename, **cls.FFMPEG_OPTIONS),
-                info=audio_info,
-                volume=volume,
-                user=user,
-                progress=0
-            )
+            metadata_cache.put(url, data)
+        return data
+
+    @classmethod
+    @_timed("from_url")
+    async def from_url(cls, url: str, locale: Optional[discord.Locale] = None, volume: float = 0.5, user: discord.Member = None, priority: Priority = Priority.PLAY):
+        """URLから音声ソースを作成"""
+        try:
+            data = await cls.resolve(url, priority)
+            return cls.from_info(AudioInfo(data), volume, user)
         except Exception as e:
             _log.error(f"Error creating audio source from {url}: {e}")
             raise e
 
     @classmethod
+    def from_info(cls, info: AudioInfo, volume: float = 0.5, user: discord.Member = None, start: float = 0, passthrough: bool = OPUS_PASSTHROUGH):
+        """解決済みの音声情報から音声ソースを作成"""
+        _log.info(f"Loading audio: {info.title}")
+        
+        # ディスクキャッシュにあればローカルファイルから再生（再生回数はplay_nextで数える）
+        if disk_cache is not None and info.protocol != 'file':
+            path = disk_cache.lookup(info)
+            if path is not None:
+                info = info.with_local_file(path)
+        
+        profile = cls.effective_profile(info)
+        passthrough = passthrough and info.acodec == 'opus'
+        
+        # 音声ノードを使う場合はデコード・エンコードをノードに任せる
+        if audio_nodes is not None:
+            return NodeSource.from_node(
+                info,
+                volume,
+                user,
+                start,
+                options=cls.ffmpeg_options(info, profile, start),
+                passthrough=passthrough,
+                label=f"{info.extractor or 'unknown'}/{profile}",
+                reopen=lambda volume, start, passthrough: YTDLSource.from_info(
+                    info, volume, user, start=start, passthrough=passthrough
+                )
+            )
+        
+        if passthrough:
+            return YTDLOpusSource(
+                info.url,
+                info=info,
+                volume=volume,
+                user=user,
+                progress=start,
+                profile=profile
+            )
+        
+        return cls(
+            FFmpegPCMAudio(info.url, **cls.ffmpeg_options(info, profile, start)),
+            info=info,
+            volume=volume,
+            user=user,
+            progress=start,
+            profile=profile
+        )
+
+    def at_position(self, position: float) -> "YTDLSource":
+        """同じ曲を指定位置から再生するソースを作成"""
+        return YTDLSource.from_info(
+            self.info, self.volume, self.user, start=position, passthrough=False
+        )
+
+    @classmethod
+    async def from_item(cls, item, priority: Priority = Priority.PLAY):
+        """キューのアイテムから音声ソースを作成（有効なストリームURLがあれば再抽出しない）"""
+        if item.has_valid_stream():
+            return cls.from_info(item.info, item.volume, item.user)
+        return await cls.from_url(item.url, item.locale, item.volume, item.user, priority)
+
+    @classmethod
+    @_timed("search_youtube")
     async def search_youtube(cls, query: str, max_results: int = 5) -> List[Dict]:
         """YouTube検索"""
-        ytdl_opts = cls.YTDL_OPTIONS.copy()
-        ytdl_opts.update({
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': True,
-        })
-        
         try:
-            loop = asyncio.get_event_loop()
-            ytdl = yt_dlp.YoutubeDL(ytdl_opts)
-            
             search_query = f"ytsearch{max_results}:{query}"
-            data = await loop.run_in_executor(None, lambda: ytdl.extract_info(search_query, download=False))
+            data = await _extract("search", search_query, Priority.SEARCH)
             
             results = []
             if 'entries' in data:
@@ -118,12 +350,239 @@ class YTDLSource(PCMVolumeTransformer):
                         })
             
             return results
+        except ExecutorSaturated:
+            raise
         except Exception as e:
             _log.error(f"Error searching YouTube: {e}")
             return []
 
 
-class DiscordFileSource(PCMVolumeTransformer):
+class YTDLOpusSource(_PlaybackMixin, FFmpegOpusAudio):
+    """
+    Opusパケットをそのまま送信するYouTube-DL音声ソース
+    音量が1.0の場合はストリームコピーのみ、それ以外はFFmpeg側で音量を適用する
+    """
+    
+    supports_live_volume = False
+
+    def __init__(self, url: str, *, info: AudioInfo, volume: float = 0.5, user: discord.Member, progress: float = 0, profile: str = "compat"):
+        options = YTDLSource.ffmpeg_options(info, profile, progress)
+        if volume == 1.0:
+            codec = 'copy'
+            extra = '-vn'
+        else:
+            codec = 'libopus'
+            extra = f'-vn -filter:a volume={volume:.2f}'
+        
+        super().__init__(
+            url,
+            codec=codec,
+            before_options=options['before_options'],
+            options=extra
+        )
+        self.info = info
+        self.user = user
+        self.volume = volume
+        self.progress = progress
+        self.locale = getattr(user, 'locale', discord.Locale.japanese)
+        self._start_first_frame_timer(f"{info.extractor or 'unknown'}/{profile}+opus")
+
+    def with_volume(self, volume: float) -> YTDLSource:
+        """現在の再生位置から、音量を変更できるPCMソースを作成"""
+        return YTDLSource.from_info(
+            self.info, volume, self.user, start=self.progress, passthrough=False
+        )
+
+    def at_position(self, position: float):
+        """同じ曲を指定位置から再生するソースを作成"""
+        return YTDLSource.from_info(self.info, self.volume, self.user, start=position)
+
+
+class NodeSource(_PlaybackMixin, NodeStream):
+    """
+    音声ノードでデコード・エンコードしたOpusパケットを再生するソース
+    PCMで受け取る場合は音量の変更をノードに送り、パススルーの場合はソースを作り直す
+    """
+
+    def __init__(self, sock, *, info: AudioInfo, volume: float = 0.5, user: discord.Member, progress: float = 0, codec: str = "pcm", label: str = "unknown", reopen: Callable = None):
+        super().__init__(sock)
+        self.info = info
+        self.user = user
+        self.codec = codec
+        self._volume = volume
+        self.progress = progress
+        self.locale = getattr(user, 'locale', discord.Locale.japanese)
+        self.supports_live_volume = codec == "pcm"
+        self._reopen = reopen
+        self._start_first_frame_timer(f"{label}+node")
+
+    @classmethod
+    def from_node(cls, info: AudioInfo, volume: float, user: discord.Member, start: float, *, options: Dict[str, str], passthrough: bool, label: str, reopen: Callable) -> "NodeSource":
+        """サーバーに割り当てられたノードに再生を要求"""
+        if not passthrough:
+            codec = "pcm"
+            extra = options['options']
+        elif volume == 1.0:
+            codec = "copy"
+            extra = '-vn'
+        else:
+            codec = "libopus"
+            extra = f'-vn -filter:a volume={volume:.2f}'
+        
+        guild = getattr(user, 'guild', None)
+        sock = audio_nodes.open(guild.id if guild else None, {
+            'input': info.url,
+            'before_options': options['before_options'],
+            'options': extra,
+            'codec': codec,
+            'volume': volume,
+        })
+        return cls(
+            sock,
+            info=info,
+            volume=volume,
+            user=user,
+            progress=start,
+            codec=codec,
+            label=label,
+            reopen=reopen
+        )
+
+    @property
+    def volume(self) -> float:
+        return self._volume
+
+    @volume.setter
+    def volume(self, value: float):
+        self._volume = value
+        if self.codec == "pcm":
+            self.send({'op': 'volume', 'value': value})
+
+    def with_volume(self, volume: float) -> "NodeSource":
+        """現在の再生位置から、音量を変更できるソースを作成"""
+        return self._reopen(volume, self.position, False)
+
+    def at_position(self, position: float) -> "NodeSource":
+        """同じ曲を指定位置から再生するソースを作成"""
+        return self._reopen(self.volume, position, self.codec != "pcm")
+
+
+# プレイリストの先頭として即座に取得する曲数（残りはバックグラウンドで取り込む）
+PLAYLIST_HEAD_SIZE = int(os.getenv("PLAYLIST_HEAD_SIZE", "25"))
+
+# バックグラウンド取り込みで一度にキューへ追加する曲数
+PLAYLIST_BATCH_SIZE = int(os.getenv("PLAYLIST_BATCH_SIZE", "50"))
+
+# プレイリスト判定用のオプション
+PLAYLIST_OPTIONS = {
+    'format': 'bestaudio/best',
+    'noplaylist': False,  # プレイリスト検出のため
+    'nocheckcertificate': True,
+    'ignoreerrors': False,
+    'logtostderr': False,
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': 'in_playlist',  # プレイリスト内のみフラット抽出
+    'skip_download': True,
+    'playlistend': PLAYLIST_HEAD_SIZE,  # 先頭のみ取得
+}
+
+# プロファイルごとに共有されるYoutubeDLインスタンスのプール
+ytdl_pool = YTDLPool(
+    {
+        "full": YTDLSource.YTDL_OPTIONS,
+        "search": {**YTDLSource.YTDL_OPTIONS, 'extract_flat': True},
+        "playlist": PLAYLIST_OPTIONS,
+        "playlist_full": {**PLAYLIST_OPTIONS, 'extract_flat': False},
+    },
+    max_size=int(os.getenv("YTDL_POOL_SIZE", "4")),
+    max_uses=int(os.getenv("YTDL_POOL_MAX_USES", "200")),
+    max_age=float(os.getenv("YTDL_POOL_MAX_AGE", "1800")),
+)
+
+# 動画IDをキーとしたメタデータ・ストリームURLのキャッシュ
+metadata_cache = MetadataCache(
+    max_bytes=int(os.getenv("METADATA_CACHE_BYTES", str(8 * 1024 * 1024))),
+    meta_ttl=float(os.getenv("METADATA_CACHE_TTL", "21600")),
+    stream_ttl=float(os.getenv("STREAM_URL_CACHE_TTL", "1200")),
+)
+
+# yt-dlp専用の優先度付きワーカープール（EXTRACT_BACKEND=processで子プロセスを使用）
+extraction_executor = ExtractionExecutor(
+    workers=int(os.getenv("EXTRACT_WORKERS", "4")),
+    max_queue=int(os.getenv("EXTRACT_MAX_QUEUE", "100")),
+    backend=os.getenv("EXTRACT_BACKEND", "thread").lower(),
+    max_tasks_per_child=int(os.getenv("EXTRACT_MAX_TASKS_PER_CHILD", "100")),
+    initializer=worker.init_worker,
+    initargs=(ytdl_pool.profiles, ytdl_pool.max_uses, ytdl_pool.max_age),
+    job_timeout=float(os.getenv("EXTRACT_TIMEOUT", "120")),
+)
+
+# よく再生される曲の音声を保存するディスクキャッシュ（docker-composeのcache/ボリューム）
+disk_cache: Optional[AudioDiskCache] = None
+if os.getenv("DISK_CACHE_ENABLED", "true").lower() == "true":
+    disk_cache = AudioDiskCache(
+        Path(os.getenv("DISK_CACHE_DIR", str(Path(__file__).resolve().parent.parent / "cache"))),
+        max_bytes=int(os.getenv("DISK_CACHE_MAX_BYTES", str(2 * 1024 ** 3))),
+        min_plays=int(os.getenv("DISK_CACHE_MIN_PLAYS", "2")),
+        max_duration=int(os.getenv("DISK_CACHE_MAX_DURATION", "1800")),
+    )
+
+
+# 音声ノード（off: Botのプロセス内で再生 / inprocess: プロセス内のノード・開発用 / process: 子プロセスのノード）
+AUDIO_NODE_MODE = os.getenv("AUDIO_NODE_MODE", "off").lower()
+audio_nodes: Optional[AudioNodePool] = None
+if AUDIO_NODE_MODE != "off":
+    audio_nodes = AudioNodePool(
+        AUDIO_NODE_MODE,
+        int(os.getenv("AUDIO_NODES", "2")),
+        health_interval=float(os.getenv("AUDIO_NODE_HEALTH_INTERVAL", "10")),
+    )
+
+
+def start_audio_nodes():
+    """音声ノードを起動"""
+    if audio_nodes is not None:
+        audio_nodes.start()
+
+
+def stop_audio_nodes():
+    """音声ノードを停止"""
+    if audio_nodes is not None:
+        audio_nodes.stop()
+
+
+def _extract_info(profile: str, url: str) -> Optional[Dict]:
+    """プールから借りたインスタンスで情報を抽出（ブロッキング）"""
+    with ytdl_pool.checkout(profile) as ytdl:
+        return ytdl.extract_info(url, download=False)
+
+
+async def _extract(profile: str, url: str, priority: Priority = Priority.PLAY) -> Optional[Dict]:
+    """設定されたバックエンドで情報を抽出"""
+    if extraction_executor.backend == "process":
+        func = worker.extract
+    else:
+        func = _extract_info
+    return await extraction_executor.submit(func, profile, url, priority=priority)
+
+
+def warm_up_extractors():
+    """抽出ワーカーを事前に起動"""
+    extraction_executor.warm_up(worker.ping)
+
+
+def _resolved_stream(entry: Dict) -> Dict:
+    """抽出結果にストリームURLが含まれていれば、再生用の情報と有効期限を返す"""
+    if not entry.get('url') or not entry.get('format_id'):
+        return {}
+    return {
+        'info': AudioInfo(entry),
+        'stream_expires': entry.get('stream_expires', time.time() + metadata_cache.stream_ttl),
+    }
+
+
+class DiscordFileSource(_PlaybackMixin, PCMVolumeTransformer):
     """Discord添付ファイル音声ソース"""
     
     def __init__(self, source: discord.AudioSource, *, info: AudioInfo, volume: float = 0.5, user: discord.Member, progress: float = 0):
@@ -132,6 +591,42 @@ class DiscordFileSource(PCMVolumeTransformer):
         self.user = user
         self.volume = volume
         self.progress = progress
+        self._start_first_frame_timer("attachment/compat")
+
+    @classmethod
+    def from_info(cls, info: AudioInfo, volume: float = 0.5, user: discord.Member = None, start: float = 0):
+        """添付ファイルの情報から音声ソースを作成（startは入力側のシーク位置）"""
+        seek = f"-ss {start:.3f} " if start > 0 else ""
+        ffmpeg_options = {
+            'before_options': seek + FFMPEG_BEFORE_OPTIONS,
+            'options': '-vn -bufsize 64k -ac 2'
+        }
+        
+        if audio_nodes is not None:
+            return NodeSource.from_node(
+                info,
+                volume,
+                user,
+                start,
+                options=ffmpeg_options,
+                passthrough=False,
+                label="attachment/compat",
+                reopen=lambda volume, start, passthrough: DiscordFileSource.from_info(
+                    info, volume, user, start=start
+                )
+            )
+        
+        return cls(
+            FFmpegPCMAudio(info.url, **ffmpeg_options),
+            info=info,
+            volume=volume,
+            user=user,
+            progress=start
+        )
+
+    def at_position(self, position: float) -> "DiscordFileSource":
+        """同じファイルを指定位置から再生するソースを作成"""
+        return DiscordFileSource.from_info(self.info, self.volume, self.user, start=position)
 
     @classmethod
     async def from_attachment(cls, attachment: discord.Attachment, volume: float = 0.5, user: discord.Member = None):
@@ -151,43 +646,41 @@ class DiscordFileSource(PCMVolumeTransformer):
                 'uploader': user.display_name if user else '不明',
             })
             
-            ffmpeg_options = {
-                'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-                'options': '-vn -bufsize 64k -ac 2'
-            }
-            
             _log.info(f"Loading attachment: {attachment.filename}")
             
-            return cls(
-                FFmpegPCMAudio(attachment.url, **ffmpeg_options),
-                info=info,
-                volume=volume,
-                user=user,
-                progress=0
-            )
+            return cls.from_info(info, volume, user)
         except Exception as e:
             _log.error(f"Error creating audio source from attachment: {e}")
             raise e
 
 
+class PlaylistHead(list):
+    """
+    プレイリストの先頭の曲（取得できない曲を除く）
+    続きの取り込み位置には、除く前の件数（raw_count）を使う
+    """
+    
+    def __init__(self, entries: List[Dict], raw_count: int):
+        super().__init__(entries)
+        self.raw_count = raw_count
+
+
+@_timed("isPlayList")
 async def isPlayList(url: str, locale: Optional[discord.Locale] = None) -> Union[Dict, List[Dict]]:
     """URLがプレイリストかどうか確認し、情報を取得"""
-    ytdl_opts = {
-        'format': 'bestaudio/best',
-        'noplaylist': False,  # プレイリスト検出のため
-        'nocheckcertificate': True,
-        'ignoreerrors': False,
-        'logtostderr': False,
-        'quiet': True,
-        'no_warnings': True,
-        'extract_flat': 'in_playlist',  # プレイリスト内のみフラット抽出
-        'skip_download': True,
-    }
+    # プレイリスト指定のないURLはキャッシュを確認
+    if 'list=' not in url:
+        cached = metadata_cache.get(url)
+        if cached and cached.get('title'):
+            return {
+                'title': cached['title'],
+                'url': cached.get('webpage_url') or url,
+                'id': cached.get('id', ''),
+                **_resolved_stream(cached),
+            }
     
     try:
-        loop = asyncio.get_event_loop()
-        ytdl = yt_dlp.YoutubeDL(ytdl_opts)
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=False))
+        data = await _extract("playlist", url)
         
         if not data:
             _log.error(f"No data extracted from {url}")
@@ -195,27 +688,12 @@ async def isPlayList(url: str, locale: Optional[discord.Locale] = None) -> Union
         
         # プレイリストかどうかチェック
         if 'entries' in data and len(data['entries']) > 1:
-            # プレイリストの場合
-            _log.info(f"Detected playlist with {len(data['entries'])} items")
-            results = []
-            for entry in data['entries']:
-                if entry:
-                    # URLの構築
-                    entry_url = entry.get('url', '')
-                    if not entry_url.startswith('http'):
-                        # 相対URLの場合、動画IDから構築
-                        video_id = entry.get('id', '')
-                        if video_id:
-                            entry_url = f"https://www.youtube.com/watch?v={video_id}"
-                        else:
-                            entry_url = entry.get('webpage_url', '')
-                    
-                    results.append({
-                        'title': entry.get('title', '不明なタイトル'),
-                        'url': entry_url,
-                        'id': entry.get('id', ''),
-                    })
-            return results
+            # プレイリストの場合（先頭のPLAYLIST_HEAD_SIZE曲のみ）
+            _log.info(f"Detected playlist with {len(data['entries'])} items in head")
+            return PlaylistHead(
+                [_playlist_entry(entry) for entry in data['entries'] if entry],
+                len(data['entries'])
+            )
         else:
             # 単一動画の場合
             if 'entries' in data and data['entries']:
@@ -228,10 +706,7 @@ async def isPlayList(url: str, locale: Optional[discord.Locale] = None) -> Union
             if not title or title == 'NA':
                 # タイトルが取得できない場合は再取得
                 _log.info(f"Title not found, re-extracting without flat mode")
-                ytdl_opts_full = ytdl_opts.copy()
-                ytdl_opts_full['extract_flat'] = False
-                ytdl_full = yt_dlp.YoutubeDL(ytdl_opts_full)
-                data_full = await loop.run_in_executor(None, lambda: ytdl_full.extract_info(url, download=False))
+                data_full = await _extract("playlist_full", url)
                 
                 if data_full:
                     if 'entries' in data_full and data_full['entries']:
@@ -240,6 +715,9 @@ async def isPlayList(url: str, locale: Optional[discord.Locale] = None) -> Union
                         entry = data_full
                     title = entry.get('title', '不明なタイトル')
             
+            if title and title != 'NA':
+                metadata_cache.put(url, entry)
+            
             # URLの構築
             video_url = entry.get('webpage_url', '')
             if not video_url:
@@ -257,10 +735,76 @@ async def isPlayList(url: str, locale: Optional[discord.Locale] = None) -> Union
                 'title': title,
                 'url': video_url,
                 'id': entry.get('id', ''),
+                **_resolved_stream(entry),
             }
             
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         _log.error(f"Error checking playlist: {e}")
         import traceback
         traceback.print_exc()
-        return {'title': '不明なタイトル', 'url': url, 'id': ''}
\ No newline at end of file
+        return {'title': '不明なタイトル', 'url': url, 'id': ''}
+
+
+def _playlist_entry(entry: Dict) -> Dict:
+    """フラット抽出されたプレイリストの1曲をキュー用の情報に変換"""
+    # URLの構築
+    entry_url = entry.get('url', '')
+    if not entry_url.startswith('http'):
+        # 相対URLの場合、動画IDから構築
+        video_id = entry.get('id', '')
+        if video_id:
+            entry_url = f"https://www.youtube.com/watch?v={video_id}"
+        else:
+            entry_url = entry.get('webpage_url', '')
+    
+    return {
+        'title': entry.get('title', '不明なタイトル'),
+        'url': entry_url,
+        'id': entry.get('id', ''),
+    }
+
+
+def _open_playlist(url: str) -> Iterator[Dict]:
+    """プレイリストの曲を遅延評価で返すイテレータを作成（ブロッキング）"""
+    # イテレータが取り込み完了までインスタンスを保持するため、プールは使わない
+    ytdl = yt_dlp.YoutubeDL({**PLAYLIST_OPTIONS, 'playlistend': None})
+    data = ytdl.extract_info(url, download=False, process=False)
+    # 別のURLへの転送（watch?v=...&list=... など）を辿る
+    for _ in range(3):
+        if not data or data.get('_type') not in ('url', 'url_transparent'):
+            break
+        data = ytdl.extract_info(data['url'], download=False, process=False)
+    
+    if not data:
+        return iter(())
+    return iter(data.get('entries') or ())
+
+
+def _next_batch(entries: Iterator[Dict], size: int) -> List[Dict]:
+    """イテレータから最大size件を取り出す（ブロッキング・取得できない曲のNoneも含む）"""
+    return list(itertools.islice(entries, size))
+
+
+async def iter_playlist(url: str, start: int = 1, batch_size: int = PLAYLIST_BATCH_SIZE) -> AsyncIterator[List[Dict]]:
+    """
+    プレイリストのstart曲目以降をbatch_size件ずつ返す
+    全件をメモリに展開せず、取り込みは低優先度で行う
+    イテレータを保持し続けるため、プロセスバックエンドでもワーカースレッドで実行する
+    """
+    entries = await extraction_executor.submit(
+        _open_playlist, url, priority=Priority.BACKGROUND, local=True
+    )
+    entries = itertools.islice(entries, start - 1, None)
+    
+    while True:
+        batch = await extraction_executor.submit(
+            _next_batch, entries, batch_size, priority=Priority.BACKGROUND, local=True
+        )
+        # 取得できない曲だけのバッチでも、イテレータが尽きるまで続ける
+        if not batch:
+            break
+        items = [_playlist_entry(entry) for entry in batch if entry]
+        if items:
+            yield items
@@ -0,0 +1,40 @@
+"""
+プロセスプールの子プロセス側で実行される抽出処理
+
+このモジュールの関数はpickleで子プロセスに渡されるため、
+モジュールのトップレベルに定義し、戻り値は素のdictに限る。
+"""
+
+import logging
+from typing import Dict, Optional
+
+from .pool import YTDLPool
+
+
+_log = logging.getLogger("music")
+
+# 子プロセスごとのYoutubeDLインスタンスプール
+_pool: Optional[YTDLPool] = None
+
+
+def init_worker(profiles: Dict[str, Dict], max_uses: int, max_age: float):
+    """子プロセスの初期化（各プロファイルのインスタンスを事前に作成）"""
+    global _pool
+    # 子プロセスは1度に1件しか処理しないため、プロファイルごとに1インスタンスで十分
+    _pool = YTDLPool(profiles, max_size=1, max_uses=max_uses, max_age=max_age)
+    for profile in profiles:
+        _pool.release(profile, _pool.acquire(profile))
+
+
+def ping() -> bool:
+    """子プロセスを起動させるための空の処理"""
+    return _pool is not None
+
+
+def extract(profile: str, url: str) -> Optional[Dict]:
+    """情報を抽出し、プロセス間で受け渡せる形に変換して返す"""
+    with _pool.checkout(profile) as ytdl:
+        data = ytdl.extract_info(url, download=False)
+        if data is None:
+            return None
+        return ytdl.sanitize_info(data)
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import time
+
+from objects.alarm import Alarm, AlarmScheduler
+
+
+async def _noop(alarm):
+    pass
+
+
+def make_scheduler(path, events, **kwargs):
+    async def prepare(alarm):
+        events.append(("prepare", alarm.id))
+
+    async def fire(alarm):
+        events.append(("fire", alarm.id))
+
+    kwargs.setdefault("save_delay", 0.05)
+    return AlarmScheduler(path, prepare=prepare, fire=fire, **kwargs)
+
+
+def add(scheduler, delay, guild_id=1):
+    return scheduler.add(
+        guild_id=guild_id, channel_id=2, voice_channel_id=3, user_id=4,
+        url="https://youtu.be/abc", volume=0.5, delay=delay,
+    )
+
+
+def test_fires_in_due_order(tmp_path):
+    async def main():
+        events = []
+        scheduler = make_scheduler(tmp_path / "alarms.json", events, prepare_ahead=0)
+        scheduler.start()
+        late = add(scheduler, 0.2)
+        early = add(scheduler, 0.1)
+        await asyncio.sleep(0.4)
+        scheduler.stop()
+
+        assert [event for event in events if event[0] == "fire"] == [("fire", early.id), ("fire", late.id)]
+        assert scheduler.fired == 2
+        assert len(scheduler) == 0
+
+    asyncio.run(main())
+
+
+def test_prepares_before_firing(tmp_path):
+    async def main():
+        events = []
+        scheduler = make_scheduler(tmp_path / "alarms.json", events, prepare_ahead=0.1)
+        scheduler.start()
+        alarm = add(scheduler, 0.2)
+        await asyncio.sleep(0.15)
+        assert events == [("prepare", alarm.id)]
+        await asyncio.sleep(0.15)
+        scheduler.stop()
+
+        assert events == [("prepare", alarm.id), ("fire", alarm.id)]
+
+    asyncio.run(main())
+
+
+def test_cancelled_alarm_does_not_fire(tmp_path):
+    async def main():
+        events = []
+        scheduler = make_scheduler(tmp_path / "alarms.json", events, prepare_ahead=0)
+        scheduler.start()
+        kept = add(scheduler, 0.1, guild_id=1)
+        add(scheduler, 0.1, guild_id=2)
+        add(scheduler, 0.1, guild_id=2)
+        assert scheduler.cancel(2) == 2
+        await asyncio.sleep(0.3)
+        scheduler.stop()
+
+        assert [event for event in events if event[0] == "fire"] == [("fire", kept.id)]
+
+    asyncio.run(main())
+
+
+def test_for_guild_is_sorted_by_due(tmp_path):
+    async def main():
+        scheduler = make_scheduler(tmp_path / "alarms.json", [])
+        later = add(scheduler, 200)
+        sooner = add(scheduler, 100)
+        add(scheduler, 50, guild_id=9)
+        assert scheduler.for_guild(1) == [sooner, later]
+        scheduler.stop()
+
+    asyncio.run(main())
+
+
+def test_saves_are_debounced(tmp_path):
+    async def main():
+        path = tmp_path / "alarms.json"
+        scheduler = make_scheduler(path, [])
+        for _ in range(20):
+            add(scheduler, 100)
+        assert not path.exists()
+        await asyncio.sleep(0.15)
+        assert len(json.loads(path.read_text())["alarms"]) == 20
+
+        # 停止時には待たずに書き出す
+        scheduler.cancel(1)
+        scheduler.stop()
+        assert json.loads(path.read_text())["alarms"] == []
+
+    asyncio.run(main())
+
+
+def test_load_discards_missed_alarms(tmp_path):
+    path = tmp_path / "alarms.json"
+    now = time.time()
+    entries = [
+        Alarm(id=1, guild_id=1, channel_id=2, voice_channel_id=3, user_id=4,
+              url="u", volume=0.5, due=now - 1000).to_dict(),
+        Alarm(id=2, guild_id=1, channel_id=2, voice_channel_id=3, user_id=4,
+              url="u", volume=0.5, due=now - 10).to_dict(),
+        Alarm(id=3, guild_id=1, channel_id=2, voice_channel_id=3, user_id=4,
+              url="u", volume=0.5, due=now + 100).to_dict(),
+    ]
+    path.write_text(json.dumps({"next_id": 4, "alarms": entries}))
+
+    scheduler = AlarmScheduler(path, prepare=_noop, fire=_noop, missed_grace=300)
+    scheduler._load()
+
+    assert sorted(scheduler._alarms) == [2, 3]
+    assert scheduler.missed == 1
+    assert scheduler._next_id == 4
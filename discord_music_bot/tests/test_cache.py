@@ -0,0 +1,104 @@
+import pytest
+
+import source.cache
+from source.cache import MetadataCache
+
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(source.cache.time, "monotonic", clock)
+    return clock
+
+
+def make_data(video_id: str = "dQw4w9WgXcQ", **extra):
+    data = {
+        "id": video_id,
+        "title": f"title {video_id}",
+        "extractor_key": "Youtube",
+        "duration": 212,
+        "url": "https://example.com/stream",
+        "format_id": "251",
+        "acodec": "opus",
+    }
+    data.update(extra)
+    return data
+
+
+def test_hit_returns_metadata_and_stream(clock):
+    cache = MetadataCache()
+    cache.put(URL, make_data())
+    data = cache.get(URL, need_stream=True)
+    assert data["title"] == "title dQw4w9WgXcQ"
+    assert data["url"] == "https://example.com/stream"
+    assert cache.hits == 1 and cache.stream_hits == 1
+
+
+def test_stream_expires_before_metadata(clock):
+    cache = MetadataCache(meta_ttl=100, stream_ttl=10)
+    cache.put(URL, make_data())
+    clock.now += 11
+
+    assert cache.get(URL, need_stream=True) is None
+    data = cache.get(URL)
+    assert data["title"] == "title dQw4w9WgXcQ"
+    assert "url" not in data
+
+
+def test_metadata_expires(clock):
+    cache = MetadataCache(meta_ttl=100, stream_ttl=10)
+    cache.put(URL, make_data())
+    clock.now += 101
+    assert cache.get(URL) is None
+    assert cache.misses == 1
+
+
+def test_flat_result_has_no_stream(clock):
+    cache = MetadataCache()
+    cache.put(URL, make_data(format_id=None))
+    assert cache.get(URL, need_stream=True) is None
+    assert cache.get(URL) is not None
+
+
+def test_alias_for_non_youtube_url(clock):
+    cache = MetadataCache()
+    url = "https://soundcloud.com/artist/track"
+    cache.put(url, make_data("12345", extractor_key="Soundcloud", webpage_url=url))
+    assert cache.get(url)["id"] == "12345"
+
+
+def test_evicts_least_recently_used(clock):
+    cache = MetadataCache()
+    urls = [f"https://youtu.be/video{i:06d}" for i in range(3)]
+    for url in urls:
+        cache.put(url, make_data(url.rsplit("/", 1)[1]))
+
+    # 最初の曲を使い、2番目の曲を最も古くする
+    cache.get(urls[0])
+    cache.max_bytes = cache.bytes - 1
+    cache._evict()
+
+    assert cache.evictions == 1
+    assert cache.get(urls[1]) is None
+    assert cache.get(urls[0]) is not None
+    assert cache.get(urls[2]) is not None
+
+
+def test_replacing_entry_keeps_byte_count(clock):
+    cache = MetadataCache()
+    cache.put(URL, make_data())
+    size = cache.bytes
+    cache.put(URL, make_data())
+    assert cache.bytes == size
+    assert len(cache._entries) == 1
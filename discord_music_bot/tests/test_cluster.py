@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.cluster import IdentifyGate, split_shards
+
+
+@pytest.mark.parametrize(
+    "shard_count, processes, expected",
+    [
+        (4, 2, [[0, 1], [2, 3]]),
+        (5, 2, [[0, 1, 2], [3, 4]]),
+        (3, 1, [[0, 1, 2]]),
+        (2, 4, [[0], [1]]),
+    ],
+)
+def test_split_shards(shard_count, processes, expected):
+    assert split_shards(shard_count, processes) == expected
+
+
+def test_split_shards_covers_every_shard():
+    ranges = split_shards(97, 8)
+    assert [shard for shards in ranges for shard in shards] == list(range(97))
+    assert max(map(len, ranges)) - min(map(len, ranges)) <= 1
+
+
+def test_identify_gate_spaces_same_bucket():
+    async def main():
+        gate = IdentifyGate(max_concurrency=1, interval=0.1)
+        granted = []
+
+        async def identify(shard_id):
+            await gate.acquire(shard_id)
+            granted.append(time.monotonic())
+
+        await asyncio.gather(*(identify(shard_id) for shard_id in range(3)))
+        gaps = [b - a for a, b in zip(granted, granted[1:])]
+        assert all(gap >= 0.09 for gap in gaps)
+        assert gate.granted == 3
+
+    asyncio.run(main())
+
+
+def test_identify_gate_buckets_run_concurrently():
+    async def main():
+        gate = IdentifyGate(max_concurrency=2, interval=0.2)
+        start = time.monotonic()
+        # シャード0と1は別のバケットなので待たない
+        await asyncio.gather(gate.acquire(0), gate.acquire(1))
+        assert time.monotonic() - start < 0.1
+        await gate.acquire(2)
+        assert time.monotonic() - start >= 0.19
+
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+import asyncio
+
+from objects.commands import CommandQueue
+
+
+def recorder(calls, name):
+    async def run(interaction, count):
+        calls.append((name, interaction, count))
+    return run
+
+
+def test_coalesces_repeated_clicks():
+    async def main():
+        queue = CommandQueue(window=0.1)
+        calls = []
+        for interaction in ("i1", "i2", "i3"):
+            queue.submit("forward", recorder(calls, "forward"), interaction, coalesce=True)
+        await asyncio.sleep(0.2)
+
+        # 最後のインタラクションに、まとめたクリック数を渡す
+        assert calls == [("forward", "i3", 3)]
+        assert queue.coalesced == 2 and queue.executed == 1
+
+    asyncio.run(main())
+
+
+def test_runs_commands_in_order():
+    async def main():
+        queue = CommandQueue(window=0.05)
+        calls = []
+        queue.submit("pause", recorder(calls, "pause"), "a")
+        queue.submit("volume_up", recorder(calls, "volume_up"), "b", coalesce=True)
+        queue.submit("volume_up", recorder(calls, "volume_up"), "c", coalesce=True)
+        queue.submit("resume", recorder(calls, "resume"), "d")
+        await asyncio.sleep(0.2)
+
+        assert calls == [("pause", "a", 1), ("volume_up", "c", 2), ("resume", "d", 1)]
+
+    asyncio.run(main())
+
+
+def test_does_not_coalesce_different_commands():
+    async def main():
+        queue = CommandQueue(window=0.05)
+        calls = []
+        queue.submit("forward", recorder(calls, "forward"), "a", coalesce=True)
+        queue.submit("reverse", recorder(calls, "reverse"), "b", coalesce=True)
+        queue.submit("forward", recorder(calls, "forward"), "c", coalesce=True)
+        await asyncio.sleep(0.3)
+
+        assert [name for name, _, _ in calls] == ["forward", "reverse", "forward"]
+
+    asyncio.run(main())
+
+
+def test_cancel_drops_pending_commands():
+    async def main():
+        queue = CommandQueue(window=0.1)
+        calls = []
+        queue.submit("next", recorder(calls, "next"), "a", coalesce=True)
+        assert len(queue) == 1
+        queue.cancel()
+        await asyncio.sleep(0.2)
+
+        assert calls == []
+        assert len(queue) == 0
+
+    asyncio.run(main())
+
+
+def test_failed_command_does_not_stop_queue():
+    async def main():
+        queue = CommandQueue(window=0)
+        calls = []
+
+        async def fail(interaction, count):
+            raise RuntimeError("boom")
+
+        class Interaction:
+            class followup:
+                @staticmethod
+                async def send(*args, **kwargs):
+                    calls.append("error reported")
+
+        queue.submit("bad", fail, Interaction())
+        queue.submit("good", recorder(calls, "good"), "b")
+        await asyncio.sleep(0.1)
+
+        assert calls == ["error reported", ("good", "b", 1)]
+
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+import pytest
+
+from source.executor import ExecutorSaturated, ExtractionExecutor, Priority
+
+
+def test_runs_jobs_and_returns_results():
+    async def main():
+        executor = ExtractionExecutor(workers=2)
+        results = await asyncio.gather(*(executor.submit(pow, i, 2) for i in range(5)))
+        assert results == [0, 1, 4, 9, 16]
+        assert executor.stats()["completed"] == 5
+
+    asyncio.run(main())
+
+
+def test_exceptions_are_propagated():
+    async def main():
+        executor = ExtractionExecutor(workers=1)
+        with pytest.raises(ZeroDivisionError):
+            await executor.submit(divmod, 1, 0)
+
+    asyncio.run(main())
+
+
+def test_higher_priority_runs_first():
+    async def main():
+        executor = ExtractionExecutor(workers=1)
+        gate = threading.Event()
+        order = []
+
+        # 1つしかないワーカーを塞いでから、優先度の異なる処理を積む
+        blocker = asyncio.ensure_future(executor.submit(gate.wait, 5))
+        await asyncio.sleep(0.05)
+        jobs = [
+            asyncio.ensure_future(executor.submit(order.append, name, priority=priority))
+            for name, priority in (
+                ("background", Priority.BACKGROUND),
+                ("prefetch", Priority.PREFETCH),
+                ("play", Priority.PLAY),
+                ("search", Priority.SEARCH),
+            )
+        ]
+        await asyncio.sleep(0.05)
+        gate.set()
+        await asyncio.gather(blocker, *jobs)
+        assert order == ["play", "search", "prefetch", "background"]
+
+    asyncio.run(main())
+
+
+def test_rejects_when_queue_is_full():
+    async def main():
+        executor = ExtractionExecutor(workers=1, max_queue=2)
+        gate = threading.Event()
+        # 実行中の1件に加えて、待機中の2件で上限に達する
+        jobs = [asyncio.ensure_future(executor.submit(gate.wait, 5))]
+        await asyncio.sleep(0.05)
+        jobs += [asyncio.ensure_future(executor.submit(gate.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+
+        try:
+            with pytest.raises(ExecutorSaturated):
+                await executor.submit(gate.wait, 5)
+            assert executor.stats()["rejected"] == 1
+        finally:
+            gate.set()
+        await asyncio.gather(*jobs)
+        # 空きができれば再び受け付ける
+        assert await executor.submit(len, "abc") == 3
+
+    asyncio.run(main())
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        ExtractionExecutor(backend="fiber")
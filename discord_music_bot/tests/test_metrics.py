@@ -0,0 +1,57 @@
+from utils.metrics import MetricsWriter
+from utils.stats import LatencyStats
+
+
+def test_gauge_and_counter():
+    metrics = MetricsWriter()
+    metrics.gauge("voice_clients", 3, "接続数")
+    metrics.counter("edits", 5, "編集", {"result": "sent"})
+    metrics.counter("edits", 1, "編集", {"result": "failed"})
+
+    assert metrics.render().splitlines() == [
+        "# HELP music_voice_clients 接続数",
+        "# TYPE music_voice_clients gauge",
+        "music_voice_clients 3",
+        "# HELP music_edits_total 編集",
+        "# TYPE music_edits_total counter",
+        'music_edits_total{result="sent"} 5',
+        'music_edits_total{result="failed"} 1',
+    ]
+
+
+def test_value_formatting():
+    metrics = MetricsWriter(prefix="t")
+    metrics.gauge("flag", True)
+    metrics.gauge("ratio", 0.5)
+    metrics.gauge("nan", float("nan"))
+    metrics.gauge("inf", float("inf"))
+    lines = metrics.render().splitlines()
+
+    assert "t_flag 1" in lines
+    assert "t_ratio 0.5" in lines
+    assert "t_nan NaN" in lines
+    assert "t_inf +Inf" in lines
+
+
+def test_label_values_are_escaped():
+    metrics = MetricsWriter(prefix="t")
+    metrics.gauge("x", 1, labels={"name": 'a"b\\c\nd'})
+    assert metrics.render().splitlines()[-1] == 't_x{name="a\\"b\\\\c\\nd"} 1'
+
+
+def test_histogram():
+    stats = LatencyStats((0.1, 1.0))
+    for value in (0.05, 0.5, 2.0):
+        stats.observe(value)
+    metrics = MetricsWriter(prefix="t")
+    metrics.histogram("latency_seconds", stats, labels={"site": "yt"})
+    lines = metrics.render().splitlines()
+
+    assert lines[0] == "# TYPE t_latency_seconds histogram"
+    assert lines[1:] == [
+        't_latency_seconds_bucket{site="yt",le="0.1"} 1',
+        't_latency_seconds_bucket{site="yt",le="1.0"} 2',
+        't_latency_seconds_bucket{site="yt",le="+Inf"} 3',
+        't_latency_seconds_sum{site="yt"} 2.55',
+        't_latency_seconds_count{site="yt"} 3',
+    ]
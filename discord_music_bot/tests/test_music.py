@@ -0,0 +1,13 @@
+from cogs.music import parse_timeout_overrides
+
+
+def test_parses_overrides():
+    assert parse_timeout_overrides("123:60:300, 456:0:900") == {
+        123: (60.0, 300.0),
+        456: (0.0, 900.0),
+    }
+
+
+def test_ignores_empty_and_malformed_entries():
+    assert parse_timeout_overrides("") == {}
+    assert parse_timeout_overrides("123:60,abc:1:2,789:30:30") == {789: (30.0, 30.0)}
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from source.pool import YTDLPool
+
+
+PROFILES = {"default": {"quiet": True}, "flat": {"quiet": True, "extract_flat": True}}
+
+
+def test_reuses_released_instance():
+    pool = YTDLPool(PROFILES)
+    with pool.checkout("default") as first:
+        pass
+    with pool.checkout("default") as second:
+        pass
+    assert first is second
+    assert pool.stats()["created"] == 1
+
+
+def test_profiles_do_not_share_instances():
+    pool = YTDLPool(PROFILES)
+    with pool.checkout("default") as default, pool.checkout("flat") as flat:
+        assert default is not flat
+        assert flat.params.get("extract_flat")
+
+
+def test_unknown_profile():
+    pool = YTDLPool(PROFILES)
+    with pytest.raises(KeyError):
+        pool.acquire("missing")
+
+
+def test_recycles_after_max_uses():
+    pool = YTDLPool(PROFILES, max_uses=2)
+    seen = []
+    for _ in range(3):
+        with pool.checkout("default") as ytdl:
+            seen.append(ytdl)
+    assert seen[0] is seen[1]
+    assert seen[2] is not seen[0]
+    assert pool.stats()["recycled"] == 1
+
+
+def test_recycles_after_max_age():
+    pool = YTDLPool(PROFILES, max_age=0.0)
+    with pool.checkout("default") as first:
+        pass
+    with pool.checkout("default") as second:
+        pass
+    assert first is not second
+    assert pool.stats()["total"] == 0
+
+
+def test_acquire_waits_when_pool_is_full():
+    pool = YTDLPool(PROFILES, max_size=1)
+    held = pool.acquire("default")
+    acquired = threading.Event()
+
+    def borrow():
+        pooled = pool.acquire("default")
+        acquired.set()
+        pool.release("default", pooled)
+
+    thread = threading.Thread(target=borrow)
+    thread.start()
+    time.sleep(0.1)
+    assert not acquired.is_set()
+
+    pool.release("default", held)
+    thread.join(timeout=5)
+    assert acquired.is_set()
+    assert pool.stats()["created"] == 1
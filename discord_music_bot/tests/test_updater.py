@@ -0,0 +1,99 @@
+import asyncio
+import itertools
+import types
+
+import discord
+
+from utils.updater import MessageUpdater
+
+
+_ids = itertools.count(1)
+
+
+class FakeMessage:
+    def __init__(self, channel_id: int = 1):
+        self.id = next(_ids)
+        self.channel = types.SimpleNamespace(id=channel_id)
+        self.edits = []
+
+    async def edit(self, *, embed=None, view=None):
+        self.edits.append(embed)
+
+
+def embed(title: str) -> discord.Embed:
+    return discord.Embed(title=title)
+
+
+def test_fingerprint_compares_content():
+    assert MessageUpdater.fingerprint(embed("a"), None) == MessageUpdater.fingerprint(embed("a"), None)
+    assert MessageUpdater.fingerprint(embed("a"), None) != MessageUpdater.fingerprint(embed("b"), None)
+
+
+def test_pending_edits_are_coalesced():
+    async def main():
+        updater = MessageUpdater(rate=100, channel_interval=0)
+        message = FakeMessage()
+        for title in ("1", "2", "3"):
+            updater.submit(message, embed(title))
+        await asyncio.sleep(0.05)
+        updater.stop()
+
+        assert [e.title for e in message.edits] == ["3"]
+        assert updater.coalesced == 2
+        assert updater.sent == 1
+
+    asyncio.run(main())
+
+
+def test_unchanged_content_is_skipped():
+    async def main():
+        updater = MessageUpdater(rate=100, channel_interval=0)
+        message = FakeMessage()
+        updater.submit(message, embed("same"))
+        await asyncio.sleep(0.05)
+        updater.submit(message, embed("same"))
+        await asyncio.sleep(0.05)
+        updater.stop()
+
+        assert len(message.edits) == 1
+        assert updater.skipped == 1
+
+    asyncio.run(main())
+
+
+def test_channel_interval_is_respected():
+    async def main():
+        updater = MessageUpdater(rate=100, channel_interval=0.3)
+        first, second = FakeMessage(channel_id=7), FakeMessage(channel_id=7)
+        updater.submit(first, embed("a"))
+        updater.submit(second, embed("b"))
+        await asyncio.sleep(0.1)
+        assert len(first.edits) + len(second.edits) == 1
+        await asyncio.sleep(0.4)
+        updater.stop()
+        assert len(first.edits) + len(second.edits) == 2
+
+    asyncio.run(main())
+
+
+def test_edit_now_drops_pending_edit():
+    async def main():
+        updater = MessageUpdater(rate=100, channel_interval=0)
+        message = FakeMessage()
+        updater.submit(message, embed("progress"))
+        await updater.edit_now(message, embed("finished"))
+        await asyncio.sleep(0.05)
+        updater.stop()
+
+        assert [e.title for e in message.edits] == ["finished"]
+
+    asyncio.run(main())
+
+
+def test_refresh_interval_grows_with_tracked_messages():
+    updater = MessageUpdater(min_interval=5, max_interval=30, rate=2)
+    assert updater.refresh_interval == 5
+    updater._sent = {i: "" for i in range(20)}
+    assert updater.refresh_interval == 10
+    updater._sent = {i: "" for i in range(1000)}
+    assert updater.refresh_interval == 30
@@ -0,0 +1,431 @@
+"""
+クラスターモード
+
+スーパーバイザーがシャードを連続した範囲に分けて子プロセスを起動し、
+落ちた子プロセスの再起動・IDENTIFYの間隔の調整・統計の集約を行う。
+子プロセスとはUnixソケット上の1行ごとのJSONでやり取りする。
+
+    子 → スーパーバイザー:
+        {"op": "identify", "cluster": 0, "shard_id": 3}  （許可されるまで応答を待つ）
+        {"op": "stats", "cluster": 0, "stats": {...}}
+    スーパーバイザー → 子:
+        {"ok": true}  （identify への応答）
+
+METRICS_PORTが設定されている場合、スーパーバイザーがそのポートで全ての子プロセスの
+/healthz・/readyz をまとめて返し、子プロセスはMETRICS_PORT+1+クラスターIDで待ち受ける。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import discord
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+from discord.ext import commands
+
+from utils.shards import iter_shards
+
+
+_log = logging.getLogger("music")
+
+# Discordが許可するIDENTIFYの間隔（バケットごと）
+IDENTIFY_INTERVAL = 5.0
+
+# 子プロセスのヘルスチェックの応答を待つ秒数（Dockerのヘルスチェックのタイムアウトより短くする）
+HEALTH_PROBE_TIMEOUT = 3.0
+
+
+def split_shards(shard_count: int, processes: int) -> List[List[int]]:
+    """シャードをプロセス数の連続した範囲に分割（シャード数より多いプロセスは作らない）"""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def fetch_gateway(token: str) -> Tuple[int, int]:
+    """推奨シャード数と、同時にIDENTIFYできる数を取得"""
+    http = discord.http.HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(token)
+        shards, _, session_start_limit = await http.get_bot_gateway()
+        return shards, session_start_limit["max_concurrency"]
+    finally:
+        await http.close()
+
+
+class IdentifyGate:
+    """
+    全プロセスのIDENTIFYの間隔を管理
+    shard_id % max_concurrency が同じシャードは、5秒に1回ずつIDENTIFYさせる
+    """
+
+    def __init__(self, max_concurrency: int = 1, interval: float = IDENTIFY_INTERVAL):
+        self.max_concurrency: int = max(1, max_concurrency)
+        self.interval: float = interval
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._last: Dict[int, float] = {}
+        self.granted: int = 0
+
+    async def acquire(self, shard_id: int):
+        """IDENTIFYしてよくなるまで待つ"""
+        bucket = shard_id % self.max_concurrency
+        lock = self._locks.setdefault(bucket, asyncio.Lock())
+        async with lock:
+            delay = self._last.get(bucket, 0.0) + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._last[bucket] = time.monotonic()
+            self.granted += 1
+
+
+class ClusterWorker:
+    """
+    スーパーバイザーから見た子プロセス
+    """
+    __slots__ = (
+        "cluster_id",
+        "shard_ids",
+        "process",
+        "started_at",
+        "restarts",
+        "stats",
+        "last_report",
+    )
+
+    def __init__(self, cluster_id: int, shard_ids: List[int]):
+        self.cluster_id: int = cluster_id
+        self.shard_ids: List[int] = shard_ids
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.started_at: float = 0.0
+        self.restarts: int = 0  # 連続して再起動した回数（しばらく動き続けたら0に戻す）
+        self.stats: Dict[str, Any] = {}
+        self.last_report: float = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def __repr__(self) -> str:
+        return (
+            f"<ClusterWorker: {self.cluster_id}, "
+            f"shards: {self.shard_ids[0]}-{self.shard_ids[-1]}, alive={self.alive}>"
+        )
+
+
+class ClusterSupervisor:
+    """
+    シャードの範囲ごとに子プロセスを起動して見守るスーパーバイザー
+    """
+
+    def __init__(
+        self,
+        command: List[str],
+        shard_count: int,
+        processes: int,
+        socket_path: str,
+        *,
+        max_concurrency: int = 1,
+        child_env: Optional[Callable[[int], Dict[str, str]]] = None,
+        restart_delay: float = 5.0,
+        max_restart_delay: float = 300.0,
+        stable_after: float = 300.0,
+        report_interval: float = 60.0,
+        metrics_host: str = "127.0.0.1",
+        metrics_port: int = 0,
+        health_grace: float = 600.0,
+    ):
+        self.command: List[str] = command
+        self.shard_count: int = shard_count
+        self.socket_path: str = socket_path
+        self.child_env = child_env
+        self.restart_delay: float = restart_delay
+        self.max_restart_delay: float = max_restart_delay
+        self.stable_after: float = stable_after  # これより長く動いた子プロセスは連続の再起動に数えない
+        self.report_interval: float = report_interval
+        self.metrics_host: str = metrics_host
+        self.metrics_port: int = metrics_port  # 全ての子プロセスのヘルスチェックをまとめるポート（0で無効）
+        self.health_grace: float = health_grace  # 起動直後の子プロセスが待ち受けていなくても失敗としない秒数
+        self.gate: IdentifyGate = IdentifyGate(max_concurrency)
+        self.workers: List[ClusterWorker] = [
+            ClusterWorker(cluster_id, shard_ids)
+            for cluster_id, shard_ids in enumerate(split_shards(shard_count, processes))
+        ]
+        self.restarts: int = 0
+        self._stopping: Optional[asyncio.Event] = None
+
+    async def _spawn(self, worker: ClusterWorker):
+        """子プロセスを起動"""
+        env = os.environ.copy()
+        env.update({
+            "SHARD_COUNT": str(self.shard_count),
+            "SHARD_IDS": ",".join(str(shard_id) for shard_id in worker.shard_ids),
+            "CLUSTER_ID": str(worker.cluster_id),
+            "CLUSTER_SOCKET": self.socket_path,
+        })
+        if self.metrics_port > 0:
+            # 子プロセスはさらにクラスターIDの分だけずらして待ち受ける
+            env["METRICS_PORT"] = str(self.metrics_port + 1)
+        if self.child_env is not None:
+            env.update(self.child_env(worker.cluster_id))
+
+        worker.process = await asyncio.create_subprocess_exec(*self.command, env=env)
+        worker.started_at = time.monotonic()
+        worker.stats = {}
+        _log.info(
+            f"Started cluster {worker.cluster_id} (pid {worker.process.pid}) "
+            f"for shards {worker.shard_ids[0]}-{worker.shard_ids[-1]}"
+        )
+
+    async def _watch(self, worker: ClusterWorker):
+        """子プロセスが終了したら、間隔を空けて起動し直す"""
+        while not self._stopping.is_set():
+            code = await worker.process.wait()
+            if self._stopping.is_set():
+                return
+
+            if time.monotonic() - worker.started_at > self.stable_after:
+                worker.restarts = 0
+            delay = min(self.restart_delay * 2 ** worker.restarts, self.max_restart_delay)
+            worker.restarts += 1
+            self.restarts += 1
+            _log.error(
+                f"Cluster {worker.cluster_id} exited with {code}, restarting in {delay:.0f}s"
+            )
+            try:
+                await asyncio.wait_for(self._stopping.wait(), delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+            await self._spawn(worker)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """子プロセスからの要求を処理"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                op = message.get("op")
+                if op == "identify":
+                    await self.gate.acquire(int(message["shard_id"]))
+                    writer.write(b'{"ok": true}\n')
+                    await writer.drain()
+                elif op == "stats":
+                    cluster_id = int(message["cluster"])
+                    if 0 <= cluster_id < len(self.workers):
+                        worker = self.workers[cluster_id]
+                        worker.stats = message.get("stats", {})
+                        worker.last_report = time.monotonic()
+        except (OSError, ValueError, KeyError) as e:
+            _log.debug(f"Cluster connection closed: {e!r}")
+        finally:
+            writer.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """全ての子プロセスの統計を集約"""
+        now = time.monotonic()
+        workers = []
+        shards: Dict[str, Any] = {}
+        totals = {"guilds": 0, "voice_clients": 0, "playing": 0, "events_per_second": 0.0}
+        for worker in self.workers:
+            for key in totals:
+                totals[key] += worker.stats.get(key, 0)
+            shards.update(worker.stats.get("shards", {}))
+            workers.append({
+                "cluster": worker.cluster_id,
+                "pid": worker.process.pid if worker.alive else None,
+                "alive": worker.alive,
+                "shards": worker.shard_ids,
+                "restarts": worker.restarts,
+                "report_age": now - worker.last_report if worker.last_report else None,
+            })
+        return {
+            **totals,
+            "shard_count": self.shard_count,
+            "shards": shards,
+            "restarts": self.restarts,
+            "identifies": self.gate.granted,
+            "workers": workers,
+        }
+
+    async def _probe(
+        self, session: ClientSession, worker: ClusterWorker, path: str
+    ) -> Dict[str, Any]:
+        """子プロセスのヘルスチェックを呼ぶ"""
+        if not worker.alive:
+            # 落ちた子プロセスはスーパーバイザーが再起動するため、/healthz は失敗させない
+            return {"ok": path != "/readyz", "alive": False, "restarts": worker.restarts}
+
+        host = "127.0.0.1" if self.metrics_host in ("", "0.0.0.0", "::") else self.metrics_host
+        port = self.metrics_port + 1 + worker.cluster_id
+        try:
+            async with session.get(f"http://{host}:{port}{path}") as response:
+                return {"ok": response.status == 200, "alive": True, "status": response.status}
+        except (ClientError, asyncio.TimeoutError) as e:
+            starting = time.monotonic() - worker.started_at < self.health_grace
+            return {"ok": starting, "alive": True, "error": repr(e)}
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        """全ての子プロセスのヘルスチェックをまとめる（1つでも失敗していれば失敗）"""
+        async with ClientSession(timeout=ClientTimeout(total=HEALTH_PROBE_TIMEOUT)) as session:
+            results = await asyncio.gather(
+                *(self._probe(session, worker, request.path) for worker in self.workers)
+            )
+        ok = all(result["ok"] for result in results)
+        return web.json_response(
+            {
+                "status": "ok" if ok else "fail",
+                "clusters": {str(worker.cluster_id): result for worker, result in zip(self.workers, results)},
+            },
+            status=200 if ok else 503,
+        )
+
+    async def _start_health_server(self) -> Optional[web.AppRunner]:
+        """まとめたヘルスチェックを公開するHTTPサーバーを起動"""
+        if self.metrics_port <= 0:
+            return None
+        app = web.Application()
+        app.router.add_get("/healthz", self._handle_health)
+        app.router.add_get("/readyz", self._handle_health)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, self.metrics_host, self.metrics_port).start()
+        except OSError as e:
+            _log.error(f"Could not start cluster health server on {self.metrics_host}:{self.metrics_port}: {e}")
+            await runner.cleanup()
+            return None
+        _log.info(f"Cluster health server listening on {self.metrics_host}:{self.metrics_port}")
+        return runner
+
+    async def _report_loop(self):
+        """集約した統計を定期的にログに出す"""
+        while True:
+            await asyncio.sleep(self.report_interval)
+            stats = self.stats()
+            alive = sum(1 for worker in stats["workers"] if worker["alive"])
+            _log.info(
+                f"Cluster: {alive}/{len(self.workers)} processes, {stats['guilds']} guilds, "
+                f"{stats['voice_clients']} voice, {stats['events_per_second']:.1f} events/s, "
+                f"{stats['restarts']} restarts"
+            )
+
+    def stop(self):
+        """全ての子プロセスを止めて終了する"""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _terminate(self, worker: ClusterWorker):
+        """子プロセスを停止（応答しなければ強制終了）"""
+        if not worker.alive:
+            return
+        worker.process.terminate()
+        try:
+            await asyncio.wait_for(worker.process.wait(), 15.0)
+        except asyncio.TimeoutError:
+            worker.process.kill()
+            await worker.process.wait()
+
+    async def run(self):
+        """子プロセスを起動し、stop()が呼ばれるまで見守る"""
+        self._stopping = asyncio.Event()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        health = await self._start_health_server()
+        tasks: List[asyncio.Task] = []
+        try:
+            # IDENTIFYはゲートで調整するため、子プロセスはまとめて起動する
+            for worker in self.workers:
+                await self._spawn(worker)
+                tasks.append(asyncio.create_task(self._watch(worker)))
+            tasks.append(asyncio.create_task(self._report_loop()))
+            await self._stopping.wait()
+        finally:
+            self._stopping.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*(self._terminate(worker) for worker in self.workers))
+            if health is not None:
+                await health.cleanup()
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def __repr__(self) -> str:
+        return f"<ClusterSupervisor: {len(self.workers)} processes, {self.shard_count} shards>"
+
+
+class ClusterClient:
+    """
+    子プロセス側からスーパーバイザーへの接続
+    """
+
+    def __init__(self, path: str, cluster_id: int, report_interval: float = 15.0):
+        self.path: str = path
+        self.cluster_id: int = cluster_id
+        self.report_interval: float = report_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def identify(self, shard_id: int):
+        """スーパーバイザーの許可を待つ（接続できない場合は1回分の間隔だけ待つ）"""
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        except OSError as e:
+            _log.warning(f"Cluster supervisor unavailable, identifying after delay: {e}")
+            await asyncio.sleep(IDENTIFY_INTERVAL)
+            return
+        try:
+            message = {"op": "identify", "cluster": self.cluster_id, "shard_id": shard_id}
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+            await reader.readline()
+        finally:
+            writer.close()
+
+    @staticmethod
+    def collect(bot: commands.Bot) -> Dict[str, Any]:
+        """このプロセスの統計"""
+        ping = bot.get_cog("PingCog")
+        return {
+            "guilds": len(bot.guilds),
+            "voice_clients": len(bot.voice_clients),
+            "playing": sum(1 for vc in bot.voice_clients if vc.is_playing()),
+            "events_per_second": ping.event_rate.total() if ping else 0.0,
+            "shards": {
+                str(shard_id): latency for shard_id, _, latency in iter_shards(bot)
+            },
+        }
+
+    async def _report_loop(self, bot: commands.Bot):
+        """統計を定期的にスーパーバイザーへ送る（切断された場合は次回に接続し直す）"""
+        writer = None
+        while True:
+            await asyncio.sleep(self.report_interval)
+            message = {"op": "stats", "cluster": self.cluster_id, "stats": self.collect(bot)}
+            try:
+                if writer is None or writer.is_closing():
+                    _, writer = await asyncio.open_unix_connection(self.path)
+                writer.write(json.dumps(message).encode() + b"\n")
+                await writer.drain()
+            except OSError as e:
+                _log.debug(f"Could not report to cluster supervisor: {e}")
+                writer = None
+
+    def start(self, bot: commands.Bot):
+        """統計の送信を開始"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._report_loop(bot))
+
+    def __repr__(self) -> str:
+        return f"<ClusterClient: {self.cluster_id}, {self.path}>"
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from utils.stats import LatencyStats
+
+
+_log = logging.getLogger("music")
+
+# イベントループの遅れのヒストグラムの境界値（秒）
+LAG_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+# 記録するスタックの深さ
+STACK_LIMIT = 12
+
+
+class LoopMonitor:
+    """
+    イベントループの監視
+    一定間隔で眠り、予定より遅れて起きた時間を記録する
+    ループが閾値より長く止まっている間は、別スレッドのウォッチドッグが
+    実行中のタスクとスタックを取得し、ループが戻った時点でログに出す
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.25,
+        threshold: float = 0.25,
+        *,
+        enabled: bool = True,
+        history: int = 20,
+    ):
+        self.interval: float = interval
+        self.threshold: float = threshold  # これより長い停止を記録する
+        self.enabled: bool = enabled  # スタックの取得とログ出力（遅れの計測は常に行う）
+        self.stats: LatencyStats = LatencyStats(LAG_BUCKETS)  # 全ての遅れ
+        self.stalls: LatencyStats = LatencyStats(LAG_BUCKETS)  # 閾値を超えた停止
+        self.last: float = 0.0  # 直近の遅れ
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self._beat: float = time.monotonic()  # ループが最後に動いた時刻
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._sample: Optional[Dict[str, Any]] = None  # 現在の停止中に取得したスタック
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """計測とウォッチドッグを開始"""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """計測とウォッチドッグを停止"""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def set_enabled(self, enabled: bool):
+        """停止の検出を切り替える"""
+        self.enabled = enabled
+        with self._lock:
+            self._sample = None
+        _log.info(f"Event loop stall detection {'enabled' if enabled else 'disabled'}")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._beat = time.monotonic()
+            self.last = max(0.0, loop.time() - expected)
+            self.stats.observe(self.last)
+            if self.last >= self.threshold:
+                self._report(self.last)
+
+    def _watch(self):
+        """ループが止まっている間に、実行中のタスクとスタックを取得"""
+        poll = max(0.02, self.threshold / 4)
+        while not self._stopped.wait(poll):
+            if not self.enabled:
+                continue
+            blocked = time.monotonic() - self._beat
+            if blocked < self.interval + self.threshold:
+                continue
+            with self._lock:
+                # 1回の停止につき1度だけ取得する
+                if self._sample is None:
+                    self._sample = self._capture(blocked)
+
+    def _capture(self, blocked: float) -> Dict[str, Any]:
+        frame = sys._current_frames().get(self._loop_thread)
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        if task is not None:
+            coro = task.get_coro()
+            name = f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+        else:
+            # タスク外のコールバック（call_soon・スレッドからの通知など）
+            name = "callback"
+        return {
+            "task": name,
+            "blocked": blocked,
+            "stack": "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame else "",
+        }
+
+    def _report(self, lag: float):
+        """閾値を超えた停止を記録"""
+        self.stalls.observe(lag)
+        with self._lock:
+            sample, self._sample = self._sample, None
+        if not self.enabled:
+            return
+
+        task = sample["task"] if sample else "unknown"
+        stack = sample["stack"] if sample else ""
+        self.recent.append({"at": time.time(), "lag": lag, "task": task, "stack": stack})
+        if stack:
+            _log.warning(f"Event loop blocked for {lag * 1000:.0f}ms in {task}:\n{stack.rstrip()}")
+        else:
+            _log.warning(f"Event loop blocked for {lag * 1000:.0f}ms")
+
+    def status(self) -> Dict[str, Any]:
+        """現在の設定と最近の停止"""
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "last_lag": self.last,
+            "max_lag": self.stats.max,
+            "stalls": self.stalls.count,
+            "recent": list(self.recent),
+        }
+
+    def __repr__(self) -> str:
+        return (
+            f"<LoopMonitor: last={self.last * 1000:.1f}ms, stalls={self.stalls.count}, "
+            f"enabled={self.enabled}>"
+        )
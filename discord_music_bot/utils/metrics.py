@@ -0,0 +1,84 @@
+import math
+from typing import Dict, List, Optional, Set
+
+from utils.stats import LatencyStats
+
+
+# Prometheusのテキスト形式のContent-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    """値をPrometheusの表記に変換"""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels: Optional[Dict[str, object]]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        text = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{key}="{text}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class MetricsWriter:
+    """
+    Prometheusのテキスト形式で指標を書き出す
+    同じ名前の指標（ラベル違い）は続けて書き出すこと
+    """
+
+    def __init__(self, prefix: str = "music"):
+        self.prefix: str = prefix
+        self._lines: List[str] = []
+        self._declared: Set[str] = set()
+
+    def _declare(self, name: str, kind: str, help: str):
+        if name in self._declared:
+            return
+        self._declared.add(name)
+        if help:
+            self._lines.append(f"# HELP {name} {help}")
+        self._lines.append(f"# TYPE {name} {kind}")
+
+    def _sample(self, name: str, value: float, labels: Optional[Dict[str, object]] = None):
+        self._lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def gauge(self, name: str, value: float, help: str = "", labels: Optional[Dict[str, object]] = None):
+        """現在値"""
+        name = f"{self.prefix}_{name}"
+        self._declare(name, "gauge", help)
+        self._sample(name, value, labels)
+
+    def counter(self, name: str, value: float, help: str = "", labels: Optional[Dict[str, object]] = None):
+        """累計値（名前に_totalを付ける）"""
+        name = f"{self.prefix}_{name}_total"
+        self._declare(name, "counter", help)
+        self._sample(name, value, labels)
+
+    def histogram(self, name: str, stats: LatencyStats, help: str = "", labels: Optional[Dict[str, object]] = None):
+        """LatencyStatsをヒストグラムとして書き出す"""
+        name = f"{self.prefix}_{name}"
+        self._declare(name, "histogram", help)
+        labels = labels or {}
+        cumulative = stats.cumulative()
+        for bound, count in cumulative:
+            self._sample(f"{name}_bucket", count, {**labels, "le": _format_value(float(bound))})
+        self._sample(f"{name}_sum", stats.total, labels)
+        self._sample(f"{name}_count", cumulative[-1][1], labels)
+
+    def render(self) -> str:
+        """書き出した内容"""
+        return "\n".join(self._lines) + "\n"
+
+    def __repr__(self) -> str:
+        return f"<MetricsWriter: {len(self._declared)} metrics>"
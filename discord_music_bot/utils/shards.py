@@ -0,0 +1,64 @@
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+from discord.ext import commands
+
+
+def iter_shards(bot: commands.Bot) -> List[Tuple[int, Optional[object], float]]:
+    """（シャードID, ゲートウェイのWebSocket, レイテンシ）の一覧"""
+    shards = getattr(bot, "shards", None)
+    if shards:
+        return [
+            (shard_id, getattr(getattr(info, "_parent", None), "ws", None), info.latency)
+            for shard_id, info in sorted(shards.items())
+        ]
+    return [(bot.shard_id or 0, bot.ws, bot.latency)]
+
+
+def format_latency(latency: float) -> str:
+    """レイテンシをミリ秒で表示（未接続の場合は-）"""
+    if latency is None or not math.isfinite(latency):
+        return "-"
+    return f"{latency * 1000:.0f}ms"
+
+
+class ShardEventRate:
+    """
+    シャードごとのイベント受信レート
+    ゲートウェイのシーケンス番号の増分から求めるため、イベントごとの処理は不要
+    """
+
+    def __init__(self):
+        self._last: Dict[int, Tuple[int, float]] = {}
+        self.rates: Dict[int, float] = {}
+
+    def sample(self, bot: commands.Bot):
+        """現在のシーケンス番号を記録し、前回からのレートを更新"""
+        now = time.monotonic()
+        for shard_id, ws, _ in iter_shards(bot):
+            sequence = getattr(ws, "sequence", None)
+            if sequence is None:
+                self._last.pop(shard_id, None)
+                self.rates[shard_id] = 0.0
+                continue
+
+            last = self._last.get(shard_id)
+            self._last[shard_id] = (sequence, now)
+            if last is None or now <= last[1]:
+                continue
+
+            # 再接続でセッションが変わるとシーケンス番号は0から数え直される
+            delta = sequence - last[0] if sequence >= last[0] else sequence
+            self.rates[shard_id] = delta / (now - last[1])
+
+    def rate(self, shard_id: int) -> float:
+        """1秒あたりのイベント数"""
+        return self.rates.get(shard_id, 0.0)
+
+    def total(self) -> float:
+        """全シャード合計の1秒あたりのイベント数"""
+        return sum(self.rates.values())
+
+    def __repr__(self) -> str:
+        return f"<ShardEventRate: {len(self.rates)} shards, {self.total():.1f} events/s>"
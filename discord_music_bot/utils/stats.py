@@ -0,0 +1,68 @@
+import bisect
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+
+# 秒単位のヒストグラムの境界値
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+class LatencyStats:
+    """
+    処理時間の統計（件数・合計・最大値・ヒストグラム）
+    音声送信スレッドなど複数のスレッドから記録される
+    """
+    __slots__ = (
+        "buckets",
+        "counts",
+        "count",
+        "total",
+        "max",
+        "_lock",
+    )
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """値を記録"""
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    @property
+    def average(self) -> float:
+        """平均値"""
+        return self.total / self.count if self.count else 0.0
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """境界値ごとの累積件数（最後はinf）"""
+        with self._lock:
+            result = []
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                running += count
+                result.append((bound, running))
+            return result
+
+    def summary(self) -> Dict[str, float]:
+        """概要"""
+        with self._lock:
+            return {
+                "count": self.count,
+                "avg": self.total / self.count if self.count else 0.0,
+                "max": self.max,
+            }
+
+    def __repr__(self) -> str:
+        return f"<LatencyStats: count={self.count}, avg={self.average:.3f}s>"
@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+import discord
+
+
+_log = logging.getLogger("music")
+
+
+class _Pending:
+    """送信待ちの編集内容"""
+    __slots__ = (
+        "message",
+        "embed",
+        "view",
+        "fingerprint",
+    )
+
+    def __init__(
+        self,
+        message: discord.Message,
+        embed: discord.Embed,
+        view: Optional[discord.ui.View],
+        fingerprint: str,
+    ):
+        self.message: discord.Message = message
+        self.embed: discord.Embed = embed
+        self.view: Optional[discord.ui.View] = view
+        self.fingerprint: str = fingerprint
+
+
+class MessageUpdater:
+    """
+    再生中メッセージの編集をまとめて送信するクラス
+    同じメッセージへの未送信の編集は最新のものだけを残し、
+    チャンネルごとの送信間隔と全体の送信レートを守って順に送信する
+    前回送信した内容と同じ場合は送信しない
+    """
+
+    def __init__(
+        self,
+        *,
+        min_interval: float = 5.0,
+        max_interval: float = 30.0,
+        rate: float = 2.0,
+        channel_interval: float = 1.0,
+    ):
+        self.min_interval: float = min_interval
+        self.max_interval: float = max_interval
+        self.rate: float = rate  # 全サーバー合計で1秒あたりに送信する編集の上限
+        self.channel_interval: float = channel_interval
+        self._pending: Dict[int, _Pending] = {}
+        self._sent: Dict[int, str] = {}
+        self._channel_ready: Dict[int, float] = {}
+        self._next_send: float = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.sent: int = 0
+        self.skipped: int = 0
+        self.coalesced: int = 0
+        self.failed: int = 0
+        self.rate_limited: int = 0
+
+    @staticmethod
+    def fingerprint(embed: Optional[discord.Embed], view: Optional[discord.ui.View]) -> str:
+        """埋め込みとビューの内容を比較用の文字列に変換"""
+        return json.dumps(
+            [
+                embed.to_dict() if embed else None,
+                view.to_components() if view else None,
+            ],
+            sort_keys=True,
+            default=str,
+        )
+
+    @property
+    def refresh_interval(self) -> float:
+        """更新対象の数から求めた、各メッセージを更新する間隔"""
+        tracked = max(len(self._sent), len(self._pending))
+        interval = tracked / self.rate if self.rate > 0 else self.max_interval
+        return min(max(self.min_interval, interval), self.max_interval)
+
+    def start(self):
+        """送信タスクを起動"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """送信タスクを停止"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._pending.clear()
+
+    def submit(
+        self,
+        message: discord.Message,
+        embed: discord.Embed,
+        view: Optional[discord.ui.View] = None,
+    ):
+        """編集を予約（同じメッセージの未送信の編集は置き換える）"""
+        fingerprint = self.fingerprint(embed, view)
+        if self._sent.get(message.id) == fingerprint:
+            self.skipped += 1
+            self._pending.pop(message.id, None)
+            return
+
+        if message.id in self._pending:
+            self.coalesced += 1
+        self._pending[message.id] = _Pending(message, embed, view, fingerprint)
+
+        self.start()
+        self._wakeup.set()
+
+    def invalidate(self, message_id: int):
+        """他の経路で編集されたメッセージの送信済み内容を破棄"""
+        self._sent.pop(message_id, None)
+
+    def forget(self, message_id: int):
+        """メッセージの追跡をやめる"""
+        self._pending.pop(message_id, None)
+        self._sent.pop(message_id, None)
+
+    async def edit_now(
+        self,
+        message: discord.Message,
+        embed: discord.Embed,
+        view: Optional[discord.ui.View] = None,
+    ):
+        """予約済みの編集を破棄して即座に編集し、追跡をやめる（再生終了時など）"""
+        self._pending.pop(message.id, None)
+        try:
+            if self.fingerprint(embed, view) != self._sent.get(message.id):
+                await message.edit(embed=embed, view=view)
+                self.sent += 1
+        except discord.HTTPException as e:
+            self.failed += 1
+            _log.debug(f"Failed to edit message {message.id}: {e}")
+        finally:
+            self._sent.pop(message.id, None)
+
+    def _next_ready(self) -> Tuple[Optional[int], float]:
+        """送信可能になるのが最も早い編集と、その時刻"""
+        best_id = None
+        best_at = float("inf")
+        for message_id, pending in self._pending.items():
+            ready_at = self._channel_ready.get(pending.message.channel.id, 0.0)
+            if ready_at < best_at:
+                best_id, best_at = message_id, ready_at
+        return best_id, max(best_at, self._next_send)
+
+    async def _run(self):
+        """予約された編集を順に送信"""
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            message_id, ready_at = self._next_ready()
+            delay = ready_at - time.monotonic()
+            if delay > 0:
+                # 待機中に新しい編集が届いた場合も、送信順を決め直す
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            pending = self._pending.pop(message_id)
+            await self._send(pending)
+
+    async def _send(self, pending: _Pending):
+        """編集を1件送信"""
+        message = pending.message
+        channel_id = message.channel.id
+        now = time.monotonic()
+        self._next_send = now + (1.0 / self.rate if self.rate > 0 else 0.0)
+        self._channel_ready[channel_id] = now + self.channel_interval
+
+        try:
+            await message.edit(embed=pending.embed, view=pending.view)
+        except discord.NotFound:
+            # メッセージが削除された場合は追跡をやめる
+            self.forget(message.id)
+            return
+        except discord.HTTPException as e:
+            self.failed += 1
+            if e.status == 429:
+                self.rate_limited += 1
+                retry_after = getattr(e, "retry_after", None) or self.min_interval
+                self._channel_ready[channel_id] = time.monotonic() + retry_after
+            _log.debug(f"Failed to edit message {message.id}: {e}")
+            return
+
+        self.sent += 1
+        self._sent[message.id] = pending.fingerprint
+
+        # 古いチャンネルの送信間隔の記録を片付ける
+        if len(self._channel_ready) > 1000:
+            now = time.monotonic()
+            self._channel_ready = {
+                key: value for key, value in self._channel_ready.items() if value > now
+            }
+
+    def stats(self) -> Dict[str, float]:
+        """統計情報"""
+        return {
+            "tracked": len(self._sent),
+            "pending": len(self._pending),
+            "interval": self.refresh_interval,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+        }
+
+    def __repr__(self) -> str:
+        return (
+            f"<MessageUpdater: {len(self._pending)} pending, "
+            f"interval: {self.refresh_interval:.1f}s>"
+        )